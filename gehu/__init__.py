@@ -1,54 +1,116 @@
-import argparse
+import sys
 
-import subprocess
-
-import google.generativeai as genai
+import time
 
 import os
 
-from dotenv import load_dotenv
-
-import shutil
+from contextlib import nullcontext
 
 from enum import Enum, auto
 
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Iterable, Iterator, TextIO, Tuple, Union
 
 import re
 
-# Load environment variables from .env file
+import mmap
 
-load_dotenv(encoding='utf-8')
+from array import array
 
-# Configure Gemini API
+from bisect import bisect_right
 
-api_key = os.getenv('GOOGLE_API_KEY')
+if TYPE_CHECKING:
 
-if not api_key:
+  # Only main() imports it, see there
 
-  try:
+  import argparse
+
+# The Gemini model, set up by get_model() when a command first needs it, so
+
+# that analysis and --help never import the SDK or read .env
+
+_model = None
+
+def load_api_key() -> Optional[str]:
+
+  from dotenv import load_dotenv
+
+  # Load environment variables from .env file
+
+  load_dotenv(encoding='utf-8')
+
+  api_key = os.getenv('GOOGLE_API_KEY')
+
+  if not api_key:
+
+    try:
+
+      with open('.env', 'r') as f:
+
+        content = f.read().strip()
+
+        if 'GOOGLE_API_KEY=' in content:
+
+          api_key = content.split('GOOGLE_API_KEY=')[1].strip()
+
+    except Exception:
+
+      pass
+
+  return api_key
+
+def get_model():
+
+  global _model
+
+  if _model is None and 'GEHU_FAKE_MODEL' in os.environ:
+
+    from gehu.fakemodel import FakeModel
+
+    try:
+
+      _model = FakeModel.from_spec(os.environ['GEHU_FAKE_MODEL'])
+
+    except (TypeError, ValueError) as e:
+
+      print(f"Error: invalid GEHU_FAKE_MODEL: {e}")
+
+      sys.exit(1)
+
+  if _model is None:
+
+    with profile_phase('import google.generativeai'):
+
+      import google.generativeai as genai
 
-    with open('.env', 'r') as f:
+    with profile_phase('load .env'):
 
-      content = f.read().strip()
+      api_key = load_api_key()
 
-      if 'GOOGLE_API_KEY=' in content:
+    if not api_key:
 
-        api_key = content.split('GOOGLE_API_KEY=')[1].strip()
+      print("Error: GOOGLE_API_KEY not found. Please set it in your .env file or environment variables.")
 
-  except Exception:
+      sys.exit(1)
 
-    pass
+    # Configure Gemini API
 
-if not api_key:
+    with profile_phase('configure model'):
 
-  print("Error: GOOGLE_API_KEY not found. Please set it in your .env file or environment variables.")
+      genai.configure(api_key=api_key)
 
-  exit(1)
+      _model = genai.GenerativeModel('gemini-1.5-flash')
 
-genai.configure(api_key=api_key)
+  return _model
 
-model = genai.GenerativeModel('gemini-1.5-flash')
+def __getattr__(name: str):
+
+  # gehu.model, as it was when the model was set up on import
+
+  if name == 'model':
+
+    return get_model()
+
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Compiler Components
 
@@ -114,581 +176,2437 @@ class TokenType(Enum):
 
   EOF = auto()
 
+  ERROR = auto() # An invalid character, skipped by a recovering lexer
+
 class Token:
 
-  def __init__(self, type: TokenType, value: str, line: int, column: int):
+  # Tokens record only where they start; line and column are looked up in
+
+  # line_index when asked for
+
+  __slots__ = ('type', 'value', 'offset', 'line_index')
+
+  def __init__(self, type: TokenType, value: str, offset: int, line_index: 'LineIndex'):
 
     self.type = type
 
     self.value = value
 
-    self.line = line
+    self.offset = offset
 
-    self.column = column
+    self.line_index = line_index
 
-  def __str__(self):
+  @property
 
-    return f"Token({self.type}, '{self.value}', line={self.line}, col={self.column})"
+  def line(self) -> int:
 
-class Lexer:
+    return self.line_index.line(self.offset)
 
-  def __init__(self, source: str):
+  @property
 
-    self.source = source
+  def column(self) -> int:
 
-    self.position = 0
+    return self.line_index.column(self.offset)
 
-    self.line = 1
+  @property
 
-    self.column = 1
+  def text(self) -> str:
 
-    self.current_char = self.source[0] if source else None
+    # Values lexed from bytes are memoryview slices, decoded here on demand
 
-    # Keywords mapping
+    if isinstance(self.value, str):
 
-    self.keywords = {
+      return self.value
 
-      'if': TokenType.IF,
+    return str(self.value, 'ascii')
 
-      'else': TokenType.ELSE,
+  def __str__(self):
 
-      'while': TokenType.WHILE,
+    return f"Token({self.type}, '{self.text}', line={self.line}, col={self.column})"
 
-      'for': TokenType.FOR,
+_NEWLINE = re.compile('\n')
 
-      'function': TokenType.FUNCTION,
+_BYTES_NEWLINE = re.compile(b'\n')
 
-      'return': TokenType.RETURN,
+class LineIndex:
 
-      'var': TokenType.VAR,
+  # Offsets at which lines start, found once with a regex scan instead of
 
-      'const': TokenType.CONST
+  # counting characters while lexing. Line and column (both from 1) of any
 
-    }
+  # offset come from a binary search.
 
-  def advance(self):
+  # An index made by since() only covers the offsets from starts[0] on, the
 
-    self.position += 1
+  # first lines_before lines left out.
 
-    self.column += 1
+  def __init__(self, text: Union[str, bytes] = ''):
 
-    if self.position >= len(self.source):
+    self.starts = array('q', (0,))
 
-      self.current_char = None
+    self.lines_before = 0
 
-    else:
+    if text:
 
-      self.current_char = self.source[self.position]
+      self.add(text)
 
-      if self.current_char == '\n':
+  def add(self, text: Union[str, bytes], base: int = 0):
 
-        self.line += 1
+    # Records the newlines of text, which begins at offset base
 
-        self.column = 0
+    newline = _NEWLINE if isinstance(text, str) else _BYTES_NEWLINE
 
-  def skip_whitespace(self):
+    self.starts.extend(map((base + 1).__add__, map(re.Match.start, newline.finditer(text))))
 
-    while self.current_char and self.current_char.isspace():
+  def line(self, offset: int) -> int:
 
-      self.advance()
+    return self.lines_before + bisect_right(self.starts, offset)
 
-  def skip_comment(self):
+  def column(self, offset: int) -> int:
 
-    while self.current_char and self.current_char != '\n':
+    return offset - self.starts[bisect_right(self.starts, offset) - 1] + 1
 
-      self.advance()
+  def position(self, offset: int) -> Tuple[int, int]:
 
-  def identifier(self) -> Token:
+    index = bisect_right(self.starts, offset)
 
-    result = ''
+    return self.lines_before + index, offset - self.starts[index - 1] + 1
 
-    start_column = self.column
+  def since(self, offset: int) -> 'LineIndex':
 
-    while self.current_char and (self.current_char.isalnum() or self.current_char == '_'):
+    # A new index of the lines from offset's on, so that the lines before it
 
-      result += self.current_char
+    # can be freed along with this index
 
-      self.advance()
+    index = bisect_right(self.starts, offset) - 1
 
-    token_type = self.keywords.get(result, TokenType.IDENTIFIER)
+    window = LineIndex()
 
-    return Token(token_type, result, self.line, start_column)
+    window.starts = self.starts[index:]
 
-  def number(self) -> Token:
+    window.lines_before = self.lines_before + index
 
-    result = ''
+    return window
 
-    start_column = self.column
+# TokenType indexed by its value, to decode the codes stored in a TokenBuffer
 
-    while self.current_char and self.current_char.isdigit():
+_TOKEN_TYPES = (None,) + tuple(TokenType)
 
-      result += self.current_char
+_STRING_CODE = TokenType.STRING.value
 
-      self.advance()
+# Past any offset, for the line after the last
 
-    return Token(TokenType.NUMBER, result, self.line, start_column)
+_NO_LINE = 1 << 62
 
-  def string(self) -> Token:
+class TokenBuffer:
 
-    result = ''
+  # Columnar token storage: one array per field instead of one object per
 
-    start_column = self.column
+  # token. Values are sliced from the source only when asked for. starts
 
-    self.advance() # Skip opening quote
+  # holds where each value starts, which for a string is after its quote.
 
-    while self.current_char and self.current_char != '"':
+  def __init__(self, source: str, line_index: Optional[LineIndex] = None):
 
-      result += self.current_char
+    self.source = source
 
-      self.advance()
+    self.types = array('B')
 
-    self.advance() # Skip closing quote
+    self.starts = array('q')
 
-    return Token(TokenType.STRING, result, self.line, start_column)
+    self.lengths = array('I')
 
-  def get_next_token(self) -> Token:
+    self._line_index = line_index
 
-    while self.current_char:
+  @property
 
-      if self.current_char.isspace():
+  def line_index(self) -> LineIndex:
 
-        self.skip_whitespace()
+    # Built on first use, so lexing and analysis never pay for it
 
-        continue
+    if self._line_index is None:
 
-      if self.current_char == '#':
+      self._line_index = LineIndex(self.source)
 
-        self.skip_comment()
+    return self._line_index
 
-        continue
+  def append(self, type: TokenType, start: int, length: int):
 
-      if self.current_char.isalpha() or self.current_char == '_':
+    self.types.append(type.value)
 
-        return self.identifier()
+    self.starts.append(start)
 
-      if self.current_char.isdigit():
+    self.lengths.append(length)
 
-        return self.number()
+  def __len__(self):
 
-      if self.current_char == '"':
+    return len(self.types)
 
-        return self.string()
+  def type(self, index: int) -> TokenType:
 
-      # Handle operators and delimiters
+    return _TOKEN_TYPES[self.types[index]]
 
-      if self.current_char == '+':
+  def value(self, index: int) -> str:
 
-        self.advance()
+    start = self.starts[index]
 
-        return Token(TokenType.PLUS, '+', self.line, self.column - 1)
+    return self.source[start:start + self.lengths[index]]
 
-      if self.current_char == '-':
+  def text(self, index: int) -> str:
 
-        self.advance()
+    # value() as a str, also for tokens lexed from bytes
 
-        return Token(TokenType.MINUS, '-', self.line, self.column - 1)
+    value = self.value(index)
 
-      if self.current_char == '*':
+    return value if isinstance(value, str) else str(value, 'ascii')
 
-        self.advance()
+  def offset(self, index: int) -> int:
 
-        return Token(TokenType.MULTIPLY, '*', self.line, self.column - 1)
+    # Where token index starts in the source, counting a string's quote
 
-      if self.current_char == '/':
+    return self.starts[index] - (self.types[index] == _STRING_CODE)
 
-        self.advance()
+  def line(self, index: int) -> int:
 
-        return Token(TokenType.DIVIDE, '/', self.line, self.column - 1)
+    return self.line_index.line(self.starts[index])
 
-      if self.current_char == '=':
+  def __getitem__(self, index: int) -> Token:
 
-        self.advance()
+    if index < 0:
 
-        if self.current_char == '=':
+      index += len(self.types)
 
-          self.advance()
+    return Token(_TOKEN_TYPES[self.types[index]], self.value(index), self.offset(index), self.line_index)
 
-          return Token(TokenType.EQUALS, '==', self.line, self.column - 2)
+  def __iter__(self) -> Iterator[Token]:
 
-        return Token(TokenType.ASSIGN, '=', self.line, self.column - 1)
+    for index in range(len(self.types)):
 
-      if self.current_char == '!':
+      yield self[index]
 
-        self.advance()
+  def describe(self) -> Iterator[str]:
 
-        if self.current_char == '=':
+    # str() of each token, straight from the columns without building Tokens
 
-          self.advance()
+    names = [str(token_type) for token_type in _TOKEN_TYPES]
 
-          return Token(TokenType.NOT_EQUALS, '!=', self.line, self.column - 2)
+    source = self.source
 
-      if self.current_char == '(':
+    decode = not isinstance(source, str)
 
-        self.advance()
+    # Tokens come in source order, so lines are walked forward instead of
 
-        return Token(TokenType.LPAREN, '(', self.line, self.column - 1)
+    # searched for each token
 
-      if self.current_char == ')':
+    line_starts = self.line_index.starts
 
-        self.advance()
+    lines = len(line_starts)
 
-        return Token(TokenType.RPAREN, ')', self.line, self.column - 1)
+    line = 1
 
-      if self.current_char == '{':
+    line_start = 0
 
-        self.advance()
+    next_start = line_starts[1] if lines > 1 else _NO_LINE
 
-        return Token(TokenType.LBRACE, '{', self.line, self.column - 1)
+    for code, start, length in zip(self.types, self.starts, self.lengths):
 
-      if self.current_char == '}':
+      value = source[start:start + length]
 
-        self.advance()
+      if decode:
 
-        return Token(TokenType.RBRACE, '}', self.line, self.column - 1)
+        value = str(value, 'ascii')
 
-      if self.current_char == ';':
+      offset = start - (code == _STRING_CODE)
 
-        self.advance()
+      while offset >= next_start:
 
-        return Token(TokenType.SEMICOLON, ';', self.line, self.column - 1)
+        line_start = next_start
 
-      if self.current_char == ',':
+        line += 1
 
-        self.advance()
+        next_start = line_starts[line] if line < lines else _NO_LINE
 
-        return Token(TokenType.COMMA, ',', self.line, self.column - 1)
+      yield f"Token({names[code]}, '{value}', line={line}, col={offset - line_start + 1})"
 
-      raise Exception(f"Invalid character '{self.current_char}' at line {self.line}, column {self.column}")
+  def rows(self) -> Iterator[Tuple[int, str, int, int]]:
 
-    return Token(TokenType.EOF, '', self.line, self.column)
+    # (type code, text, line, column) of each token, walked like describe()
 
-  def tokenize(self) -> List[Token]:
+    source = self.source
 
-    tokens = []
+    decode = not isinstance(source, str)
 
-    while True:
+    line_starts = self.line_index.starts
 
-      token = self.get_next_token()
+    lines = len(line_starts)
 
-      tokens.append(token)
+    line = 1
 
-      if token.type == TokenType.EOF:
+    line_start = 0
 
-        break
+    next_start = line_starts[1] if lines > 1 else _NO_LINE
 
-    return tokens
+    for code, start, length in zip(self.types, self.starts, self.lengths):
 
-class SemanticAnalyzer:
+      value = source[start:start + length]
 
-  def __init__(self):
+      if decode:
 
-    self.symbol_table = {} # Store variable declarations
+        value = str(value, 'ascii')
 
-    self.errors = []
+      offset = start - (code == _STRING_CODE)
 
-  def analyze(self, tokens: List[Token]):
+      while offset >= next_start:
 
-    self.errors = []
+        line_start = next_start
 
-    self.symbol_table = {}
+        line += 1
 
-    i = 0
+        next_start = line_starts[line] if line < lines else _NO_LINE
 
-    while i < len(tokens):
+      yield code, value, line, offset - line_start + 1
 
-      token = tokens[i]
+  def nbytes(self) -> int:
 
-      # Check for variable declarations
+    # Memory held by the columns, excluding the shared source
 
-      if token.type in (TokenType.VAR, TokenType.CONST):
+    return sum(column.itemsize * len(column) for column in (self.types, self.starts, self.lengths))
 
-        if i + 2 >= len(tokens):
+# Master pattern for the regex lexer engine. One match skips whitespace
 
-          self.errors.append(f"Invalid variable declaration at line {token.line}")
+# (group 1) and then captures exactly one lexeme:
 
-          break
+#   2 word, 3/4 string body and closing quote, 5 operator or delimiter,
 
-        # Check for identifier
+#   6 delimiter after a stray '!', 7 comment, 8 anything else ('' at the end)
 
-        if tokens[i + 1].type != TokenType.IDENTIFIER:
+_TOKEN_PATTERN = re.compile(r'(\s*)(?:(\w+)|"([^"]*)("?)|(==|!=|[-+*/=(){};,])|!([(){};,])|(#[^\n]*)|(.?))')
 
-          self.errors.append(f"Expected identifier after {token.value} at line {token.line}")
+_DIGIT_RUN = re.compile(r'\d+')
 
-          break
+# ASCII-only twin of _TOKEN_PATTERN for lexing bytes. The whitespace class
 
-        var_name = tokens[i + 1].value
+# spells out everything str.isspace() accepts below 0x80.
 
-        # Check for assignment operator
+_BYTES_TOKEN_PATTERN = re.compile(rb'([ \t\n\r\f\v\x1c-\x1f]*)(?:(\w+)|"([^"]*)("?)|(==|!=|[-+*/=(){};,])|!([(){};,])|(#[^\n]*)|(.?))')
 
-        if tokens[i + 2].type != TokenType.ASSIGN:
+_BYTES_DIGIT_RUN = re.compile(rb'[0-9]+')
 
-          self.errors.append(f"Expected '=' after variable name at line {token.line}")
+_NON_ASCII = re.compile(rb'[\x80-\xff]')
 
-          break
+# Characters read per chunk when lexing from a file
 
-        # Check if variable is already declared
+CHUNK_SIZE = 1 << 16
 
-        if var_name in self.symbol_table:
+# Lines of streamed input whose starts iter_tokens() indexes together; see
 
-          self.errors.append(f"Variable '{var_name}' already declared at line {token.line}")
+# Lexer.iter_tokens
 
-        else:
+STREAM_INDEX_LINES = 1 << 16
 
-          self.symbol_table[var_name] = {
+_OPERATORS = {
 
-            'type': 'const' if token.type == TokenType.CONST else 'var',
+  '+': TokenType.PLUS,
 
-            'line': token.line
+  '-': TokenType.MINUS,
 
-          }
+  '*': TokenType.MULTIPLY,
 
-        i += 3
+  '/': TokenType.DIVIDE,
 
-      else:
+  '=': TokenType.ASSIGN,
 
-        i += 1
+  '==': TokenType.EQUALS,
 
-    return self.errors
+  '!=': TokenType.NOT_EQUALS,
 
-def analyze_code(code: str) -> Dict:
+  '(': TokenType.LPAREN,
 
-  # Lexical Analysis
+  ')': TokenType.RPAREN,
 
-  lexer = Lexer(code)
+  '{': TokenType.LBRACE,
 
-  try:
+  '}': TokenType.RBRACE,
 
-    tokens = lexer.tokenize()
+  ';': TokenType.SEMICOLON,
 
-  except Exception as e:
+  ',': TokenType.COMMA
 
-    return {
+}
 
-      'success': False,
+_BYTES_OPERATORS = {operator.encode('ascii'): token_type for operator, token_type in _OPERATORS.items()}
 
-      'error': str(e),
+class Lexer:
 
-      'tokens': [],
+  # 'regex' slices lexemes out of the source with _TOKEN_PATTERN,
 
-      'semantic_errors': []
+  # 'char' is the original character-at-a-time scanner, 'numpy' classifies
 
-    }
+  # ASCII input with array passes (see gehu.vectorized) and falls back to
 
-  # Semantic Analysis
+  # 'regex' without NumPy or for other input.
 
-  analyzer = SemanticAnalyzer()
+  # Neither counts lines: tokens carry offsets into the source, and
 
-  semantic_errors = analyzer.analyze(tokens)
+  # line_index turns those into lines and columns when they are shown.
 
-  return {
+  #
 
-    'success': len(semantic_errors) == 0,
+  # With max_errors 0 the first invalid character raises. Otherwise each one
 
-    'tokens': tokens,
+  # becomes an ERROR token and its message goes to errors, until max_errors
 
-    'semantic_errors': semantic_errors,
+  # of them end the tokens there.
 
-    'symbol_table': analyzer.symbol_table
+  ENGINES = ('regex', 'char', 'numpy')
 
-  }
+  def __init__(self, source: str, engine: str = 'regex', max_errors: int = 0):
 
-def execute_command(command):
+    if engine not in self.ENGINES:
 
-  try:
+      raise ValueError(f"Unknown lexer engine '{engine}'")
 
-    # For git commands, we need to handle them specially
+    self.source = source
 
-    if command.startswith('git'):
+    self.engine = engine
 
-      # Split the command into parts
+    self.max_errors = max_errors
 
-      parts = command.split()
+    self.errors = []
 
-      if parts[0] == 'git':
+    self.chunks = None # Set by from_chunks() to lex streamed input
 
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    self.data = None # Set by from_bytes() to lex ASCII bytes in place
 
-        if result.returncode == 0:
+    # The char engine hands the index to every token, so it is built up front
 
-          print(result.stdout)
+    self._line_index = LineIndex(source) if engine == 'char' else None
 
-          return True
+    self.position = 0
 
-        else:
+    self.current_char = self.source[0] if source else None
 
-          print(f"Error: {result.stderr}")
+    # Keywords mapping
 
-          return False
+    self.keywords = {
 
-    # For copy commands
+      'if': TokenType.IF,
 
-    elif command.startswith('xcopy') or command.startswith('copy'):
+      'else': TokenType.ELSE,
 
-      # Replace source_folder_path with actual current directory
+      'while': TokenType.WHILE,
 
-      current_dir = os.getcwd()
+      'for': TokenType.FOR,
 
-      command = command.replace('source_folder_path', current_dir)
+      'function': TokenType.FUNCTION,
 
-      # For copying to parent directory
+      'return': TokenType.RETURN,
 
-      if 'destination_folder_path' in command:
+      'var': TokenType.VAR,
 
-        parent_dir = os.path.dirname(current_dir)
+      'const': TokenType.CONST
 
-        command = command.replace('destination_folder_path', parent_dir)
+    }
 
-      result = subprocess.run(command, shell=True, capture_output=True, text=True)
+  @property
 
-      if result.returncode == 0:
+  def line_index(self) -> LineIndex:
 
-        print(result.stdout)
+    # Built from the whole source on first use. Streamed input starts with an
 
-        return True
+    # empty index that grows as chunks arrive.
 
-      else:
+    if self._line_index is None:
 
-        print(f"Error: {result.stderr}")
+      self._line_index = LineIndex(self.source if self.data is None else self.data)
 
-        return False
+    return self._line_index
 
-    # For other commands
+  @line_index.setter
 
-    else:
+  def line_index(self, line_index: LineIndex):
 
-      result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    self._line_index = line_index
 
-      if result.returncode == 0:
+  def error(self, char: Optional[str], offset: int) -> Exception:
 
-        print(result.stdout)
+    line, column = self.line_index.position(offset)
 
-        return True
+    return Exception(f"Invalid character '{char}' at line {line}, column {column}")
 
-      else:
+  def recover(self, char: Optional[str], offset: int) -> bool:
 
-        print(f"Error: {result.stderr}")
+    # Raises the error at offset, or when recovering records it and returns
 
-        return False
+    # whether lexing goes on. A '!' before an invalid character reports that
 
-  except Exception as e:
+    # character, which is then reported again by itself; that repeat is
 
-    print(f"Error executing command: {str(e)}")
+    # dropped.
 
-    return False
+    error = self.error(char, offset)
 
-def handle_command(args):
+    if not self.max_errors:
 
-  # Check if the command is for code analysis
+      raise error
 
-  if args.command.startswith('analyze:'):
+    message = str(error)
 
-    code = args.command[8:].strip() # Remove 'analyze:' prefix
+    if not self.errors or self.errors[-1] != message:
 
-    result = analyze_code(code)
+      self.errors.append(message)
 
-    print("\n=== Lexical Analysis Results ===")
+    return len(self.errors) < self.max_errors
 
-    if result['success']:
+  def advance(self):
 
-      print("Tokens found:")
+    self.position += 1
 
-      for token in result['tokens']:
+    if self.position >= len(self.source):
 
-        print(f" {token}")
+      self.current_char = None
 
     else:
 
-      print(f"Error during lexical analysis: {result['error']}")
+      self.current_char = self.source[self.position]
 
-    print("\n=== Semantic Analysis Results ===")
+  def skip_whitespace(self):
 
-    if result['semantic_errors']:
+    while self.current_char and self.current_char.isspace():
 
-      print("Semantic errors found:")
+      self.advance()
 
-      for error in result['semantic_errors']:
+  def skip_comment(self):
 
-        print(f" {error}")
+    while self.current_char and self.current_char != '\n':
 
-    else:
+      self.advance()
 
-      print("No semantic errors found.")
+  def identifier(self) -> Token:
 
-    print("\n=== Symbol Table ===")
+    result = ''
 
-    for var_name, info in result['symbol_table'].items():
+    start = self.position
 
-      print(f" {var_name}: {info['type']} (declared at line {info['line']})")
+    while self.current_char and (self.current_char.isalnum() or self.current_char == '_'):
 
-    return
+      result += self.current_char
 
-  # Add context about the current directory and environment
+      self.advance()
 
-  context = f"""Current directory: {os.getcwd()}
+    token_type = self.keywords.get(result, TokenType.IDENTIFIER)
 
-  Operating System: Windows
+    return Token(token_type, result, start, self._line_index)
 
-  Task: {args.command}
+  def number(self) -> Token:
 
-  Please provide a Windows command that will work in the current directory."""
+    result = ''
 
-  response = model.generate_content(
+    start = self.position
 
-    f"""You are a bot that gives back specific cmd commands required to complete the task mentioned.
+    while self.current_char and self.current_char.isdigit():
 
-    Please provide only the command itself, without any additional explanation.
+      result += self.current_char
 
-    If the solution requires multiple commands, provide them all in sequence.
+      self.advance()
 
-    Make sure to use proper Windows command syntax.
+    return Token(TokenType.NUMBER, result, start, self._line_index)
 
-    {context}"""
+  def string(self) -> Token:
 
-  )
+    result = ''
 
-  command = response.text.strip()
+    start = self.position
 
-  print(f"Generated command: {command}")
+    self.advance() # Skip opening quote
 
-  if args.run:
+    while self.current_char and self.current_char != '"':
 
-    print("\nExecuting command...")
+      result += self.current_char
 
-    if execute_command(command):
+      self.advance()
 
-      print("\nCommand executed successfully!")
+    self.advance() # Skip closing quote
 
-    else:
+    return Token(TokenType.STRING, result, start, self._line_index)
 
-      print("\nCommand execution failed!")
+  def operator(self, token_type: TokenType, value: str) -> Token:
 
-def handle_question(args):
+    start = self.position
+
+    for _ in value:
 
-  response = model.generate_content(
+      self.advance()
 
-    f"""You will be asked questions that will be displayed in a cmd terminal.
+    return Token(token_type, value, start, self._line_index)
 
-    Make your answers short and in plain text. Don't add ethical warnings or redundant information.
+  def get_next_token(self) -> Token:
 
-    Answer in the language the question is asked.
+    while self.current_char:
 
-    Question: {args.question}"""
+      if self.current_char.isspace():
 
-  )
+        self.skip_whitespace()
 
-  print(response.text)
+        continue
 
-def main():
+      if self.current_char == '#':
 
-  parser = argparse.ArgumentParser(description="gehu Command Line Interface")
+        self.skip_comment()
 
-  parser.add_argument('command', type=str, help='Command or question to process')
+        continue
 
-  parser.add_argument('--run', '-r', action='store_true', help='Execute the generated command')
+      if self.current_char.isalpha() or self.current_char == '_':
+
+        return self.identifier()
+
+      if self.current_char.isdigit():
+
+        return self.number()
+
+      if self.current_char == '"':
+
+        return self.string()
+
+      # Handle operators and delimiters
+
+      if self.current_char == '=':
+
+        if self.source[self.position + 1:self.position + 2] == '=':
+
+          return self.operator(TokenType.EQUALS, '==')
+
+        return self.operator(TokenType.ASSIGN, '=')
+
+      if self.current_char == '!':
+
+        if self.source[self.position + 1:self.position + 2] == '=':
+
+          return self.operator(TokenType.NOT_EQUALS, '!=')
+
+        # A stray '!' is skipped in front of a delimiter
+
+        if self.source[self.position + 1:self.position + 2] not in ('(', ')', '{', '}', ';', ','):
+
+          return self.invalid(self.position + 1)
+
+        self.advance()
+
+      if self.current_char in _OPERATORS:
+
+        return self.operator(_OPERATORS[self.current_char], self.current_char)
+
+      return self.invalid(self.position)
+
+    return Token(TokenType.EOF, '', len(self.source), self._line_index)
+
+  def invalid(self, offset: int) -> Token:
+
+    # The ERROR token for the character at the current position, which is
+
+    # reported as the one at offset. Ends the tokens once errors are full.
+
+    char = self.source[offset] if offset < len(self.source) else None
+
+    going = self.recover(char, offset)
+
+    token = self.operator(TokenType.ERROR, self.current_char)
+
+    if not going:
+
+      self.position = len(self.source) - 1
+
+      self.advance()
+
+    return token
+
+  @classmethod
+
+  def from_chunks(cls, chunks: Iterable[str], engine: str = 'regex', max_errors: int = 0) -> 'Lexer':
+
+    # Lexes text arriving in pieces; tokens may span chunk boundaries
+
+    if engine != 'regex':
+
+      raise ValueError(f"Lexer engine '{engine}' needs the whole source")
+
+    lexer = cls('', engine, max_errors)
+
+    lexer.chunks = chunks
+
+    return lexer
+
+  @classmethod
+
+  def from_file(cls, file, chunk_size: int = CHUNK_SIZE, engine: str = 'regex', max_errors: int = 0) -> 'Lexer':
+
+    return cls.from_chunks(iter(lambda: file.read(chunk_size), ''), engine, max_errors)
+
+  @classmethod
+
+  def from_bytes(cls, data, engine: str = 'regex', max_errors: int = 0) -> 'Lexer':
+
+    # Lexes ASCII bytes (bytes, bytearray or an mmap) without decoding them;
+
+    # token values become memoryview slices of data
+
+    if engine == 'char':
+
+      raise ValueError(f"Lexer engine '{engine}' needs a string")
+
+    if _NON_ASCII.search(data):
+
+      raise ValueError("Lexing bytes in place needs ASCII input")
+
+    lexer = cls('', engine, max_errors)
+
+    lexer.data = data
+
+    return lexer
+
+  def tokenize(self) -> List[Token]:
+
+    return list(self.iter_tokens())
+
+  def tokenize_buffer(self, workers: int = 1) -> TokenBuffer:
+
+    # Streamed input is kept as it arrives and joined once at the end, for
+
+    # the token values to be sliced from: the text and three columns take a
+
+    # fraction of the memory of a Token per token.
+
+    # With workers above 1, the regex engine lexes a large enough string or
+
+    # bytes source in ranges across that many processes (see gehu.parallel),
+
+    # with the same result.
+
+    if self.engine == 'char':
+
+      raise ValueError("A TokenBuffer needs the regex or numpy engine")
+
+    if workers > 1 and self.engine == 'regex' and self.chunks is None:
+
+      from gehu.parallel import tokenize_parallel
+
+      return tokenize_parallel(self, workers)
+
+    vectorized = self._tokenize_vectorized()
+
+    if vectorized is not None:
+
+      buffer, error = vectorized
+
+      if error is not None:
+
+        raise error
+
+      return buffer
+
+    pieces = None
+
+    if self.data is not None:
+
+      buffer = TokenBuffer(memoryview(self.data), self._line_index)
+
+      scan = self.scan_bytes(self.data)
+
+    elif self.chunks is not None:
+
+      pieces = []
+
+      self.line_index = LineIndex()
+
+      buffer = TokenBuffer('', self.line_index)
+
+      scan = self.scan_chunks(self._index_chunks(self.chunks, pieces))
+
+    else:
+
+      buffer = TokenBuffer(self.source, self._line_index)
+
+      scan = self.scan_chunks((self.source,))
+
+    types = buffer.types.append
+
+    starts = buffer.starts.append
+
+    lengths = buffer.lengths.append
+
+    for token_type, value, start in scan:
+
+      types(token_type.value)
+
+      starts(start)
+
+      lengths(len(value))
+
+    if pieces is not None:
+
+      buffer.source = ''.join(pieces)
+
+    return buffer
+
+  def iter_tokens(self) -> Iterator[Token]:
+
+    vectorized = self._tokenize_vectorized()
+
+    if vectorized is not None:
+
+      buffer, error = vectorized
+
+      yield from buffer
+
+      if error is not None:
+
+        raise error
+
+      return
+
+    if self.engine != 'char':
+
+      if self.data is not None:
+
+        scan = self.scan_bytes(self.data)
+
+      elif self.chunks is not None:
+
+        self.line_index = LineIndex()
+
+        scan = self.scan_chunks(self._index_chunks(self.chunks))
+
+      else:
+
+        scan = self.scan_chunks((self.source,))
+
+      # Streamed input is indexed in windows, so that memory stays bounded
+
+      # for input of any number of lines: once the index holds more than
+
+      # STREAM_INDEX_LINES lines, the tokens after it get one from their own
+
+      # line on, and later chunks are added to that. An old window is freed
+
+      # with the last token that uses it.
+
+      window = STREAM_INDEX_LINES if self.chunks is not None else sys.maxsize
+
+      line_index = self.line_index
+
+      string_type = TokenType.STRING
+
+      for token_type, value, start in scan:
+
+        offset = start - (token_type is string_type)
+
+        if len(line_index.starts) > window:
+
+          line_index = self.line_index = line_index.since(offset)
+
+        yield Token(token_type, value, offset, line_index)
+
+      return
+
+    while True:
+
+      token = self.get_next_token()
+
+      yield token
+
+      if token.type == TokenType.EOF:
+
+        break
+
+  def _tokenize_vectorized(self) -> Optional[Tuple[TokenBuffer, Optional[Exception]]]:
+
+    # The numpy engine's tokens and error, or None to use the regex engine,
+
+    # which also takes over to recover from an error
+
+    if self.engine != 'numpy' or self.chunks is not None:
+
+      return None
+
+    from gehu.vectorized import tokenize_vectorized
+
+    vectorized = tokenize_vectorized(self)
+
+    if vectorized is not None and vectorized[1] is not None and self.max_errors:
+
+      return None
+
+    return vectorized
+
+  def _index_chunks(self, chunks: Iterable[str], kept: Optional[List[str]] = None) -> Iterator[str]:
+
+    # Passes chunks through, adding their newlines to line_index as they
+
+    # arrive, and to kept if given
+
+    base = 0
+
+    for chunk in chunks:
+
+      self.line_index.add(chunk, base)
+
+      base += len(chunk)
+
+      if kept is not None:
+
+        kept.append(chunk)
+
+      yield chunk
+
+  def scan_chunks(self, chunks: Iterable[str], position: int = 0) -> Iterator[tuple]:
+
+    # Yields (type, value, offset of value) for each token; a string's value
+
+    # starts after its quote. position resumes a scan part way into the
+
+    # first chunk, at a point between two tokens.
+
+    #
+
+    # Produces the same tokens as the 'char' engine.
+
+    #
+
+    # Only the unconsumed tail of the input is buffered. A match that runs
+
+    # into the end of the buffer could still grow (a word, a string, '=' that
+
+    # becomes '=='), so it is retried once the next chunk has been appended.
+
+    # All offsets are relative to the buffer and shift when it is trimmed.
+
+    chunks = iter(chunks)
+
+    match = _TOKEN_PATTERN.match
+
+    keywords = self.keywords
+
+    operators = _OPERATORS
+
+    identifier_type = TokenType.IDENTIFIER
+
+    buffer = ''
+
+    size = 0
+
+    more = True
+
+    pos = position
+
+    base = 0 # Offset of the buffer in the whole input
+
+    while True:
+
+      m = match(buffer, pos)
+
+      end = m.end()
+
+      if more and end >= size:
+
+        chunk = next(chunks, None)
+
+        if chunk is None:
+
+          more = False
+
+        elif chunk:
+
+          if size:
+
+            buffer = buffer[pos:] + chunk
+
+            base += pos
+
+            pos = 0
+
+          else:
+
+            buffer = chunk
+
+          size = len(buffer)
+
+        continue
+
+      start = m.end(1)
+
+      group = m.lastindex
+
+      if group == 2:
+
+        word = m.group(2)
+
+        first = word[0]
+
+        if first.isalpha() or first == '_':
+
+          token_type = keywords.get(word, identifier_type)
+
+        elif first.isdigit():
+
+          token_type = TokenType.NUMBER
+
+          digits = _DIGIT_RUN.match(buffer, start)
+
+          end = digits.end() if digits else start
+
+          while end < size and buffer[end].isdigit():
+
+            end += 1
+
+          word = buffer[start:end]
+
+        else:
+
+          # A word character that is neither a letter nor a digit
+
+          token_type = TokenType.ERROR
+
+          word = first
+
+          end = start + 1 if self.recover(first, base + start) else size + 1
+
+      elif group == 5:
+
+        word = m.group(5)
+
+        token_type = operators[word]
+
+      elif group == 7:
+
+        pos = end
+
+        continue
+
+      elif group == 4:
+
+        token_type = TokenType.STRING
+
+        word = m.group(3)
+
+        start += 1
+
+        # An unterminated string runs to the end of the source
+
+        if not m.group(4):
+
+          end = size + 1
+
+      elif group == 6:
+
+        word = m.group(6)
+
+        token_type = operators[word]
+
+        start += 1
+
+      else:
+
+        char = m.group(8)
+
+        if not char:
+
+          yield TokenType.EOF, '', base + start
+
+          return
+
+        offset = start
+
+        if char == '!':
+
+          # '!' not followed by '=' or a delimiter reports the next character
+
+          offset += 1
+
+          char = buffer[offset] if offset < size else None
+
+        # Otherwise the character becomes an ERROR token; after the last
+
+        # one allowed, the tokens end
+
+        token_type = TokenType.ERROR
+
+        word = buffer[start]
+
+        end = start + 1 if self.recover(char, base + offset) else size + 1
+
+      yield token_type, word, base + start
+
+      if end > size:
+
+        yield TokenType.EOF, '', base + size
+
+        return
+
+      pos = end
+
+  def scan_bytes(self, data, position: int = 0) -> Iterator[tuple]:
+
+    # ASCII counterpart of scan_chunks() over one bytes-like object that is
+
+    # already fully addressable, such as an mmap. Values are memoryview
+
+    # slices of data, so nothing is copied or decoded while lexing.
+
+    # position resumes a scan part way into data, as for scan_chunks().
+
+    view = memoryview(data)
+
+    match = _BYTES_TOKEN_PATTERN.match
+
+    keywords = {word.encode('ascii'): token_type for word, token_type in self.keywords.items()}
+
+    operators = _BYTES_OPERATORS
+
+    identifier_type = TokenType.IDENTIFIER
+
+    size = len(data)
+
+    pos = position
+
+    while True:
+
+      m = match(data, pos)
+
+      start = m.end(1)
+
+      end = m.end()
+
+      group = m.lastindex
+
+      if group == 2:
+
+        # Word characters above '9' are letters or '_'
+
+        if data[start] > 0x39:
+
+          word = view[start:end]
+
+          token_type = keywords.get(word, identifier_type)
+
+        else:
+
+          token_type = TokenType.NUMBER
+
+          end = _BYTES_DIGIT_RUN.match(data, start).end()
+
+          word = view[start:end]
+
+      elif group == 5:
+
+        token_type = operators[m.group(5)]
+
+        word = view[start:end]
+
+      elif group == 7:
+
+        pos = end
+
+        continue
+
+      elif group == 4:
+
+        token_type = TokenType.STRING
+
+        word = view[start + 1:m.end(3)]
+
+        start += 1
+
+        if not m.group(4):
+
+          end = size + 1
+
+      elif group == 6:
+
+        token_type = operators[m.group(6)]
+
+        start += 1
+
+        word = view[start:end]
+
+      else:
+
+        char = m.group(8)
+
+        if not char:
+
+          yield TokenType.EOF, view[size:], start
+
+          return
+
+        offset = start
+
+        if char == b'!':
+
+          offset += 1
+
+          char = data[offset:offset + 1] or None
+
+        token_type = TokenType.ERROR
+
+        word = view[start:start + 1]
+
+        end = start + 1 if self.recover(char and char.decode('ascii'), offset) else size + 1
+
+      yield token_type, word, start
+
+      if end > size:
+
+        yield TokenType.EOF, view[size:], size
+
+        return
+
+      pos = end
+
+# Finds var/const type codes in TokenBuffer.types without a Python-level loop
+
+_DECLARATION_CODES = re.compile(b'[' + re.escape(bytes((TokenType.VAR.value, TokenType.CONST.value))) + b']')
+
+# Diagnostics an analysis reports by default: this many lexical errors,
+
+# and as many syntax and semantic errors
+
+MAX_DIAGNOSTICS = 100
+
+class SemanticAnalyzer:
+
+  # analyze() parses the tokens (see gehu.parser) and runs the registered
+
+  # analysis passes over the tree (see gehu.passes), recording the time and
+
+  # memory of each in stats. Syntax errors are recovered from, so one run
+
+  # reports them all, up to max_errors errors and as many warnings.
+
+  # When there are no errors, gehu.optimizer then shrinks the tree
+
+  # (unless optimize is False) and optimization gets its statistics. The
+
+  # last analyze() leaves its tree in ast with the declarations resolved for
+
+  # it, and the optimized tree and its declarations in optimized, for
+
+  # gehu.compiler.
+
+  # analyze_indexed() is the flat scan for var/const declarations whose
+
+  # results gehu.incremental keeps up to date through edits.
+
+  def __init__(self, max_errors: int = MAX_DIAGNOSTICS, optimize: bool = True):
+
+    self.symbol_table = {} # Store variable declarations
+
+    self.errors = []
+
+    self.warnings = []
+
+    self.stats = {}
+
+    self.ast = self.declarations = self.optimized = None
+
+    self.optimization = {}
+
+    self.max_errors = max_errors
+
+    self.optimize = optimize
+
+  def analyze(self, tokens: Union[TokenBuffer, Iterable[Token]]):
+
+    # Imported here because these modules build on this one
+
+    from gehu.parser import ParseError, Parser, TokenList
+
+    from gehu.passes import Pipeline, measure
+
+    self.errors = []
+
+    self.warnings = []
+
+    self.symbol_table = {}
+
+    self.stats = {}
+
+    self.ast = self.declarations = self.optimized = None
+
+    self.optimization = {}
+
+    if not isinstance(tokens, (TokenBuffer, TokenList)):
+
+      # The syntax tree refers to tokens by index, so a stream is collected
+
+      tokens = TokenList(tokens)
+
+    blocks = sys.getallocatedblocks()
+
+    start = time.perf_counter()
+
+    parser = Parser(tokens, self.max_errors)
+
+    try:
+
+      ast = parser.parse()
+
+    except ParseError as e:
+
+      self.errors.append(f"Syntax error: {e}")
+
+      return self.errors
+
+    finally:
+
+      measure(self.stats, 'parse', time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+
+    self.ast = ast
+
+    result = Pipeline().run(ast, self.stats)
+
+    self.errors = self.limit([f"Syntax error: {error}" for error in parser.errors] + result['errors'], 'errors')
+
+    self.warnings = self.limit(result['warnings'], 'warnings')
+
+    self.symbol_table = result['symbol_table']
+
+    self.declarations = result['declarations']
+
+    if self.optimize and not self.errors and self.declarations is not None:
+
+      from gehu.optimizer import Optimizer
+
+      blocks = sys.getallocatedblocks()
+
+      start = time.perf_counter()
+
+      optimizer = Optimizer(ast, self.declarations)
+
+      self.optimized = optimizer.optimize()
+
+      self.optimization = optimizer.stats
+
+      measure(self.stats, 'optimize', time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+
+    return self.errors
+
+  def limit(self, diagnostics: List[str], noun: str) -> List[str]:
+
+    # The first max_errors diagnostics, and a note of how many more there are
+
+    if not self.max_errors or len(diagnostics) <= self.max_errors:
+
+      return diagnostics
+
+    return diagnostics[:self.max_errors] + [f"... {len(diagnostics) - self.max_errors} more {noun} not shown"]
+
+  def analyze_indexed(self, types, tokens) -> List[str]:
+
+    # types holds one TokenType value per token as a bytes-like object and
+
+    # tokens[i] materializes token i; only declaration tokens are built
+
+    self.errors = []
+
+    self.symbol_table = {}
+
+    count = len(types)
+
+    for match in _DECLARATION_CODES.finditer(types):
+
+      index = match.start()
+
+      name_token = tokens[index + 1] if index + 1 < count else None
+
+      assign_token = tokens[index + 2] if index + 2 < count else None
+
+      self.declare(tokens[index], name_token, assign_token)
+
+      if self.max_errors and len(self.errors) >= self.max_errors:
+
+        break
+
+    return self.errors
+
+  def declare(self, token: Token, name_token: Optional[Token], assign_token: Optional[Token]) -> bool:
+
+    # Records one var/const declaration, returns False when it is malformed;
+
+    # the scan goes on with the next one either way
+
+    if assign_token is None:
+
+      self.errors.append(f"Invalid variable declaration at line {token.line}")
+
+      return False
+
+    # Check for identifier
+
+    if name_token.type != TokenType.IDENTIFIER:
+
+      self.errors.append(f"Expected identifier after {token.text} at line {token.line}")
+
+      return False
+
+    var_name = name_token.text
+
+    # Check for assignment operator
+
+    if assign_token.type != TokenType.ASSIGN:
+
+      self.errors.append(f"Expected '=' after variable name at line {token.line}")
+
+      return False
+
+    # Check if variable is already declared
+
+    if var_name in self.symbol_table:
+
+      self.errors.append(f"Variable '{var_name}' already declared at line {token.line}")
+
+    else:
+
+      self.symbol_table[var_name] = {
+
+        'type': 'const' if token.type == TokenType.CONST else 'var',
+
+        'line': token.line
+
+      }
+
+    return True
+
+# Bumped whenever lexer or analyzer output changes; part of every cache key
+
+ANALYZER_VERSION = '7'
+
+# The AnalysisCache (see gehu.cache) analyze_code and analyze_file consult,
+
+# if any
+
+analysis_cache = None
+
+# The CommandCache (see gehu.commandcache) handle_command consults, if any
+
+command_cache = None
+
+# The Profiler (see gehu.profiling) --profile installs, if any
+
+profiler = None
+
+_NO_PHASE = nullcontext()
+
+def profile_phase(name: str):
+
+  # Times the block it guards as a --profile phase; without --profile, a
+
+  # context that does nothing
+
+  return _NO_PHASE if profiler is None else profiler.phase(name)
+
+# The diagnostics cap analyze_code and analyze_file use, see MAX_DIAGNOSTICS
+
+max_diagnostics = MAX_DIAGNOSTICS
+
+# Processes analyze_code and analyze_file lex a large source with, see
+
+# Lexer.tokenize_buffer
+
+lex_workers = 1
+
+def analyze_code(code: Union[str, bytes, Iterable[str]], keep_tokens: bool = True, on_tokens: Optional[Callable] = None) -> Dict:
+
+  # code is a string, ASCII bytes (or an mmap), a text file object or an
+
+  # iterable of text chunks.
+
+  # Tokens are lexed into a TokenBuffer that the analyzer parses in place;
+
+  # streamed input is collected into one string for it as it is lexed.
+
+  # Memory therefore grows with the input whatever it is given as: the whole
+
+  # text (twice over while the chunks are joined, for streamed input), 13
+
+  # bytes per token and the syntax tree. keep_tokens=False only leaves the
+
+  # tokens out of the result; it no longer bounds memory. To stream tokens
+
+  # in bounded memory, use Lexer.from_file(...).iter_tokens().
+
+  # With analysis_cache set, whole sources (strings, bytes, mmaps) are looked
+
+  # up by content first.
+
+  # on_tokens, if given, is called with the TokenBuffer once lexing ends
+
+  # and before the rest of the analysis, so the tokens can be output early;
+
+  # it is not called for cached results.
+
+  cache = analysis_cache
+
+  if cache is None or not isinstance(code, (str, bytes, bytearray, mmap.mmap)):
+
+    return _analyze(code, keep_tokens, on_tokens)
+
+  return _analyze_cached(cache, code, keep_tokens, cache.digest(code), on_tokens)
+
+def _analyze_cached(cache, code, keep_tokens: bool, digest: bytes, on_tokens: Optional[Callable] = None) -> Dict:
+
+  # The diagnostics cap changes the result, so it is part of the key
+
+  key = digest + max_diagnostics.to_bytes(4, 'big')
+
+  result = cache.load(key, code, keep_tokens)
+
+  if result is None:
+
+    result = _analyze(code, keep_tokens, on_tokens)
+
+    cache.store(key, result)
+
+    result['cached'] = False
+
+  return result
+
+def _analyze(code, keep_tokens: bool, on_tokens: Optional[Callable] = None) -> Dict:
+
+  # Lexical errors are recovered from like syntax errors: invalid
+
+  # characters become ERROR tokens and analysis goes on
+
+  cap = max_diagnostics
+
+  if isinstance(code, str):
+
+    lexer = Lexer(code, max_errors=cap)
+
+  elif isinstance(code, (bytes, bytearray, mmap.mmap)):
+
+    lexer = Lexer.from_bytes(code, max_errors=cap)
+
+  elif hasattr(code, 'read'):
+
+    lexer = Lexer.from_file(code, max_errors=cap)
+
+  else:
+
+    lexer = Lexer.from_chunks(code, max_errors=cap)
+
+  tokens = []
+
+  analyzer = SemanticAnalyzer(cap)
+
+  # Wall time and net allocated memory blocks of lexing and of each pass
+
+  passes = {}
+
+  blocks = sys.getallocatedblocks()
+
+  start = time.perf_counter()
+
+  try:
+
+    parsed = lexer.tokenize_buffer(lex_workers)
+
+    passes['lex'] = {'seconds': time.perf_counter() - start, 'allocated_blocks': sys.getallocatedblocks() - blocks}
+
+    if on_tokens is not None:
+
+      on_tokens(parsed)
+
+    semantic_errors = analyzer.analyze(parsed)
+
+    passes.update(analyzer.stats)
+
+    if keep_tokens:
+
+      tokens = parsed
+
+  except Exception as e:
+
+    return {
+
+      'success': False,
+
+      'error': str(e),
+
+      'tokens': [],
+
+      'lexical_errors': [],
+
+      'semantic_errors': [],
+
+      'warnings': [],
+
+      'symbol_table': {},
+
+      'optimization': {},
+
+      'passes': passes
+
+    }
+
+  lexical_errors = lexer.errors
+
+  if len(lexical_errors) >= cap:
+
+    lexical_errors = lexical_errors + [f"... lexing stopped after {cap} errors"]
+
+  return {
+
+    'success': not lexical_errors and not semantic_errors,
+
+    'tokens': tokens,
+
+    'lexical_errors': lexical_errors,
+
+    'semantic_errors': semantic_errors,
+
+    'warnings': analyzer.warnings,
+
+    'symbol_table': analyzer.symbol_table,
+
+    'optimization': analyzer.optimization,
+
+    'passes': passes
+
+  }
+
+def analyze_file(path: str, keep_tokens: bool = True, on_tokens: Optional[Callable] = None) -> Dict:
+
+  # ASCII files are lexed straight from an mmap without decoding a copy;
+
+  # anything else is decoded as UTF-8 in chunks into one string in memory,
+
+  # see analyze_code.
+
+  # With analysis_cache set, a file whose mtime and size are unchanged is
+
+  # looked up by its recorded digest without hashing it again.
+
+  with open(path, 'rb') as f:
+
+    stat = os.fstat(f.fileno())
+
+    if stat.st_size == 0:
+
+      return analyze_code('', keep_tokens, on_tokens)
+
+    # Left open on purpose: the tokens hold memoryview slices of the mapping,
+
+    # which is closed when the last of them is released
+
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+  if not _NON_ASCII.search(data):
+
+    cache = analysis_cache
+
+    if cache is None:
+
+      return analyze_code(data, keep_tokens, on_tokens)
+
+    digest = cache.path_digest(path, stat)
+
+    if digest is None:
+
+      digest = cache.digest(data)
+
+      cache.remember_path(path, stat, digest)
+
+    return _analyze_cached(cache, data, keep_tokens, digest, on_tokens)
+
+  data.close()
+
+  with open(path, 'r', encoding='utf-8') as f:
+
+    return analyze_code(f, keep_tokens, on_tokens)
+
+def fill_copy_paths(command: str) -> str:
+
+  # Replace source_folder_path with actual current directory
+
+  current_dir = os.getcwd()
+
+  command = command.replace('source_folder_path', current_dir)
+
+  # For copying to parent directory
+
+  if 'destination_folder_path' in command:
+
+    parent_dir = os.path.dirname(current_dir)
+
+    command = command.replace('destination_folder_path', parent_dir)
+
+  return command
+
+def execute_command(command):
+
+  # Imported here, as only generated commands are run
+
+  import subprocess
+
+  try:
+
+    # For git commands, we need to handle them specially
+
+    if command.startswith('git'):
+
+      # Split the command into parts
+
+      parts = command.split()
+
+      if parts[0] == 'git':
+
+        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+
+        if result.returncode == 0:
+
+          print(result.stdout)
+
+          return True
+
+        else:
+
+          print(f"Error: {result.stderr}")
+
+          return False
+
+    # For copy commands
+
+    elif command.startswith('xcopy') or command.startswith('copy'):
+
+      command = fill_copy_paths(command)
+
+      result = subprocess.run(command, shell=True, capture_output=True, text=True)
+
+      if result.returncode == 0:
+
+        print(result.stdout)
+
+        return True
+
+      else:
+
+        print(f"Error: {result.stderr}")
+
+        return False
+
+    # For other commands
+
+    else:
+
+      result = subprocess.run(command, shell=True, capture_output=True, text=True)
+
+      if result.returncode == 0:
+
+        print(result.stdout)
+
+        return True
+
+      else:
+
+        print(f"Error: {result.stderr}")
+
+        return False
+
+  except Exception as e:
+
+    print(f"Error executing command: {str(e)}")
+
+    return False
+
+def command_prompt(task: str, cwd: str) -> str:
+
+  # What handle_command and gehu --batch ask the model for a task run in cwd
+
+  # Add context about the current directory and environment
+
+  context = f"""Current directory: {cwd}
+
+  Operating System: Windows
+
+  Task: {task}
+
+  Please provide a Windows command that will work in the current directory."""
+
+  return f"""You are a bot that gives back specific cmd commands required to complete the task mentioned.
+
+    Please provide only the command itself, without any additional explanation.
+
+    If the solution requires multiple commands, provide them all in sequence.
+
+    Make sure to use proper Windows command syntax.
+
+    {context}"""
+
+def confirm_similar(command: str) -> bool:
+
+  # Whether to run a command cached for a similar task, which may not do
+
+  # what this one asks: only if the user says so, so never without a
+
+  # terminal to ask on
+
+  print(f"Command: {command}")
+
+  if not sys.stdin.isatty():
+
+    return False
+
+  try:
+
+    answer = input("Run it? [y/N] ")
+
+  except EOFError:
+
+    return False
+
+  return answer.strip().lower() in ('y', 'yes')
+
+def handle_command(args):
+
+  # Check if the command is for code analysis
+
+  if args.command.startswith('analyze:'):
+
+    handle_analyze_code(args.command[8:].strip(), sys.stdout, args.format, args.quiet_tokens) # Remove 'analyze:' prefix
+
+    return
+
+  cwd = os.getcwd()
+
+  cache = command_cache
+
+  command = None
+
+  task = args.command
+
+  if cache is not None:
+
+    with profile_phase('command cache lookup'):
+
+      cached = cache.load(args.command, cwd)
+
+    if cached is not None:
+
+      command, task, similarity = cached
+
+      if similarity < 1:
+
+        print(f"Reusing the command for a similar task: {task} (similarity {similarity:.2f})")
+
+        if args.run and not confirm_similar(command):
+
+          print("Generating a new command instead.")
+
+          command = None
+
+          task = args.command
+
+  runner = None
+
+  if command is None:
+
+    # Imported here, as only generated commands are streamed
+
+    from gehu.streaming import ShellFeed, stream_response
+
+    model = get_model()
+
+    if args.run and ShellFeed.available():
+
+      # Started on the first complete line, while the rest still arrives
+
+      runner = ShellFeed()
+
+    print("Generated command: ", end='', flush=True)
+
+    with profile_phase('generate_content'):
+
+      started = time.perf_counter()
+
+      response = model.generate_content(command_prompt(args.command, cwd), stream=True)
+
+      try:
+
+        command, first, total = stream_response(response, started, sys.stdout, runner.feed if runner is not None else None)
+
+      except BaseException:
+
+        # Half a command is not to be run
+
+        if runner is not None:
+
+          runner.cancel()
+
+        raise
+
+      print()
+
+      report_latency(first, total)
+
+    if cache is not None and command:
+
+      cache.store(args.command, cwd, command)
+
+  else:
+
+    print(f"Generated command: {command}")
+
+  if args.run:
+
+    print("\nExecuting command...")
+
+    with profile_phase('execute command'):
+
+      succeeded = runner.finish() if runner is not None else execute_command(command)
+
+    if succeeded:
+
+      print("\nCommand executed successfully!")
+
+    else:
+
+      print("\nCommand execution failed!")
+
+      if cache is not None:
+
+        # Not worth handing out again
+
+        cache.forget(task, cwd)
+
+# The handlers below write to out, which gehu.server points at a client's
+
+# connection
+
+def handle_analyze_code(code: str, out: TextIO = sys.stdout, format: str = 'text', quiet_tokens: bool = False):
+
+  from gehu.output import report_writer
+
+  report = report_writer(format, out, quiet_tokens)
+
+  with profile_phase('analyze'):
+
+    result = analyze_code(code, on_tokens=report.stream_tokens)
+
+    if profiler is not None:
+
+      profiler.record_passes(result['passes'])
+
+  with profile_phase('write report'):
+
+    report.write(result, analysis_cache)
+
+def handle_analyze(args, out: TextIO = sys.stdout):
+
+  if args.recursive:
+
+    # Imported here so the single-file path does not load the pool machinery
+
+    from gehu.batch import analyze_tree
+
+    with profile_phase('analyze tree'):
+
+      analyze_tree(args.path, args.jobs, out, args.format, args.quiet_tokens)
+
+    return
+
+  from gehu.output import report_writer
+
+  report = report_writer(args.format, out, args.quiet_tokens)
+
+  try:
+
+    with profile_phase('analyze'):
+
+      result = analyze_file(args.path, on_tokens=report.stream_tokens)
+
+      if profiler is not None:
+
+        profiler.record_passes(result['passes'])
+
+  except OSError as e:
+
+    report.error(f"cannot read {args.path}: {e.strerror}")
+
+    return
+
+  with profile_phase('write report'):
+
+    report.write(result, analysis_cache)
+
+def handle_run(args, out: TextIO = sys.stdout):
+
+  # Imported here so analysis alone does not load the compiler
+
+  from gehu.compiler import compile_source
+
+  from gehu.vm import VM, VMError
+
+  try:
+
+    with open(args.path, 'r', encoding='utf-8') as f:
+
+      source = f.read()
+
+  except OSError as e:
+
+    out.write(f"Error: cannot read {args.path}: {e.strerror}\n")
+
+    return
+
+  except UnicodeDecodeError:
+
+    out.write(f"Error: {args.path} is not UTF-8 text\n")
+
+    return
+
+  with profile_phase('compile'):
+
+    program, errors = compile_source(source, args.max_errors)
+
+  if program is None:
+
+    out.write(f"Cannot run {args.path}:\n")
+
+    out.writelines(f" {error}\n" for error in errors)
+
+    return
+
+  try:
+
+    with profile_phase('execute'):
+
+      VM(out).run(program)
+
+  except VMError as e:
+
+    out.write(f"Runtime error: {e}\n")
+
+def format_analysis(result, tokens: bool = True) -> str:
+
+  # The text report; tokens=False leaves out the token listing
+
+  return '\n'.join(analysis_lines(result, tokens)) + '\n'
+
+def analysis_lines(result, tokens: bool = True) -> Iterator[str]:
+
+  # The lines of format_analysis, for writing without joining them first
+
+  yield ""
+
+  yield "=== Lexical Analysis Results ==="
+
+  if 'error' not in result:
+
+    if tokens:
+
+      yield "Tokens found:"
+
+      tokens = result['tokens']
+
+      if isinstance(tokens, TokenBuffer):
+
+        yield from (f" {token}" for token in tokens.describe())
+
+      else:
+
+        yield from (f" {token}" for token in tokens)
+
+    if result['lexical_errors']:
+
+      yield "Lexical errors found:"
+
+      yield from (f" {error}" for error in result['lexical_errors'])
+
+  else:
+
+    yield f"Error during lexical analysis: {result['error']}"
+
+  yield ""
+
+  yield "=== Semantic Analysis Results ==="
+
+  if result['semantic_errors']:
+
+    yield "Semantic errors found:"
+
+    yield from (f" {error}" for error in result['semantic_errors'])
+
+  else:
+
+    yield "No semantic errors found."
+
+  if result['warnings']:
+
+    yield "Warnings:"
+
+    yield from (f" {warning}" for warning in result['warnings'])
+
+  yield ""
+
+  yield "=== Symbol Table ==="
+
+  for var_name, info in result['symbol_table'].items():
+
+    yield f" {var_name}: {info['type']} (declared at line {info['line']})"
+
+  optimization = result.get('optimization')
+
+  if optimization:
+
+    before = optimization['before']
+
+    after = optimization['after']
+
+    yield ""
+
+    yield "=== Optimization ==="
+
+    yield f" Nodes: {before['nodes']} -> {after['nodes']}"
+
+    yield f" Operations: {before['operations']} -> {after['operations']}"
+
+    yield f" Folded: {optimization['folded']}, const uses propagated: {optimization['propagated']}, branches removed: {optimization['branches_removed']}, bindings removed: {optimization['bindings_removed']}"
+
+def handle_question(args):
+
+  from gehu.streaming import stream_response
+
+  model = get_model()
+
+  with profile_phase('generate_content'):
+
+    started = time.perf_counter()
+
+    response = model.generate_content(
+
+      f"""You will be asked questions that will be displayed in a cmd terminal.
+
+      Make your answers short and in plain text. Don't add ethical warnings or redundant information.
+
+      Answer in the language the question is asked.
+
+      Question: {args.question}""",
+
+      stream=True
+
+    )
+
+    _, first, total = stream_response(response, started, sys.stdout, strip=False)
+
+    print()
+
+    report_latency(first, total)
+
+def handle_batch(args):
+
+  # Imported here, as only --batch needs the thread pool
+
+  from gehu import taskbatch
+
+  cache = None
+
+  if not args.no_cache:
+
+    from gehu.commandcache import CommandCache
+
+    cache = CommandCache() if args.similarity is None else CommandCache(similarity=args.similarity)
+
+  model = get_model()
+
+  concurrency = args.concurrency or taskbatch.DEFAULT_CONCURRENCY
+
+  rate = args.rate or taskbatch.DEFAULT_RATE
+
+  retries = taskbatch.DEFAULT_RETRIES if args.retries is None else args.retries
+
+  try:
+
+    with profile_phase('generate batch'):
+
+      taskbatch.generate_batch(args.batch, model, concurrency, rate, retries, sys.stdout, cache)
+
+  except OSError as e:
+
+    print(f"Error: cannot read {args.batch}: {e.strerror}")
+
+def report_latency(first: Optional[float], total: float):
+
+  # Time to the first token and to the whole response of a streamed
+
+  # generate_content, on stderr so that stdout holds only the response
+
+  first_text = 'no text' if first is None else f'{first:.3f}s'
+
+  sys.stderr.write(f"Model latency: first token {first_text}, total {total:.3f}s\n")
+
+  if profiler is not None and first is not None:
+
+    profiler.record('first token', first)
+
+def forward_command(args) -> bool:
+
+  # Hands an analyze or run command to a running gehu --server, if there is
+
+  # one; returns whether it did
+
+  if args.command in ('analyze', 'run') and args.path:
+
+    request = {'command': args.command, 'path': args.path}
+
+  elif args.command.startswith('analyze:') and not args.path:
+
+    request = {'command': 'analyze:', 'code': args.command[8:].strip()}
+
+  else:
+
+    return False
+
+  request.update(cwd=os.getcwd(), max_errors=args.max_errors, cache=not args.no_cache, format=args.format, quiet_tokens=args.quiet_tokens)
+
+  from gehu.client import forward
+
+  return forward(request, args.socket)
+
+def main():
+
+  global max_diagnostics, lex_workers, profiler
+
+  # Imported here, as library use of gehu does not need it
+
+  import argparse
+
+  parser = argparse.ArgumentParser(description="gehu Command Line Interface")
+
+  parser.add_argument('command', type=str, nargs='?', help='Command or question to process, or "analyze" or "run" followed by a file path')
+
+  parser.add_argument('path', nargs='?', help='Source file for the analyze or run command')
+
+  parser.add_argument('--run', '-r', action='store_true', help='Execute the generated command')
+
+  parser.add_argument('--recursive', '-R', action='store_true', help='Analyze every source file under the directory given to analyze')
+
+  parser.add_argument('--jobs', '-j', type=int, default=None, help='Worker processes for --recursive, or for lexing one large file (default: one per CPU)')
+
+  parser.add_argument('--no-cache', action='store_true', help='Do not use the on-disk analysis and command caches')
+
+  parser.add_argument('--similarity', type=float, default=None, metavar='T', help='Reuse the cached command of a differently worded task at least this similar, from 0 to 1; 1 turns this off (default: 0.8)')
+
+  parser.add_argument('--cache-stats', action='store_true', help='Print how often generated commands came from the command cache, and exit')
+
+  parser.add_argument('--max-errors', type=int, default=MAX_DIAGNOSTICS, help=f'Report at most this many lexical errors and this many other errors (default: {MAX_DIAGNOSTICS})')
+
+  parser.add_argument('--format', choices=('text', 'json', 'ndjson'), default='text', help='Analysis report format: text, one JSON object, or one JSON record per line streamed as analysis runs (default: text)')
+
+  parser.add_argument('--quiet-tokens', action='store_true', help='Leave tokens out of analysis reports')
+
+  parser.add_argument('--batch', metavar='FILE', help="Generate a command for each task in FILE, one per line ('-' for standard input), writing NDJSON in input order")
+
+  parser.add_argument('--concurrency', type=int, default=None, help='Model calls in flight at once for --batch (default: 4)')
+
+  parser.add_argument('--rate', type=float, default=None, help='Most model calls per second for --batch, on average (default: 5)')
+
+  parser.add_argument('--retries', type=int, default=None, help='Retries of a --batch call refused for quota, waiting exponentially longer (default: 6)')
+
+  parser.add_argument('--server', action='store_true', help='Serve analyze and run commands from other gehu processes over a Unix socket')
+
+  parser.add_argument('--socket', default=None, help='Socket of the server (default: $GEHU_SOCKET, or gehu-UID.sock in $XDG_RUNTIME_DIR or the temp directory)')
+
+  parser.add_argument('--no-server', action='store_true', help='Do the work in this process even if a server is running')
+
+  parser.add_argument('--profile', action='store_true', help='Print the wall time, CPU time and peak memory of each phase to stderr')
+
+  parser.add_argument('--profile-output', metavar='FILE', help='Also write cProfile statistics to FILE (a .prof file); implies --profile')
+
+  parser.add_argument('--profile-memory', type=int, default=0, metavar='N', help='Trace allocations, for per-phase peaks and the N lines holding the most memory; implies --profile')
+
+  # Options may come before, between or after the command and path, as in
+
+  # gehu analyze --recursive src/ --jobs 4
+
+  args = parser.parse_intermixed_args()
+
+  if args.jobs is not None and args.jobs < 1:
+
+    parser.error("--jobs must be at least 1")
+
+  if args.max_errors < 1:
+
+    parser.error("--max-errors must be at least 1")
+
+  if args.concurrency is not None and args.concurrency < 1:
+
+    parser.error("--concurrency must be at least 1")
+
+  if args.rate is not None and args.rate <= 0:
+
+    parser.error("--rate must be positive")
+
+  if args.retries is not None and args.retries < 0:
+
+    parser.error("--retries must not be negative")
+
+  if args.similarity is not None and not 0 < args.similarity <= 1:
+
+    parser.error("--similarity must be above 0 and at most 1")
+
+  if args.profile_memory < 0:
+
+    parser.error("--profile-memory must not be negative")
+
+  max_diagnostics = args.max_errors
+
+  # --recursive analyzes files side by side instead, each one in one process.
+
+  # A server lexes in one process too: its handler threads must not fork a pool.
+
+  if not args.recursive and not args.server:
+
+    lex_workers = args.jobs or os.cpu_count() or 1
+
+  if not (args.profile or args.profile_output or args.profile_memory):
+
+    dispatch(args, parser)
+
+    return
+
+  if args.server:
+
+    parser.error("--profile does not work with --server")
+
+  from gehu.profiling import Profiler
+
+  profiler = Profiler(args.profile_output, args.profile_memory)
+
+  profiler.start()
+
+  try:
+
+    dispatch(args, parser)
+
+  finally:
+
+    profiler.stop()
+
+    profiler.report()
+
+    profiler = None
+
+def dispatch(args, parser: 'argparse.ArgumentParser'):
+
+  # Runs the command main parsed
+
+  global analysis_cache, command_cache
+
+  if args.server:
+
+    if args.command is not None:
+
+      parser.error("--server takes no command")
+
+    from gehu.server import serve
+
+    cache = None
+
+    if not args.no_cache:
+
+      from gehu.cache import AnalysisCache
+
+      cache = AnalysisCache()
+
+    serve(args.socket, cache)
+
+    return
+
+  if args.batch is not None:
+
+    if args.command is not None:
+
+      parser.error("--batch takes no command")
+
+    if args.run:
+
+      parser.error("--batch does not run commands")
+
+    handle_batch(args)
+
+    return
+
+  if args.concurrency is not None or args.rate is not None or args.retries is not None:
+
+    parser.error("--concurrency, --rate and --retries need --batch")
+
+  if args.cache_stats:
+
+    if args.command is not None:
+
+      parser.error("--cache-stats takes no command")
+
+    from gehu.commandcache import CommandCache
+
+    entries, hits, similar_hits, misses = CommandCache().stats()
+
+    lookups = hits + similar_hits + misses
+
+    rate = f", {(hits + similar_hits) / lookups:.0%} hit rate" if lookups else ""
+
+    print(f"Command cache: {entries} entries, {hits} hits, {similar_hits} similar-task hits, {misses} misses{rate}")
+
+    return
+
+  if args.command is None:
+
+    parser.error("the following arguments are required: command")
+
+  if not args.no_server and not args.recursive:
+
+    with profile_phase('forward to server'):
+
+      forwarded = forward_command(args)
+
+    if forwarded:
+
+      return
+
+  if not args.no_cache and (args.command == 'analyze' or args.command.startswith('analyze:')):
+
+    from gehu.cache import AnalysisCache
+
+    analysis_cache = AnalysisCache()
+
+  if args.command == 'analyze' and args.path:
+
+    handle_analyze(args)
+
+  elif args.command == 'run' and args.path:
+
+    if args.recursive:
+
+      parser.error("--recursive needs 'analyze DIR'")
+
+    handle_run(args)
+
+  elif args.path:
+
+    parser.error(f"unexpected argument '{args.path}'")
+
+  elif args.recursive:
+
+    parser.error("--recursive needs 'analyze DIR'")
+
+  else:
+
+    if not args.no_cache and not args.command.startswith('analyze:'):
+
+      from gehu.commandcache import CommandCache
 
-  args = parser.parse_args()
+      command_cache = CommandCache() if args.similarity is None else CommandCache(similarity=args.similarity)
 
-  handle_command(args)
+    handle_command(args)
 
 if __name__ == "__main__":
 
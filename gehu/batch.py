@@ -0,0 +1,169 @@
+import io
+
+import os
+
+import sys
+
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from typing import Dict, Iterator, Optional, TextIO, Tuple
+
+import gehu
+
+from gehu import analyze_file
+
+from gehu.output import report_writer, to_json
+
+# File names the recursive analyze mode picks up
+
+SOURCE_SUFFIXES = ('.g',)
+
+def iter_sources(root: str) -> Iterator[str]:
+
+  for directory, subdirs, files in os.walk(root):
+
+    subdirs.sort()
+
+    for name in sorted(files):
+
+      if name.endswith(SOURCE_SUFFIXES):
+
+        yield os.path.join(directory, name)
+
+def analyze_report(path: str, format: str = 'text', quiet_tokens: bool = False) -> Tuple[str, int, bool, Optional[bool], str]:
+
+  # Runs in a worker: analyzes one file and renders its report there, in
+
+  # format (see gehu.output), so only text crosses back to the parent. The
+
+  # fourth field tells whether the analysis cache had the result (None
+
+  # without a cache).
+
+  out = io.StringIO()
+
+  report = report_writer(format, out, quiet_tokens)
+
+  try:
+
+    size = os.path.getsize(path)
+
+    result = analyze_file(path)
+
+  except OSError as e:
+
+    report.error(f"cannot read {path}: {e.strerror}", path)
+
+    return path, 0, False, None, out.getvalue()
+
+  report.write(result, path=path)
+
+  return path, size, result['success'], result.get('cached'), out.getvalue()
+
+def _configure(cache, max_diagnostics: int):
+
+  # Pool initializer: workers started by spawn do not inherit the parent's
+
+  # settings
+
+  gehu.analysis_cache = cache
+
+  gehu.max_diagnostics = max_diagnostics
+
+def iter_reports(paths: Iterator[str], jobs: int, format: str = 'text', quiet_tokens: bool = False) -> Iterator[Tuple[str, int, bool, Optional[bool], str]]:
+
+  # Yields reports in the order files finish, so a slow file does not hold
+
+  # back the ones after it
+
+  if jobs == 1:
+
+    for path in paths:
+
+      yield analyze_report(path, format, quiet_tokens)
+
+    return
+
+  with ProcessPoolExecutor(max_workers=jobs, initializer=_configure, initargs=(gehu.analysis_cache, gehu.max_diagnostics)) as executor:
+
+    for future in as_completed([executor.submit(analyze_report, path, format, quiet_tokens) for path in paths]):
+
+      yield future.result()
+
+def analyze_tree(root: str, jobs: Optional[int] = None, out: TextIO = sys.stdout, format: str = 'text', quiet_tokens: bool = False) -> Dict:
+
+  # Streams one report per source file under root, then a summary. In json
+
+  # format the whole is one object, {"files": [report, ...], "summary"}; in
+
+  # ndjson the summary is a last "summary" record.
+
+  if not os.path.isdir(root):
+
+    report_writer(format, out).error(f"{root} is not a directory")
+
+    return {'files': 0, 'failed': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'seconds': 0.0}
+
+  jobs = jobs or os.cpu_count() or 1
+
+  started = time.perf_counter()
+
+  files = failed = size = hits = misses = 0
+
+  if format == 'json':
+
+    out.write('{"files":[\n')
+
+  for path, file_size, success, cached, report in iter_reports(iter_sources(root), jobs, format, quiet_tokens):
+
+    if format == 'json' and files:
+
+      out.write(',')
+
+    files += 1
+
+    failed += not success
+
+    size += file_size
+
+    hits += cached is True
+
+    misses += cached is False
+
+    out.write(report)
+
+  seconds = time.perf_counter() - started
+
+  summary = {'files': files, 'failed': failed, 'bytes': size, 'hits': hits, 'misses': misses, 'seconds': seconds}
+
+  if format == 'json':
+
+    out.write(f'],"summary":{to_json(summary)}}}\n')
+
+    return summary
+
+  if format == 'ndjson':
+
+    out.write(to_json({'record': 'summary', **summary}) + '\n')
+
+    return summary
+
+  elapsed = seconds or 1e-9
+
+  out.write("\n=== Summary ===\n")
+
+  out.write(f" Files analyzed: {files} ({failed} with errors)\n")
+
+  out.write(f" Total size: {size / 1e6:.2f} MB\n")
+
+  out.write(f" Time: {seconds:.2f}s with {jobs} job{'s' if jobs != 1 else ''}\n")
+
+  out.write(f" Throughput: {files / elapsed:.1f} files/s, {size / 1e6 / elapsed:.2f} MB/s\n")
+
+  if gehu.analysis_cache is not None:
+
+    out.write(f" Cache: {hits} hits, {misses} misses\n")
+
+  return summary
@@ -0,0 +1,3 @@
+from gehu.bench.suite import main
+
+main()
@@ -0,0 +1,343 @@
+import argparse
+
+import random
+
+import re
+
+import sys
+
+from typing import Iterator, Optional, TextIO
+
+# Knobs of the generated sources:
+
+#   identifier_density: chance that an operand is a name rather than a literal
+
+#   string_length: mean length of string literals
+
+#   comment_ratio: chance that a statement is preceded by a comment line
+
+#   nesting: deepest nesting of blocks (if, while, for, function bodies)
+
+DEFAULTS = {'identifier_density': 0.5, 'string_length': 12, 'comment_ratio': 0.1, 'nesting': 3}
+
+_SIZE = re.compile(r'(\d+(?:\.\d+)?)([KMG]?)B?$', re.IGNORECASE)
+
+_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+_LETTERS = 'abcdefghijklmnopqrstuvwxyz     '
+
+_WORDS = ('total', 'count', 'step', 'value', 'item', 'next', 'left', 'right', 'scale', 'offset')
+
+def parse_size(text: str) -> int:
+
+  # '1K', '100MB', '2.5M' or plain bytes
+
+  match = _SIZE.match(text.strip())
+
+  if not match:
+
+    raise ValueError(f"invalid size '{text}'")
+
+  return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+def format_size(size: int) -> str:
+
+  for unit in ('G', 'M', 'K'):
+
+    if size >= _UNITS[unit] and size % _UNITS[unit] == 0:
+
+      return f'{size // _UNITS[unit]}{unit}'
+
+  return str(size)
+
+class _Generator:
+
+  # Emits valid gehu programs: every name is declared before it is used,
+
+  # in a scope that can see it, only vars are assigned, and no name is
+
+  # declared twice or shadowed, so the analyzer reports nothing and
+
+  # optimizes. The same seed and knobs always give the same source.
+
+  def __init__(self, seed: int, identifier_density: float, string_length: int, comment_ratio: float, nesting: int):
+
+    self.random = random.Random(seed)
+
+    self.identifier_density = identifier_density
+
+    self.string_length = string_length
+
+    self.comment_ratio = comment_ratio
+
+    self.nesting = nesting
+
+    self.names = 0
+
+    # Per open scope, the vars and the other names (consts, functions,
+
+    # parameters) declared in it
+
+    self.scopes = [([], [])]
+
+  def name(self, prefix: str) -> str:
+
+    self.names += 1
+
+    return f'{prefix}{self.names}'
+
+  def pick(self, assignable: bool) -> Optional[str]:
+
+    # A name visible here, any one as likely as another, or None; chosen by
+
+    # index rather than by listing all of them, as the top-level scope of a
+
+    # big source holds many
+
+    lists = [variables for variables, _ in self.scopes]
+
+    if not assignable:
+
+      lists += [others for _, others in self.scopes]
+
+    index = int(self.random.random() * sum(map(len, lists)))
+
+    for names in lists:
+
+      if index < len(names):
+
+        return names[index]
+
+      index -= len(names)
+
+    return None
+
+  def string(self) -> str:
+
+    length = max(0, int(self.random.expovariate(1 / self.string_length))) if self.string_length else 0
+
+    return '"' + ''.join(self.random.choices(_LETTERS, k=length)) + '"'
+
+  def operand(self) -> str:
+
+    rng = self.random
+
+    if rng.random() < self.identifier_density:
+
+      name = self.pick(False)
+
+      if name is not None:
+
+        return name
+
+    if rng.random() < 0.2:
+
+      return self.string()
+
+    # Never 0, so nothing divides by zero
+
+    return str(rng.randint(1, 999))
+
+  def expression(self) -> str:
+
+    rng = self.random
+
+    parts = [self.operand()]
+
+    for _ in range(rng.randint(0, 3)):
+
+      parts += [rng.choice('+-*/'), self.operand()]
+
+    expression = ' '.join(parts)
+
+    if rng.random() < 0.2:
+
+      expression = f'({expression})'
+
+    return expression
+
+  def condition(self) -> str:
+
+    return f"{self.operand()} {self.random.choice(('==', '!='))} {self.operand()}"
+
+  def comment(self, indent: str) -> str:
+
+    return f"{indent}# {' '.join(self.random.choices(_WORDS, k=self.random.randint(2, 8)))}\n"
+
+  def block(self, depth: int, in_function: bool, variables=(), others=()) -> str:
+
+    self.scopes.append((list(variables), list(others)))
+
+    body = ''.join(self.statement(depth + 1, in_function) for _ in range(self.random.randint(1, 4)))
+
+    if in_function and self.random.random() < 0.5:
+
+      body += f"{'  ' * (depth + 1)}return {self.expression()};\n"
+
+    self.scopes.pop()
+
+    return '{\n' + body + '  ' * depth + '}'
+
+  def statement(self, depth: int = 0, in_function: bool = False) -> str:
+
+    rng = self.random
+
+    indent = '  ' * depth
+
+    text = self.comment(indent) if rng.random() < self.comment_ratio else ''
+
+    variables, others = self.scopes[-1]
+
+    roll = rng.random()
+
+    if depth < self.nesting and roll < 0.3:
+
+      kind = rng.random()
+
+      if kind < 0.4:
+
+        text += f'{indent}if ({self.condition()}) {self.block(depth, in_function)}'
+
+        if rng.random() < 0.4:
+
+          text += f' else {self.block(depth, in_function)}'
+
+        return text + '\n'
+
+      if kind < 0.6:
+
+        return text + f'{indent}while ({self.condition()}) {self.block(depth, in_function)}\n'
+
+      if kind < 0.8:
+
+        counter = self.name('i')
+
+        # The counter is declared before the condition is generated, in the
+
+        # loop's own scope
+
+        self.scopes.append(([counter], []))
+
+        header = f'var {counter} = 0; {counter} != {rng.randint(1, 99)}; {counter} = {counter} + 1'
+
+        body = self.block(depth, in_function)
+
+        self.scopes.pop()
+
+        return text + f'{indent}for ({header}) {body}\n'
+
+      function = self.name('f')
+
+      parameters = [self.name('p') for _ in range(rng.randint(0, 3))]
+
+      # Declared first, so the body may call it
+
+      others.append(function)
+
+      return text + f"{indent}function {function}({', '.join(parameters)}) {self.block(depth, True, (), parameters)}\n"
+
+    target = self.pick(True) if roll >= 0.65 else None
+
+    if roll < 0.55 or (roll >= 0.65 and target is None):
+
+      name = self.name('v')
+
+      text += f'{indent}var {name} = {self.expression()};\n'
+
+      variables.append(name)
+
+      return text
+
+    if roll < 0.65:
+
+      name = self.name('c')
+
+      text += f'{indent}const {name} = {self.expression()};\n'
+
+      others.append(name)
+
+      return text
+
+    if roll < 0.9:
+
+      return text + f'{indent}{target} = {self.expression()};\n'
+
+    return text + f'{indent}print({self.expression()});\n'
+
+def iter_corpus(size: int, seed: int = 0, **knobs) -> Iterator[str]:
+
+  # Top-level statements until at least size characters have been yielded;
+
+  # the last one may run past size, as the program is never cut short
+
+  generator = _Generator(seed, **{**DEFAULTS, **knobs})
+
+  written = 0
+
+  while written < size:
+
+    statement = generator.statement()
+
+    written += len(statement)
+
+    yield statement
+
+def generate(size: int, seed: int = 0, **knobs) -> str:
+
+  # A deterministic gehu program of about size characters (all ASCII, so
+
+  # also bytes); knobs override DEFAULTS
+
+  return ''.join(iter_corpus(size, seed, **knobs))
+
+def write_corpus(out: TextIO, size: int, seed: int = 0, **knobs):
+
+  # generate() straight to out, for sizes not worth holding in memory
+
+  for statement in iter_corpus(size, seed, **knobs):
+
+    out.write(statement)
+
+def main():
+
+  parser = argparse.ArgumentParser(description="Write a deterministic synthetic gehu program")
+
+  parser.add_argument('size', help='Approximate size, like 1K, 10M or 100MB')
+
+  parser.add_argument('-o', '--output', help='File to write (default: standard output)')
+
+  parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+
+  parser.add_argument('--identifier-density', type=float, default=DEFAULTS['identifier_density'], help='Chance that an operand is a name (default: %(default)s)')
+
+  parser.add_argument('--string-length', type=int, default=DEFAULTS['string_length'], help='Mean string literal length (default: %(default)s)')
+
+  parser.add_argument('--comment-ratio', type=float, default=DEFAULTS['comment_ratio'], help='Chance of a comment before a statement (default: %(default)s)')
+
+  parser.add_argument('--nesting', type=int, default=DEFAULTS['nesting'], help='Deepest block nesting (default: %(default)s)')
+
+  args = parser.parse_args()
+
+  try:
+
+    size = parse_size(args.size)
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  knobs = {name: getattr(args, name) for name in DEFAULTS}
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='ascii') as f:
+
+      write_corpus(f, size, args.seed, **knobs)
+
+  else:
+
+    write_corpus(sys.stdout, size, args.seed, **knobs)
+
+if __name__ == "__main__":
+
+  main()
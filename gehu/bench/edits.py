@@ -0,0 +1,251 @@
+import argparse
+
+import gc
+
+import json
+
+import random
+
+import sys
+
+import time
+
+from statistics import median
+
+from typing import Dict, List
+
+import gehu
+
+from gehu import Lexer, SemanticAnalyzer, analyze_code
+
+from gehu.bench.corpus import format_size, generate, parse_size
+
+from gehu.incremental import Document
+
+# Incremental re-lexing against analyzing the whole source again, run with
+
+# python -m gehu.bench.edits. A generated source is analyzed with
+
+# analyze_code, then loaded into a Document and edited as if typed into:
+
+# the cursor jumps to a random statement every --keystrokes edits, and
+
+# each edit inserts a space or a newline at it, or deletes one it inserted.
+
+# Each kind of edit is timed on its own; the first one after a jump also
+
+# moves the gap buffer there. The Document is then checked against a fresh
+
+# lex, declaration scan and analyze_code of its source.
+
+DEFAULT_SIZE = '4M'
+
+KINDS = ('space', 'newline', 'backspace', 'jump')
+
+def type_into(document: Document, edits: int, keystrokes: int, seed: int = 0) -> Dict[str, List[float]]:
+
+  # Seconds of each edit, by kind
+
+  rng = random.Random(seed)
+
+  times = {kind: [] for kind in KINDS}
+
+  cursor = typed = 0
+
+  for count in range(edits):
+
+    if count % keystrokes == 0:
+
+      source = document.source
+
+      cursor = source.find(';', rng.randrange(len(source))) + 1 or len(source)
+
+      typed = 0
+
+      kind = 'jump'
+
+    else:
+
+      kind = rng.choice(('space', 'newline', 'backspace') if typed else ('space', 'newline'))
+
+    if kind == 'backspace':
+
+      start = time.perf_counter()
+
+      document.edit(cursor - 1, 1, '')
+
+      elapsed = time.perf_counter() - start
+
+      cursor -= 1
+
+      typed -= 1
+
+    else:
+
+      start = time.perf_counter()
+
+      document.edit(cursor, 0, '\n' if kind == 'newline' else ' ')
+
+      elapsed = time.perf_counter() - start
+
+      cursor += 1
+
+      typed += 1
+
+    times[kind].append(elapsed)
+
+  return times
+
+def check(document: Document):
+
+  # Raises AssertionError unless document matches a fresh analysis of its
+
+  # source
+
+  source = document.source
+
+  lexer = Lexer(source, max_errors=sys.maxsize)
+
+  tokens = lexer.tokenize_buffer()
+
+  if bytes(document.types) != tokens.types.tobytes() or list(document.buffer().starts) != list(tokens.starts):
+
+    raise AssertionError("The edited document's tokens differ from a fresh lex")
+
+  analyzer = SemanticAnalyzer(0)
+
+  analyzer.analyze_indexed(tokens.types, tokens)
+
+  if dict(document.declared) != analyzer.symbol_table or document.lexical_errors != lexer.errors:
+
+    raise AssertionError("The edited document's declarations differ from a fresh scan")
+
+  if document.errors != analyze_code(source)['semantic_errors']:
+
+    raise AssertionError("The edited document's errors differ from analyze_code")
+
+def run_edits(size: int, edits: int = 2000, keystrokes: int = 50, repeat: int = 1, seed: int = 0) -> Dict:
+
+  # Milliseconds per kind of edit against seconds of a full analyze_code
+
+  source = generate(size, seed)
+
+  saved_cache = gehu.analysis_cache
+
+  # A cached result would time the cache, not the analysis
+
+  gehu.analysis_cache = None
+
+  try:
+
+    full = None
+
+    for _ in range(repeat):
+
+      gc.collect()
+
+      start = time.perf_counter()
+
+      analyze_code(source)
+
+      elapsed = time.perf_counter() - start
+
+      full = elapsed if full is None else min(full, elapsed)
+
+    start = time.perf_counter()
+
+    document = Document(source)
+
+    load = time.perf_counter() - start
+
+    times = type_into(document, edits, keystrokes, seed)
+
+    check(document)
+
+  finally:
+
+    gehu.analysis_cache = saved_cache
+
+  result = {'size': size, 'bytes': len(source), 'lines': source.count('\n') + 1, 'tokens': len(document), 'analyze_code_seconds': full, 'load_seconds': load, 'edits': {}}
+
+  for kind in KINDS:
+
+    milliseconds = sorted(seconds * 1000 for seconds in times[kind])
+
+    if not milliseconds:
+
+      continue
+
+    record = {'count': len(milliseconds), 'median_ms': median(milliseconds), 'p90_ms': milliseconds[len(milliseconds) * 9 // 10], 'max_ms': milliseconds[-1]}
+
+    record['speedup'] = full * 1000 / record['median_ms']
+
+    result['edits'][kind] = record
+
+  return result
+
+def _log(kind: str, record: Dict):
+
+  print(f" {kind:>10} {record['count']:>6} {record['median_ms']:>9.3f} {record['p90_ms']:>9.3f} {record['max_ms']:>9.3f} {record['speedup']:>9.0f}x")
+
+def main():
+
+  parser = argparse.ArgumentParser(prog='python -m gehu.bench.edits', description='Time Document.edit against a full analyze_code on a generated source')
+
+  parser.add_argument('--size', default=DEFAULT_SIZE, help=f'Source size (default: {DEFAULT_SIZE})')
+
+  parser.add_argument('--edits', type=int, default=2000, help='Edits to time (default: 2000)')
+
+  parser.add_argument('--keystrokes', type=int, default=50, help='Edits at the cursor before it jumps elsewhere (default: 50)')
+
+  parser.add_argument('--repeat', type=int, default=1, help='Timed runs of analyze_code; the fastest counts (default: 1)')
+
+  parser.add_argument('--seed', type=int, default=0, help='Corpus and edit seed (default: 0)')
+
+  parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+
+  args = parser.parse_args()
+
+  try:
+
+    size = parse_size(args.size)
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  for name in ('edits', 'keystrokes', 'repeat'):
+
+    if getattr(args, name) < 1:
+
+      parser.error(f"--{name} must be at least 1")
+
+  print(f"Analyzing and editing a {format_size(size)} source")
+
+  try:
+
+    result = run_edits(size, args.edits, args.keystrokes, args.repeat, args.seed)
+
+  except AssertionError as e:
+
+    print(f"Error: {e}")
+
+    sys.exit(1)
+
+  print(f"{result['lines']} lines, {result['tokens']} tokens: analyze_code {result['analyze_code_seconds'] * 1000:.0f}ms, loading the Document {result['load_seconds'] * 1000:.0f}ms")
+
+  print(f" {'edit':>10} {'count':>6} {'median ms':>9} {'p90 ms':>9} {'max ms':>9} {'speedup':>10}")
+
+  for kind, record in result['edits'].items():
+
+    _log(kind, record)
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+
+      json.dump(result, f, indent=2)
+
+if __name__ == '__main__':
+
+  main()
@@ -0,0 +1,207 @@
+import argparse
+
+import json
+
+import sys
+
+import timeit
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+from gehu import Lexer
+
+from gehu.vectorized import np
+
+from gehu.bench.corpus import format_size, generate, parse_size
+
+# Throughput of the lexer engines, run with python -m gehu.bench.engines.
+
+# Each size of generated source is lexed by each engine, the fastest of
+
+# --repeat timings counting (see fastest):
+
+# tokenize() builds a Token per token, as the original 'char' scanner
+
+# does, and tokenize_buffer() fills the columns analyze_code parses.
+
+# Every engine's tokens are checked against the 'char' engine's.
+
+#
+
+# The numpy engine pays a fixed cost to set up its arrays, so it only wins
+
+# from some size on: the break-even size is the smallest size measured from
+
+# which its tokenize_buffer() beats the regex engine's at every larger one.
+
+DEFAULT_SIZES = ('256', '1K', '4K', '16K', '256K', '1M')
+
+# Engine and API of each row, in the order they are shown
+
+RUNS = (('char', 'tokenize'), ('regex', 'tokenize'), ('regex', 'buffer'), ('numpy', 'buffer'))
+
+def _tokenize(engine: str) -> Callable:
+
+  return lambda source: Lexer(source, engine).tokenize()
+
+def _buffer(engine: str) -> Callable:
+
+  return lambda source: Lexer(source, engine).tokenize_buffer()
+
+def fastest(run: Callable, argument, repeat: int) -> float:
+
+  # Seconds per run, the fastest of repeat timings of as many runs as take
+
+  # 0.2s, so that sources of a few hundred bytes time steadily too
+
+  timer = timeit.Timer(lambda: run(argument))
+
+  number = timer.autorange()[0]
+
+  return min(timer.repeat(repeat, number)) / number
+
+def tokens(engine: str, api: str, source: str) -> List:
+
+  # (type, offset, value) of each token, to compare engines by
+
+  if api == 'tokenize':
+
+    return [(token.type, token.offset, token.value) for token in Lexer(source, engine).tokenize()]
+
+  buffer = Lexer(source, engine).tokenize_buffer()
+
+  return [(buffer.type(index), buffer.offset(index), buffer.text(index)) for index in range(len(buffer))]
+
+def run_engines(sizes: Sequence[int], runs: Sequence = RUNS, repeat: int = 3, seed: int = 0, log: Optional[Callable] = None) -> List[Dict]:
+
+  # One record per size and run; speedup is against the first run
+
+  records = []
+
+  for size in sizes:
+
+    source = generate(size, seed)
+
+    expected = tokens('char', 'tokenize', source)
+
+    first = None
+
+    for engine, api in runs:
+
+      if tokens(engine, api, source) != expected:
+
+        raise AssertionError(f"The {engine} engine's {api} lexed {format_size(size)} differently from the char engine")
+
+      run = _tokenize(engine) if api == 'tokenize' else _buffer(engine)
+
+      seconds = fastest(run, source, repeat)
+
+      first = first or seconds
+
+      record = {'size': size, 'bytes': len(source), 'tokens': len(expected), 'engine': engine, 'api': api, 'seconds': seconds, 'speedup': first / seconds, 'mb_per_second': len(source) / seconds / (1 << 20)}
+
+      records.append(record)
+
+      if log is not None:
+
+        log(record)
+
+  return records
+
+def break_even(records: Sequence[Dict]) -> Optional[int]:
+
+  # The break-even size of the numpy engine in records, or None if it does
+
+  # not beat the regex engine at the largest size
+
+  seconds = {(record['size'], record['engine']): record['seconds'] for record in records if record['api'] == 'buffer'}
+
+  found = None
+
+  for size in sorted({size for size, _ in seconds}, reverse=True):
+
+    numpy_seconds = seconds.get((size, 'numpy'))
+
+    if numpy_seconds is None or numpy_seconds >= seconds[size, 'regex']:
+
+      break
+
+    found = size
+
+  return found
+
+def _log(record: Dict):
+
+  print(f" {format_size(record['size']):>6} {record['engine']:>6} {record['api']:>9} {record['seconds'] * 1000:>10.2f}ms {record['speedup']:>7.2f}x {record['mb_per_second']:>7.2f}")
+
+def main():
+
+  parser = argparse.ArgumentParser(prog='python -m gehu.bench.engines', description='Time the lexer engines on generated sources of several sizes')
+
+  parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help=f"Comma-separated source sizes (default: {','.join(DEFAULT_SIZES)})")
+
+  parser.add_argument('--repeat', type=int, default=3, help='Timings per size and engine; the fastest counts (default: 3)')
+
+  parser.add_argument('--seed', type=int, default=0, help='Corpus seed (default: 0)')
+
+  parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+
+  args = parser.parse_args()
+
+  try:
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  if args.repeat < 1:
+
+    parser.error("--repeat must be at least 1")
+
+  runs = RUNS
+
+  if np is None:
+
+    # The numpy engine would fall back to the regex engine and time that
+
+    print("NumPy is not installed; leaving out the numpy engine")
+
+    runs = [run for run in RUNS if run[0] != 'numpy']
+
+  print(f" {'size':>6} {'engine':>6} {'api':>9} {'time':>12} {'speedup':>8} {'MB/s':>7}")
+
+  try:
+
+    records = run_engines(sizes, runs, args.repeat, args.seed, _log)
+
+  except AssertionError as e:
+
+    print(f"Error: {e}")
+
+    sys.exit(1)
+
+  size = None
+
+  if np is not None:
+
+    size = break_even(records)
+
+    if size is None:
+
+      print("The numpy engine is not faster than the regex engine at the largest size")
+
+    else:
+
+      print(f"The numpy engine is faster than the regex engine from {format_size(size)} on")
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+
+      json.dump({'break_even': size, 'records': records}, f, indent=2)
+
+if __name__ == '__main__':
+
+  main()
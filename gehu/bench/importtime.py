@@ -0,0 +1,149 @@
+import argparse
+
+import os
+
+import re
+
+import subprocess
+
+import sys
+
+import tempfile
+
+from typing import Dict, List, Tuple
+
+# Checks how long gehu takes to start, from the modules each command imports
+
+# under python -X importtime. The interpreter's own startup modules are left
+
+# out, so the budget is what gehu adds; the fastest of --repeat runs counts.
+
+DEFAULT_BUDGET_MS = 60.0
+
+DEFAULT_REPEAT = 5
+
+# Modules only AI commands may import
+
+DEFERRED = ('google.generativeai', 'dotenv')
+
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# What each scenario runs, after the interpreter's arguments
+
+_MAIN = "import sys; import gehu; sys.argv = ['gehu'] + sys.argv[1:]; gehu.main()"
+
+def scenarios(program: str) -> Dict[str, List[str]]:
+
+  return {
+
+    'import gehu': ['-c', 'import gehu'],
+
+    '--help': ['-c', _MAIN, '--help'],
+
+    'analyze': ['-c', _MAIN, 'analyze', program, '--no-cache', '--no-server'],
+
+  }
+
+def import_times(arguments: List[str]) -> Dict[str, Tuple[int, int, int]]:
+
+  # Per module imported, its self and cumulative microseconds and its depth,
+
+  # 1 for a module imported by no other
+
+  result = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, capture_output=True, text=True)
+
+  modules = {}
+
+  for line in result.stderr.splitlines():
+
+    match = _LINE.match(line)
+
+    if match:
+
+      own, cumulative, indent, name = match.groups()
+
+      modules[name] = (int(own), int(cumulative), len(indent))
+
+  return modules
+
+def measure(arguments: List[str], baseline: set, repeat: int) -> Tuple[float, Dict[str, Tuple[int, int, int]]]:
+
+  # The fastest run's total in milliseconds, and its modules other than
+
+  # the interpreter's own
+
+  best = None
+
+  for _ in range(repeat):
+
+    modules = {name: times for name, times in import_times(arguments).items() if name not in baseline}
+
+    # Only outermost imports, as the cumulative times of nested ones are
+
+    # part of theirs
+
+    total = sum(cumulative for _, cumulative, depth in modules.values() if depth == 1) / 1000
+
+    if best is None or total < best[0]:
+
+      best = (total, modules)
+
+  return best
+
+def main():
+
+  parser = argparse.ArgumentParser(description="Check gehu's import time against a budget")
+
+  parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='Most milliseconds of imports a scenario may take (default: %(default)s)')
+
+  parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Runs per scenario, the fastest counting (default: %(default)s)')
+
+  parser.add_argument('--top', type=int, default=5, help='Slowest modules to list per scenario (default: %(default)s)')
+
+  args = parser.parse_args()
+
+  baseline = set(import_times(['-c', 'pass']))
+
+  failed = False
+
+  with tempfile.TemporaryDirectory() as directory:
+
+    program = os.path.join(directory, 'program.g')
+
+    with open(program, 'w') as f:
+
+      f.write('var x = 1 + 2; print(x);\n')
+
+    for name, arguments in scenarios(program).items():
+
+      total, modules = measure(arguments, baseline, args.repeat)
+
+      deferred = sorted(module for module in modules if any(module == d or module.startswith(d + '.') for d in DEFERRED))
+
+      status = 'ok'
+
+      if total > args.budget_ms:
+
+        status = f'over budget of {args.budget_ms:g} ms'
+
+        failed = True
+
+      if deferred:
+
+        status = f"imports {', '.join(deferred)}"
+
+        failed = True
+
+      print(f"{name:<12} {total:>8.1f} ms  {status}")
+
+      slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+
+      for module, (own, cumulative, _) in slowest:
+
+        print(f"  {module:<40} {own / 1000:>7.1f} ms self {cumulative / 1000:>7.1f} ms cumulative")
+
+  sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+
+  main()
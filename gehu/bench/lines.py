@@ -0,0 +1,207 @@
+import argparse
+
+import json
+
+import sys
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+from gehu import Lexer, LineIndex
+
+from gehu.bench.corpus import format_size, generate, parse_size
+
+from gehu.bench.suite import measure
+
+# What looking lines up in a LineIndex saves over counting them per
+
+# character, run with python -m gehu.bench.lines. For each size of generated
+
+# source, the fastest of --repeat rounds, each of which times in turn:
+
+#   tracked: stepping through every character with the advance() the char
+
+#     engine had before, which also kept line and column up to date
+
+#   advance: stepping through it with Lexer.advance() as it is now
+
+#   index: building the source's LineIndex
+
+#   lookup: the line and column of every token from that index
+
+# Times are per character, but for lookups per token, as they are only made
+
+# for tokens and diagnostics that are shown. The saving is tracked less
+
+# advance, against which the index costs a little per character.
+
+DEFAULT_SIZES = ('100K', '1M')
+
+class _TrackingLexer:
+
+  # A frozen copy of the char engine's cursor as it was, counting lines and
+
+  # columns on every character
+
+  def __init__(self, source: str):
+
+    self.source = source
+
+    self.position = 0
+
+    self.line = 1
+
+    self.column = 1
+
+    self.current_char = source[0] if source else None
+
+  def advance(self):
+
+    self.position += 1
+
+    self.column += 1
+
+    if self.position >= len(self.source):
+
+      self.current_char = None
+
+    else:
+
+      self.current_char = self.source[self.position]
+
+      if self.current_char == '\n':
+
+        self.line += 1
+
+        self.column = 0
+
+def _walk(lexer):
+
+  advance = lexer.advance
+
+  while lexer.current_char is not None:
+
+    advance()
+
+  return lexer
+
+def _tracked(source: str):
+
+  return _walk(_TrackingLexer(source))
+
+def _advance(source: str):
+
+  return _walk(Lexer(source))
+
+def _lookup(prepared):
+
+  index, starts = prepared
+
+  position = index.position
+
+  for start in starts:
+
+    position(start)
+
+def run_lines(sizes: Sequence[int], repeat: int = 5, seed: int = 0, log: Optional[Callable] = None) -> List[Dict]:
+
+  records = []
+
+  for size in sizes:
+
+    source = generate(size, seed)
+
+    lines = source.count('\n') + 1
+
+    if _tracked(source).line != lines or len(LineIndex(source).starts) != lines:
+
+      raise AssertionError(f"Lines of the {format_size(size)} source were miscounted")
+
+    starts = Lexer(source).tokenize_buffer().starts
+
+    record = {'size': size, 'bytes': len(source), 'lines': lines, 'tokens': len(starts)}
+
+    runs = (('tracked', _tracked, source), ('advance', _advance, source), ('index', LineIndex, source), ('lookup', _lookup, (LineIndex(source), starts)))
+
+    # Taken in rounds, so that a moment of load slows one round of all of
+
+    # them rather than one of them
+
+    seconds = {}
+
+    for _ in range(repeat):
+
+      for name, run, argument in runs:
+
+        elapsed = measure(run, argument, 1, traced=False)['seconds']
+
+        seconds[name] = min(seconds.get(name, elapsed), elapsed)
+
+    for name in ('tracked', 'advance', 'index'):
+
+      record[name + '_ns_per_char'] = seconds[name] * 1e9 / len(source)
+
+    record['lookup_ns_per_token'] = seconds['lookup'] * 1e9 / len(starts)
+
+    record['saved_ns_per_char'] = record['tracked_ns_per_char'] - record['advance_ns_per_char']
+
+    records.append(record)
+
+    if log is not None:
+
+      log(record)
+
+  return records
+
+def _log(record: Dict):
+
+  print(f" {format_size(record['size']):>6} {record['tracked_ns_per_char']:>8.1f} {record['advance_ns_per_char']:>8.1f} {record['saved_ns_per_char']:>8.1f} {record['index_ns_per_char']:>8.2f} {record['lookup_ns_per_token']:>13.1f}")
+
+def main():
+
+  parser = argparse.ArgumentParser(prog='python -m gehu.bench.lines', description='Time counting lines per character against a LineIndex built once')
+
+  parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help=f"Comma-separated source sizes (default: {','.join(DEFAULT_SIZES)})")
+
+  parser.add_argument('--repeat', type=int, default=5, help='Rounds of timings per size; the fastest of each counts (default: 5)')
+
+  parser.add_argument('--seed', type=int, default=0, help='Corpus seed (default: 0)')
+
+  parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+
+  args = parser.parse_args()
+
+  try:
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  if args.repeat < 1:
+
+    parser.error("--repeat must be at least 1")
+
+  print("Nanoseconds per character, and per token for lookups")
+
+  print(f" {'size':>6} {'tracked':>8} {'advance':>8} {'saved':>8} {'index':>8} {'lookup/token':>13}")
+
+  try:
+
+    records = run_lines(sizes, args.repeat, args.seed, _log)
+
+  except AssertionError as e:
+
+    print(f"Error: {e}")
+
+    sys.exit(1)
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+
+      json.dump({'records': records}, f, indent=2)
+
+if __name__ == '__main__':
+
+  main()
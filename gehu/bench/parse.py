@@ -0,0 +1,119 @@
+import argparse
+
+import json
+
+import sys
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+from gehu import Lexer
+
+from gehu.bench.corpus import format_size, generate, parse_size
+
+from gehu.bench.suite import measure
+
+from gehu.parser import Parser
+
+# Parse throughput and the memory of the syntax tree, run with
+
+# python -m gehu.bench.parse. Each size of generated source is lexed into a
+
+# TokenBuffer untimed, then parsed, the fastest of --repeat runs counting.
+
+# Bytes per node are given twice: what the Ast's arrays hold (Ast.nbytes),
+
+# and the peak memory tracemalloc traces while parsing, which also counts
+
+# the arrays' spare capacity and the parser's own state.
+
+DEFAULT_SIZES = ('100K', '1M')
+
+def _parse(tokens):
+
+  return Parser(tokens).parse()
+
+def run_parse(sizes: Sequence[int], repeat: int = 3, seed: int = 0, log: Optional[Callable] = None) -> List[Dict]:
+
+  records = []
+
+  for size in sizes:
+
+    source = generate(size, seed)
+
+    tokens = Lexer(source).tokenize_buffer()
+
+    parser = Parser(tokens)
+
+    ast = parser.parse()
+
+    if parser.errors:
+
+      raise AssertionError(f"The generated {format_size(size)} source does not parse: {parser.errors[0]}")
+
+    result = measure(_parse, tokens, repeat)
+
+    seconds = result['seconds']
+
+    nodes = len(ast)
+
+    record = {'size': size, 'bytes': len(source), 'tokens': len(tokens), 'nodes': nodes, 'seconds': seconds, 'tokens_per_second': len(tokens) / seconds, 'mb_per_second': len(source) / seconds / (1 << 20), 'ast_bytes_per_node': ast.nbytes() / nodes, 'peak_bytes_per_node': result['peak_bytes'] / nodes}
+
+    records.append(record)
+
+    if log is not None:
+
+      log(record)
+
+  return records
+
+def _log(record: Dict):
+
+  print(f" {format_size(record['size']):>6} {record['tokens']:>9} {record['nodes']:>9} {record['seconds']:>8.3f}s {record['tokens_per_second'] / 1e6:>9.2f}M {record['mb_per_second']:>7.2f} {record['ast_bytes_per_node']:>10.1f} {record['peak_bytes_per_node']:>11.1f}")
+
+def main():
+
+  parser = argparse.ArgumentParser(prog='python -m gehu.bench.parse', description='Time parsing generated sources and measure the syntax tree per node')
+
+  parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help=f"Comma-separated source sizes (default: {','.join(DEFAULT_SIZES)})")
+
+  parser.add_argument('--repeat', type=int, default=3, help='Timed runs per size, more for small sizes; the fastest counts (default: 3)')
+
+  parser.add_argument('--seed', type=int, default=0, help='Corpus seed (default: 0)')
+
+  parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+
+  args = parser.parse_args()
+
+  try:
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  if args.repeat < 1:
+
+    parser.error("--repeat must be at least 1")
+
+  print(f" {'size':>6} {'tokens':>9} {'nodes':>9} {'time':>9} {'tokens/s':>10} {'MB/s':>7} {'AST B/node':>10} {'peak B/node':>11}")
+
+  try:
+
+    records = run_parse(sizes, args.repeat, args.seed, _log)
+
+  except AssertionError as e:
+
+    print(f"Error: {e}")
+
+    sys.exit(1)
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+
+      json.dump({'records': records}, f, indent=2)
+
+if __name__ == '__main__':
+
+  main()
@@ -0,0 +1,189 @@
+import argparse
+
+import gc
+
+import json
+
+import mmap
+
+import os
+
+import sys
+
+import tempfile
+
+import time
+
+from array import array
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from gehu import Lexer
+
+from gehu.bench.corpus import format_size, parse_size, write_corpus
+
+from gehu.parallel import MIN_CHUNK
+
+# How parallel lexing (gehu.parallel) scales with the number of workers,
+
+# run with python -m gehu.bench.scaling. Each size of generated source is
+
+# written to a file and lexed from an mmap as gehu analyze does, serially
+
+# and then with each number of workers, the fastest of --repeat runs
+
+# counting. Every parallel result is checked against the serial one.
+
+DEFAULT_SIZES = ('16M', '64M')
+
+DEFAULT_WORKERS = (2, 4, 8)
+
+def lex(data, workers: int) -> Tuple[array, array, array]:
+
+  # The token columns only, so no view of data outlives the call
+
+  buffer = Lexer.from_bytes(data).tokenize_buffer(workers)
+
+  return buffer.types, buffer.starts, buffer.lengths
+
+def fastest(data, workers: int, repeat: int) -> Tuple[float, Tuple[array, array, array]]:
+
+  seconds = None
+
+  for _ in range(repeat):
+
+    gc.collect()
+
+    start = time.perf_counter()
+
+    columns = lex(data, workers)
+
+    elapsed = time.perf_counter() - start
+
+    seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+  return seconds, columns
+
+def run_scaling(sizes: Sequence[int], workers: Sequence[int], repeat: int = 3, seed: int = 0, log: Optional[Callable] = None) -> List[Dict]:
+
+  # One record per size and number of workers, serial (1 worker) first;
+
+  # bytes is the generated size, which runs a little past size
+
+  records = []
+
+  with tempfile.TemporaryDirectory() as directory:
+
+    path = os.path.join(directory, 'source.g')
+
+    for size in sizes:
+
+      with open(path, 'w', encoding='ascii') as f:
+
+        write_corpus(f, size, seed)
+
+      with open(path, 'rb') as f:
+
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+      try:
+
+        serial_seconds, serial = fastest(data, 1, repeat)
+
+        for count in [1] + [count for count in workers if count != 1]:
+
+          if count == 1:
+
+            seconds = serial_seconds
+
+          else:
+
+            seconds, columns = fastest(data, count, repeat)
+
+            if columns != serial:
+
+              raise AssertionError(f"{count} workers lexed {format_size(size)} differently from one")
+
+          record = {'size': size, 'bytes': len(data), 'workers': count, 'seconds': seconds, 'speedup': serial_seconds / seconds, 'mb_per_second': len(data) / seconds / (1 << 20)}
+
+          records.append(record)
+
+          if log is not None:
+
+            log(record)
+
+      finally:
+
+        data.close()
+
+  return records
+
+def _log(record: Dict):
+
+  print(f" {format_size(record['size']):>8} {record['workers']:>8} {record['seconds']:>9.2f}s {record['speedup']:>7.2f}x {record['mb_per_second']:>8.1f}")
+
+def main():
+
+  parser = argparse.ArgumentParser(prog='python -m gehu.bench.scaling', description='Time parallel lexing of generated sources with different numbers of workers')
+
+  parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help=f"Comma-separated source sizes (default: {','.join(DEFAULT_SIZES)})")
+
+  parser.add_argument('--workers', default=','.join(map(str, DEFAULT_WORKERS)), help=f"Comma-separated numbers of workers, each compared with one (default: {','.join(map(str, DEFAULT_WORKERS))})")
+
+  parser.add_argument('--repeat', type=int, default=3, help='Timed runs per size and number of workers; the fastest counts (default: 3)')
+
+  parser.add_argument('--seed', type=int, default=0, help='Corpus seed (default: 0)')
+
+  parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+
+  args = parser.parse_args()
+
+  try:
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+    workers = [int(count) for count in args.workers.split(',')]
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  if any(count < 1 for count in workers):
+
+    parser.error("--workers must be at least 1")
+
+  if args.repeat < 1:
+
+    parser.error("--repeat must be at least 1")
+
+  cpus = os.cpu_count() or 1
+
+  print(f"Lexing from an mmap on {cpus} CPU{'s' if cpus != 1 else ''}, fastest of {args.repeat} runs")
+
+  print(f"Sources under {format_size(2 * MIN_CHUNK)} are always lexed serially")
+
+  if max(workers) > cpus:
+
+    print(f"At most {cpus} workers run at once here; beyond that the times measure overhead, not speedup")
+
+  print(f" {'size':>8} {'workers':>8} {'seconds':>10} {'speedup':>8} {'MB/s':>8}")
+
+  try:
+
+    records = run_scaling(sizes, workers, args.repeat, args.seed, _log)
+
+  except AssertionError as e:
+
+    print(f"Error: {e}")
+
+    sys.exit(1)
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+
+      json.dump({'cpus': cpus, 'records': records}, f, indent=2)
+
+if __name__ == '__main__':
+
+  main()
@@ -0,0 +1,179 @@
+import argparse
+
+import json
+
+import sys
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+from gehu import Lexer, TokenType
+
+from gehu.bench.corpus import format_size, parse_size
+
+from gehu.bench.suite import measure
+
+from gehu.parser import Parser
+
+from gehu.scopes import Resolver
+
+# Name resolution through scopes (gehu.scopes) at depth and at volume, run
+
+# with python -m gehu.bench.scopes. Two kinds of source are generated:
+
+#   nesting: blocks nested --depths deep, each declaring a name and
+
+#     reading the one declared a level up and one declared outside them all
+
+#   identifiers: a thousand program-scope variables read and assigned from
+
+#     small blocks with a local of their own, up to --identifiers names
+
+# Each is parsed untimed, then resolved, the fastest of --repeat runs
+
+# counting. Time per identifier stays flat as they grow when lookups and
+
+# scope exits cost the same at any depth and size. Every source must
+
+# resolve without errors or warnings.
+
+DEFAULT_DEPTHS = ('1K', '10K', '100K')
+
+DEFAULT_IDENTIFIERS = ('10K', '100K', '1M')
+
+GLOBALS = 1000
+
+def nested_source(depth: int) -> str:
+
+  lines = ['var x0 = 0;\n']
+
+  lines.extend(f'{{ var x{level} = x{level - 1} + x0;\n' for level in range(1, depth + 1))
+
+  lines.append('}' * depth + '\n')
+
+  return ''.join(lines)
+
+def identifier_source(identifiers: int) -> str:
+
+  # Each block has 8 identifiers: its local three times, x{a}, x{b},
+
+  # x{c}, x{d} and print
+
+  lines = [f'var x{index} = {index};\n' for index in range(GLOBALS)]
+
+  for block in range(max(0, identifiers - GLOBALS) // 8):
+
+    a, b, c, d = [(block * 7919 + step * 104729) % GLOBALS for step in range(4)]
+
+    lines.append(f'{{ var t = x{a} + x{b}; x{c} = t * x{d}; print(t); }}\n')
+
+  return ''.join(lines)
+
+SOURCES = {
+
+  'nesting': nested_source,
+
+  'identifiers': identifier_source
+
+}
+
+def _resolve(ast):
+
+  Resolver(ast).resolve()
+
+def run_scopes(kind: str, counts: Sequence[int], repeat: int = 3, log: Optional[Callable] = None) -> List[Dict]:
+
+  records = []
+
+  for count in counts:
+
+    tokens = Lexer(SOURCES[kind](count)).tokenize_buffer()
+
+    parser = Parser(tokens)
+
+    ast = parser.parse()
+
+    resolver = Resolver(ast)
+
+    resolver.resolve()
+
+    problems = parser.errors + resolver.errors + resolver.warnings
+
+    if problems:
+
+      raise AssertionError(f"The {kind} source for {format_size(count)} does not resolve cleanly: {problems[0]}")
+
+    seconds = measure(_resolve, ast, repeat, traced=False)['seconds']
+
+    identifiers = tokens.types.count(TokenType.IDENTIFIER.value)
+
+    record = {'kind': kind, 'count': count, 'identifiers': identifiers, 'nodes': len(ast), 'seconds': seconds, 'ns_per_identifier': seconds * 1e9 / identifiers}
+
+    records.append(record)
+
+    if log is not None:
+
+      log(record)
+
+  return records
+
+def _log(record: Dict):
+
+  print(f" {record['kind']:>11} {format_size(record['count']):>6} {record['identifiers']:>11} {record['nodes']:>10} {record['seconds']:>9.3f}s {record['ns_per_identifier']:>9.0f}")
+
+def main():
+
+  parser = argparse.ArgumentParser(prog='python -m gehu.bench.scopes', description='Time name resolution on deeply nested sources and sources with many identifiers')
+
+  parser.add_argument('--depths', default=','.join(DEFAULT_DEPTHS), help=f"Comma-separated nesting depths (default: {','.join(DEFAULT_DEPTHS)})")
+
+  parser.add_argument('--identifiers', default=','.join(DEFAULT_IDENTIFIERS), help=f"Comma-separated numbers of identifiers (default: {','.join(DEFAULT_IDENTIFIERS)})")
+
+  parser.add_argument('--repeat', type=int, default=3, help='Timed runs per source, more for small ones; the fastest counts (default: 3)')
+
+  parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+
+  args = parser.parse_args()
+
+  try:
+
+    counts = {
+
+      'nesting': [parse_size(depth) for depth in args.depths.split(',')],
+
+      'identifiers': [parse_size(count) for count in args.identifiers.split(',')]
+
+    }
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  if args.repeat < 1:
+
+    parser.error("--repeat must be at least 1")
+
+  print(f" {'source':>11} {'count':>6} {'identifiers':>11} {'nodes':>10} {'time':>10} {'ns/ident':>9}")
+
+  records = []
+
+  try:
+
+    for kind in SOURCES:
+
+      records += run_scopes(kind, counts[kind], args.repeat, _log)
+
+  except AssertionError as e:
+
+    print(f"Error: {e}")
+
+    sys.exit(1)
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+
+      json.dump({'records': records}, f, indent=2)
+
+if __name__ == '__main__':
+
+  main()
@@ -0,0 +1,497 @@
+import argparse
+
+import gc
+
+import json
+
+import os
+
+import platform
+
+import re
+
+import sys
+
+import time
+
+import tracemalloc
+
+from array import array
+
+from collections import deque
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import gehu
+
+from gehu import Lexer, SemanticAnalyzer, analyze_code
+
+from gehu.bench.corpus import DEFAULTS, format_size, generate, parse_size
+
+# Benchmarks of the compiler front end on generated sources (see
+
+# gehu.bench.corpus), run with python -m gehu.bench. Each stage is timed on
+
+# each size, keeping the fastest of several runs, and its peak traced
+
+# memory is taken from one more run under tracemalloc. Results are saved as
+
+# JSON and compared with a baseline: a stage that got slower, or needs more
+
+# memory, by more than the threshold, and still is when timed again, fails
+
+# the run if the baseline was made on the same machine, or with --strict.
+
+# Bumped when stages, the corpus or the calibration change, so old baselines
+
+# are not compared
+
+SUITE_VERSION = 2
+
+DEFAULT_SIZES = ('1K', '100K', '1M')
+
+DEFAULT_THRESHOLD = 0.25
+
+# Small inputs are rerun until this long has been spent timing them, for a
+
+# steadier fastest run
+
+MIN_TIMING_SECONDS = 0.5
+
+# Shifts below this many seconds are timer noise, never a regression
+
+NOISE_SECONDS = 0.002
+
+# Times a stage that looks slower is timed again before it counts
+
+DEFAULT_RECHECKS = 2
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+def _chunks(source: str) -> List[str]:
+
+  return [source[start:start + gehu.CHUNK_SIZE] for start in range(0, len(source), gehu.CHUNK_SIZE)]
+
+def _lexed(source: str):
+
+  return Lexer(source).tokenize_buffer()
+
+def _analyzed(source: str) -> Tuple:
+
+  analyzer = SemanticAnalyzer(optimize=False)
+
+  if analyzer.analyze(_lexed(source)):
+
+    raise ValueError(f"generated source does not analyze cleanly: {analyzer.errors[0]}")
+
+  return analyzer.ast, analyzer.declarations
+
+def _lex(source: str):
+
+  Lexer(source).tokenize_buffer()
+
+def _lex_bytes(data: bytes):
+
+  Lexer.from_bytes(data).tokenize_buffer()
+
+def _lex_stream(chunks: List[str]):
+
+  deque(Lexer.from_chunks(chunks).iter_tokens(), 0)
+
+def _analyze(tokens):
+
+  SemanticAnalyzer(optimize=False).analyze(tokens)
+
+def _optimize(tree: Tuple):
+
+  from gehu.optimizer import Optimizer
+
+  Optimizer(*tree).optimize()
+
+def _analyze_code(source: str):
+
+  analyze_code(source)
+
+# Stage name: (prepare, run). prepare builds run's input from the source,
+
+# untimed and untraced; run is what gets measured.
+
+STAGES = {
+
+  'lex': (str, _lex),
+
+  'lex-bytes': (str.encode, _lex_bytes),
+
+  'lex-stream': (_chunks, _lex_stream),
+
+  'analyze': (_lexed, _analyze),
+
+  'optimize': (_analyzed, _optimize),
+
+  'analyze_code': (str, _analyze_code)
+
+}
+
+# The calibration: a frozen copy of the shape of the regex lexer's loop,
+
+# over a fixed text, so it costs what lexing costs on the machine without
+
+# moving when gehu's own lexer gets faster or slower
+
+_CALIBRATION_PATTERN = re.compile(r'(\s*)(?:(\w+)|"([^"]*)"|(==|!=|[-+*/=(){};,])|(#[^\n]*)|(.))')
+
+_CALIBRATION_KEYWORDS = frozenset(('var', 'const', 'function', 'if', 'else', 'while', 'for', 'return', 'print'))
+
+_CALIBRATION_TEXT = ''.join(f'var count{i} = {i} * (total + {i % 7});\nif (count{i} != 3) {{ print("item {i}"); }} # note\n' for i in range(1500))
+
+def _calibration(text: str):
+
+  types, starts = array('B'), array('l')
+
+  keywords = _CALIBRATION_KEYWORDS
+
+  for m in _CALIBRATION_PATTERN.finditer(text):
+
+    group = m.lastindex
+
+    if group == 2 and m.group(2) in keywords:
+
+      group = 0
+
+    types.append(group or 0)
+
+    starts.append(m.end(1))
+
+def calibrate() -> float:
+
+  return measure(_calibration, _CALIBRATION_TEXT, 5, traced=False)['seconds']
+
+def measure(run: Callable, argument, repeat: int, traced: bool = True) -> Dict:
+
+  # Fastest wall time of at least repeat runs, then the peak of one traced
+
+  # run
+
+  seconds = None
+
+  runs = total = 0
+
+  while runs < repeat or total < MIN_TIMING_SECONDS:
+
+    gc.collect()
+
+    start = time.perf_counter()
+
+    run(argument)
+
+    elapsed = time.perf_counter() - start
+
+    seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    runs += 1
+
+    total += elapsed
+
+  if not traced:
+
+    return {'seconds': seconds}
+
+  gc.collect()
+
+  tracemalloc.start()
+
+  try:
+
+    run(argument)
+
+    peak = tracemalloc.get_traced_memory()[1]
+
+  finally:
+
+    tracemalloc.stop()
+
+  return {'seconds': seconds, 'peak_bytes': peak}
+
+def run_suite(sizes: Sequence[int], stages: Sequence[str], repeat: int = 3, seed: int = 0, knobs: Optional[Dict] = None, log=None) -> Dict:
+
+  # Results keyed 'stage/size', plus what produced them
+
+  knobs = {**DEFAULTS, **(knobs or {})}
+
+  saved_cache = gehu.analysis_cache
+
+  # Cached results would time the cache, not the analyzer
+
+  gehu.analysis_cache = None
+
+  results = {}
+
+  # Taken again before each size, the fastest counting, so that a moment
+
+  # of load at the start does not scale every stage
+
+  calibration = calibrate()
+
+  try:
+
+    for size in sizes:
+
+      calibration = min(calibration, calibrate())
+
+      source = generate(size, seed, **knobs)
+
+      for stage in stages:
+
+        prepare, run = STAGES[stage]
+
+        result = measure(run, prepare(source), repeat)
+
+        result['bytes'] = len(source)
+
+        result['mb_per_second'] = len(source) / 1e6 / (result['seconds'] or 1e-9)
+
+        key = f'{stage}/{format_size(size)}'
+
+        results[key] = result
+
+        if log is not None:
+
+          log(key, result)
+
+  finally:
+
+    gehu.analysis_cache = saved_cache
+
+  return {
+
+    'suite_version': SUITE_VERSION,
+
+    'analyzer_version': gehu.ANALYZER_VERSION,
+
+    'python': platform.python_version(),
+
+    'machine': platform.machine(),
+
+    'host': platform.node(),
+
+    'seed': seed,
+
+    'knobs': knobs,
+
+    'repeat': repeat,
+
+    'calibration_seconds': calibration,
+
+    'results': results
+
+  }
+
+def recheck(current: Dict, keys: Sequence[str], repeat: int):
+
+  # Times the stage/size results in keys again, keeping the faster time, so
+
+  # that a run slowed by other load does not count as a regression
+
+  saved_cache = gehu.analysis_cache
+
+  gehu.analysis_cache = None
+
+  try:
+
+    for key in keys:
+
+      stage, size = key.split('/')
+
+      source = generate(parse_size(size), current['seed'], **current['knobs'])
+
+      prepare, run = STAGES[stage]
+
+      result = current['results'][key]
+
+      result['seconds'] = min(result['seconds'], measure(run, prepare(source), repeat, traced=False)['seconds'])
+
+      result['mb_per_second'] = len(source) / 1e6 / (result['seconds'] or 1e-9)
+
+  finally:
+
+    gehu.analysis_cache = saved_cache
+
+def same_machine(current: Dict, baseline: Dict) -> bool:
+
+  # Whether baseline was made here, so that its times are expected to hold
+
+  return all(baseline.get(name) == current[name] for name in ('host', 'machine', 'python'))
+
+def compare(current: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> Tuple[List[str], List[str]]:
+
+  # Lines comparing each result also in baseline, and the regressions among
+
+  # them: more than threshold (a fraction) slower or more memory. Baseline
+
+  # times are first scaled by how much slower or faster the calibration ran.
+
+  lines = []
+
+  regressions = []
+
+  if baseline.get('suite_version') != current['suite_version'] or baseline.get('seed') != current['seed'] or baseline.get('knobs') != current['knobs']:
+
+    return ["Baseline was made with another suite version, seed or knobs; not compared"], []
+
+  scale = current['calibration_seconds'] / baseline['calibration_seconds']
+
+  lines.append(f"Baseline times scaled by {scale:.3f} for this machine")
+
+  for key, result in current['results'].items():
+
+    old = baseline['results'].get(key)
+
+    if old is None:
+
+      continue
+
+    for metric, noise in (('seconds', NOISE_SECONDS), ('peak_bytes', 0)):
+
+      before = old[metric] * (scale if metric == 'seconds' else 1)
+
+      after = result[metric]
+
+      change = (after - before) / before if before else 0.0
+
+      line = f"{key:<24} {metric:<10} {before:>14.6g} -> {after:<14.6g} {change:+8.1%}"
+
+      if change > threshold and after - before > noise:
+
+        line += "  REGRESSION"
+
+        regressions.append((key, metric, change))
+
+      lines.append(line)
+
+  return lines, regressions
+
+def _log(key: str, result: Dict):
+
+  print(f"{key:<24} {result['seconds']:9.4f}s {result['mb_per_second']:8.2f} MB/s {result['peak_bytes'] / 1e6:9.2f} MB peak", flush=True)
+
+def main():
+
+  parser = argparse.ArgumentParser(prog='python -m gehu.bench', description="Benchmark the gehu front end on generated sources and compare with a baseline")
+
+  parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help=f"Comma-separated source sizes, 1K to 100M (default: {','.join(DEFAULT_SIZES)})")
+
+  parser.add_argument('--stages', default=','.join(STAGES), help=f"Comma-separated stages (default: all of {','.join(STAGES)})")
+
+  parser.add_argument('--repeat', type=int, default=3, help=f'Timed runs per stage and size, more for small sizes (at least {MIN_TIMING_SECONDS}s); the fastest counts (default: 3)')
+
+  parser.add_argument('--seed', type=int, default=0, help='Corpus seed (default: 0)')
+
+  for name, value in DEFAULTS.items():
+
+    parser.add_argument('--' + name.replace('_', '-'), type=type(value), default=value, help=f'Corpus {name.replace("_", " ")} (default: {value})')
+
+  parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+
+  parser.add_argument('--baseline', default=BASELINE, help='Baseline results to compare with (default: the one stored with gehu.bench)')
+
+  parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline instead of comparing')
+
+  parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help=f'Fraction slower or larger that fails the run (default: {DEFAULT_THRESHOLD})')
+
+  parser.add_argument('--rechecks', type=int, default=DEFAULT_RECHECKS, help=f'Times a slower stage is timed again before it counts (default: {DEFAULT_RECHECKS})')
+
+  parser.add_argument('--strict', action='store_true', help='Fail on regressions even against a baseline from another machine')
+
+  args = parser.parse_args()
+
+  try:
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+  except ValueError as e:
+
+    parser.error(str(e))
+
+  stages = args.stages.split(',')
+
+  unknown = [stage for stage in stages if stage not in STAGES]
+
+  if unknown:
+
+    parser.error(f"unknown stage '{unknown[0]}'")
+
+  if args.repeat < 1:
+
+    parser.error("--repeat must be at least 1")
+
+  knobs = {name: getattr(args, name) for name in DEFAULTS}
+
+  current = run_suite(sizes, stages, args.repeat, args.seed, knobs, _log)
+
+  if args.output:
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+
+      json.dump(current, f, indent=2)
+
+  if args.save_baseline:
+
+    with open(args.baseline, 'w', encoding='utf-8') as f:
+
+      json.dump(current, f, indent=2)
+
+    print(f"Baseline saved to {args.baseline}")
+
+    return
+
+  try:
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+
+      baseline = json.load(f)
+
+  except FileNotFoundError:
+
+    print(f"No baseline at {args.baseline}; pass --save-baseline to store one")
+
+    return
+
+  lines, regressions = compare(current, baseline, args.threshold)
+
+  for _ in range(args.rechecks):
+
+    slower = sorted({key for key, metric, _ in regressions if metric == 'seconds'})
+
+    if not slower:
+
+      break
+
+    print(f"Timing {', '.join(slower)} again")
+
+    recheck(current, slower, args.repeat)
+
+    lines, regressions = compare(current, baseline, args.threshold)
+
+  print("\n=== Compared with baseline ===")
+
+  for line in lines:
+
+    print(line)
+
+  if regressions:
+
+    print(f"\n{len(regressions)} regression{'s' if len(regressions) != 1 else ''} beyond {args.threshold:.0%}:")
+
+    for key, metric, change in regressions:
+
+      print(f" {key} {metric} {change:+.1%}")
+
+    if args.strict or same_machine(current, baseline):
+
+      sys.exit(1)
+
+    print("Not failing, as the baseline was made on another machine; pass --strict to fail, or --save-baseline to make one here")
+
+    return
+
+  print(f"\nNo regressions beyond {args.threshold:.0%}")
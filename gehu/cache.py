@@ -0,0 +1,305 @@
+import hashlib
+
+import marshal
+
+import os
+
+import sqlite3
+
+import time
+
+import zlib
+
+from typing import Dict, Optional
+
+from gehu import ANALYZER_VERSION, TokenBuffer
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'gehu')
+
+DEFAULT_MAX_BYTES = 256 << 20
+
+# Bytes of a content digest, which entry keys start with
+
+_DIGEST_SIZE = 16
+
+# TokenBuffer columns, in the order they are stored
+
+_COLUMNS = ('types', 'starts', 'lengths')
+
+_SCHEMA = '''
+
+CREATE TABLE IF NOT EXISTS entries (digest BLOB PRIMARY KEY, size INTEGER, used INTEGER, data BLOB);
+
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+
+CREATE TABLE IF NOT EXISTS paths (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, digest BLOB);
+
+CREATE INDEX IF NOT EXISTS paths_digest ON paths (digest);
+
+'''
+
+class AnalysisCache:
+
+  # Analysis results on disk, keyed by a hash of the source and
+
+  # ANALYZER_VERSION. An entry holds the TokenBuffer columns, the lexical
+
+  # and semantic errors, the warnings, the symbol table and the optimizer's
+
+  # statistics, marshalled and zlib-compressed; tokens are rebuilt over the
+
+  # caller's own source. Entries are evicted least recently used first once
+
+  # they add up to more than max_bytes, and the recorded digests of paths
+
+  # whose entries are gone go with them.
+
+  def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+
+    self.directory = directory or os.environ.get('GEHU_CACHE_DIR') or DEFAULT_DIRECTORY
+
+    self.max_bytes = max_bytes
+
+    self.hits = 0
+
+    self.misses = 0
+
+    self._connection = None
+
+    self._pid = None
+
+    # Bytes of entries, counted once per connection and kept up to date by
+
+    # store(); other processes' stores make it low, which only delays an
+
+    # eviction to a later store, and replaced entries make it high, which
+
+    # only costs a recount
+
+    self._total = None
+
+  def __getstate__(self):
+
+    # Sent to pool workers without the connection; each opens its own
+
+    state = self.__dict__.copy()
+
+    state['_connection'] = None
+
+    state['_pid'] = None
+
+    state['_total'] = None
+
+    return state
+
+  def connection(self) -> sqlite3.Connection:
+
+    # One connection per process: a forked worker must not reuse its parent's.
+
+    # Threads may share it as long as they take turns, as gehu --server's do.
+
+    if self._pid != os.getpid():
+
+      os.makedirs(self.directory, exist_ok=True)
+
+      self._connection = sqlite3.connect(os.path.join(self.directory, 'analysis.sqlite3'), timeout=30, isolation_level=None, check_same_thread=False)
+
+      self._connection.executescript(_SCHEMA)
+
+      self._pid = os.getpid()
+
+      self._total = None
+
+    return self._connection
+
+  def digest(self, code) -> bytes:
+
+    # A str and the same text as ASCII bytes lex alike, so they share a key
+
+    data = code.encode('utf-8', 'surrogatepass') if isinstance(code, str) else code
+
+    return hashlib.blake2b(data, digest_size=_DIGEST_SIZE, person=f'gehu{ANALYZER_VERSION}'.encode('ascii')).digest()
+
+  def path_digest(self, path: str, stat: os.stat_result) -> Optional[bytes]:
+
+    # The digest recorded for path, if its mtime and size are unchanged, so
+
+    # an untouched file is not read and hashed again
+
+    row = self.connection().execute('SELECT mtime_ns, size, digest FROM paths WHERE path = ?', (os.path.abspath(path),)).fetchone()
+
+    if row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+
+      return row[2]
+
+    return None
+
+  def remember_path(self, path: str, stat: os.stat_result, digest: bytes):
+
+    self.connection().execute('INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?)', (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, digest))
+
+  def load(self, digest: bytes, code, keep_tokens: bool = True) -> Optional[Dict]:
+
+    # The cached result for digest, with tokens over code, or None on a miss
+
+    connection = self.connection()
+
+    row = connection.execute('SELECT data FROM entries WHERE digest = ?', (digest,)).fetchone()
+
+    try:
+
+      if row is None:
+
+        raise ValueError(digest)
+
+      columns, lexical_errors, semantic_errors, warnings, symbol_table, optimization, error = marshal.loads(zlib.decompress(row[0]))
+
+    except (TypeError, ValueError, EOFError, zlib.error):
+
+      # Missing, or written by an incompatible Python
+
+      self.misses += 1
+
+      return None
+
+    connection.execute('UPDATE entries SET used = ? WHERE digest = ?', (time.time_ns(), digest))
+
+    self.hits += 1
+
+    if error is not None:
+
+      return {
+
+        'success': False,
+
+        'error': error,
+
+        'tokens': [],
+
+        'lexical_errors': [],
+
+        'semantic_errors': [],
+
+        'warnings': [],
+
+        'symbol_table': {},
+
+        'optimization': {},
+
+        'passes': {},
+
+        'cached': True
+
+      }
+
+    tokens = []
+
+    if keep_tokens:
+
+      tokens = TokenBuffer(code if isinstance(code, str) else memoryview(code))
+
+      for name, data in zip(_COLUMNS, columns):
+
+        getattr(tokens, name).frombytes(data)
+
+    return {
+
+      'success': not lexical_errors and not semantic_errors,
+
+      'tokens': tokens,
+
+      'lexical_errors': lexical_errors,
+
+      'semantic_errors': semantic_errors,
+
+      'warnings': warnings,
+
+      'symbol_table': symbol_table,
+
+      'optimization': optimization,
+
+      'passes': {},
+
+      'cached': True
+
+    }
+
+  def store(self, digest: bytes, result: Dict):
+
+    if 'error' in result:
+
+      entry = (None, [], [], [], {}, {}, result['error'])
+
+    elif isinstance(result['tokens'], TokenBuffer):
+
+      tokens = result['tokens']
+
+      entry = (tuple(getattr(tokens, name).tobytes() for name in _COLUMNS), result['lexical_errors'], result['semantic_errors'], result['warnings'], result['symbol_table'], result['optimization'], None)
+
+    else:
+
+      # Analyzed without keeping tokens: nothing complete to store
+
+      return
+
+    data = zlib.compress(marshal.dumps(entry), 1)
+
+    if len(data) > self.max_bytes:
+
+      return
+
+    connection = self.connection()
+
+    connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', (digest, len(data), time.time_ns(), data))
+
+    if self._total is None:
+
+      self._total = self.size()
+
+    else:
+
+      self._total += len(data)
+
+    if self._total > self.max_bytes:
+
+      self.evict()
+
+  def size(self) -> int:
+
+    return self.connection().execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+  def evict(self):
+
+    connection = self.connection()
+
+    total = self._total = self.size()
+
+    if total <= self.max_bytes:
+
+      return
+
+    evicted = set()
+
+    for digest, size in connection.execute('SELECT digest, size FROM entries ORDER BY used').fetchall():
+
+      connection.execute('DELETE FROM entries WHERE digest = ?', (digest,))
+
+      evicted.add(digest[:_DIGEST_SIZE])
+
+      total -= size
+
+      if total <= self.max_bytes:
+
+        break
+
+    self._total = total
+
+    # Entry keys are a content digest followed by the diagnostics cap (see
+
+    # gehu._analyze_cached); paths go once no entry starts with theirs
+
+    for digest in evicted:
+
+      if connection.execute('SELECT 1 FROM entries WHERE digest > ? AND digest < ? LIMIT 1', (digest, digest + b'\xff' * 5)).fetchone() is None:
+
+        connection.execute('DELETE FROM paths WHERE digest = ?', (digest,))
@@ -0,0 +1,99 @@
+import os
+
+import sys
+
+from typing import Dict, Optional, TextIO
+
+# The client side of gehu --server (see gehu.server), kept apart so that
+
+# commands that find no server pay only for a stat of its socket path
+
+# Seconds a client waits to connect before analyzing in-process
+
+CONNECT_TIMEOUT = 0.5
+
+def default_socket_path() -> str:
+
+  # $GEHU_SOCKET, or a per-user socket in $XDG_RUNTIME_DIR or the temp dir
+
+  path = os.environ.get('GEHU_SOCKET')
+
+  if path:
+
+    return path
+
+  directory = os.environ.get('XDG_RUNTIME_DIR')
+
+  if not directory:
+
+    import tempfile
+
+    directory = tempfile.gettempdir()
+
+  user = os.getuid() if hasattr(os, 'getuid') else os.getlogin()
+
+  return os.path.join(directory, f'gehu-{user}.sock')
+
+def forward(request: Dict, path: Optional[str] = None, out: TextIO = sys.stdout) -> bool:
+
+  # Sends request to a gehu --server and copies its reply to out as it
+
+  # arrives. Returns False, having sent nothing, when no server answers at
+
+  # path, for the caller to do the work itself.
+
+  path = path or default_socket_path()
+
+  if not os.path.exists(path):
+
+    return False
+
+  import codecs
+
+  import json
+
+  import socket
+
+  if not hasattr(socket, 'AF_UNIX'):
+
+    return False
+
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+  try:
+
+    client.settimeout(CONNECT_TIMEOUT)
+
+    client.connect(path)
+
+  except OSError:
+
+    client.close()
+
+    return False
+
+  with client:
+
+    # Replies can take as long as the work does
+
+    client.settimeout(None)
+
+    client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+
+    client.shutdown(socket.SHUT_WR)
+
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    while True:
+
+      data = client.recv(1 << 16)
+
+      out.write(decoder.decode(data, not data))
+
+      if not data:
+
+        break
+
+  out.flush()
+
+  return True
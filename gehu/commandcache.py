@@ -0,0 +1,281 @@
+import hashlib
+
+import os
+
+import re
+
+import sqlite3
+
+import sys
+
+import time
+
+from contextlib import contextmanager
+
+from typing import List, Optional, Tuple
+
+from gehu.cache import DEFAULT_DIRECTORY
+
+from gehu.similarity import PromptIndex
+
+# Generated commands are reused for a week, then asked for again
+
+DEFAULT_TTL = 7 * 24 * 3600
+
+DEFAULT_MAX_ENTRIES = 100000
+
+# Least cosine similarity at which a differently worded task reuses a command
+
+DEFAULT_SIMILARITY = 0.8
+
+# Part of every key: bump it when the prompt handle_command sends changes, so
+
+# commands generated for the old prompt are not reused
+
+PROMPT_VERSION = 1
+
+_WHITESPACE = re.compile(r'\s+')
+
+_SCHEMA = '''
+
+CREATE TABLE IF NOT EXISTS commands (key BLOB PRIMARY KEY, task TEXT, command TEXT, created INTEGER, used INTEGER);
+
+CREATE INDEX IF NOT EXISTS commands_used ON commands (used);
+
+CREATE INDEX IF NOT EXISTS commands_created ON commands (created);
+
+CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER);
+
+'''
+
+def normalize_task(task: str) -> str:
+
+  # Runs of whitespace count as one space. Case is kept, as it matters in
+
+  # the file names and text that tasks often mention.
+
+  return _WHITESPACE.sub(' ', task).strip()
+
+class CommandCache:
+
+  # Commands generated by the model, keyed by a hash of the normalized task,
+
+  # the platform and the working directory, so the same task asked again in
+
+  # the same place skips generate_content. With similarity below 1, a task
+
+  # worded differently reuses the command of the most similar earlier task
+
+  # in the same place (see gehu.similarity) if they are at least that
+
+  # similar. Entries older than ttl seconds are not used; past max_entries,
+
+  # the least recently used go first. Hits and misses are counted in the
+
+  # database as well as per run.
+
+  def __init__(self, directory: Optional[str] = None, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, similarity: float = DEFAULT_SIMILARITY):
+
+    self.directory = directory or os.environ.get('GEHU_CACHE_DIR') or DEFAULT_DIRECTORY
+
+    self.ttl = ttl
+
+    self.max_entries = max_entries
+
+    self.similarity = similarity
+
+    self.hits = 0
+
+    self.similar_hits = 0
+
+    self.misses = 0
+
+    self._connection = None
+
+    self._index = None
+
+  def connection(self) -> sqlite3.Connection:
+
+    if self._connection is None:
+
+      os.makedirs(self.directory, exist_ok=True)
+
+      self._connection = sqlite3.connect(os.path.join(self.directory, 'commands.sqlite3'), timeout=30, isolation_level=None)
+
+      self._connection.executescript(_SCHEMA)
+
+      self._index = PromptIndex(self._connection)
+
+    return self._connection
+
+  def index(self) -> PromptIndex:
+
+    self.connection()
+
+    return self._index
+
+  @contextmanager
+
+  def transaction(self):
+
+    # One commit for the many statements of a store, rather than one each
+
+    connection = self.connection()
+
+    connection.execute('BEGIN IMMEDIATE')
+
+    try:
+
+      yield connection
+
+    except BaseException:
+
+      connection.execute('ROLLBACK')
+
+      raise
+
+    connection.execute('COMMIT')
+
+  def scope(self, cwd: str) -> bytes:
+
+    # What tasks must share to reuse each other's commands
+
+    text = '\0'.join((sys.platform, os.path.abspath(cwd)))
+
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16, person=f'gehucmd{PROMPT_VERSION}'.encode('ascii')).digest()
+
+  def key(self, task: str, cwd: str) -> bytes:
+
+    text = '\0'.join((normalize_task(task), sys.platform, os.path.abspath(cwd)))
+
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16, person=f'gehucmd{PROMPT_VERSION}'.encode('ascii')).digest()
+
+  def count(self, name: str):
+
+    connection = self.connection()
+
+    connection.execute('INSERT OR IGNORE INTO stats VALUES (?, 0)', (name,))
+
+    connection.execute('UPDATE stats SET value = value + 1 WHERE name = ?', (name,))
+
+  def load(self, task: str, cwd: str) -> Optional[Tuple[str, str, float]]:
+
+    # The command cached for task in cwd, the task it was generated for and
+
+    # how similar that is to task (1.0 for the same task), or None if there
+
+    # is none or it has expired
+
+    row = self.fetch(self.key(task, cwd))
+
+    if row is not None:
+
+      self.hits += 1
+
+      self.count('hits')
+
+      return row[0], row[1], 1.0
+
+    if self.similarity < 1:
+
+      match = self.index().nearest(self.scope(cwd), normalize_task(task), self.similarity)
+
+      if match is not None:
+
+        row = self.fetch(match[0])
+
+        if row is not None:
+
+          self.similar_hits += 1
+
+          self.count('similar hits')
+
+          return row[0], row[1], match[1]
+
+    self.misses += 1
+
+    self.count('misses')
+
+    return None
+
+  def fetch(self, key: bytes) -> Optional[Tuple[str, str]]:
+
+    # The command and task stored under key, marking them used, unless they
+
+    # have expired
+
+    connection = self.connection()
+
+    now = time.time_ns()
+
+    row = connection.execute('SELECT command, task, created FROM commands WHERE key = ?', (key,)).fetchone()
+
+    if row is None:
+
+      return None
+
+    if now - row[2] > self.ttl * 1e9:
+
+      with self.transaction():
+
+        self.delete([key])
+
+      return None
+
+    connection.execute('UPDATE commands SET used = ? WHERE key = ?', (now, key))
+
+    return row[0], row[1]
+
+  def store(self, task: str, cwd: str, command: str):
+
+    now = time.time_ns()
+
+    key = self.key(task, cwd)
+
+    with self.transaction() as connection:
+
+      connection.execute('INSERT OR REPLACE INTO commands VALUES (?, ?, ?, ?, ?)', (key, normalize_task(task), command, now, now))
+
+      self.index().add(key, self.scope(cwd), normalize_task(task))
+
+      self.evict(now)
+
+  def forget(self, task: str, cwd: str):
+
+    # Drops the entry for task in cwd, as when its command failed
+
+    with self.transaction():
+
+      self.delete([self.key(task, cwd)])
+
+  def delete(self, keys: List[bytes]):
+
+    self.connection().executemany('DELETE FROM commands WHERE key = ?', ((key,) for key in keys))
+
+    self.index().remove(keys)
+
+  def evict(self, now: int):
+
+    connection = self.connection()
+
+    expired = connection.execute('SELECT key FROM commands WHERE created < ?', (now - int(self.ttl * 1e9),)).fetchall()
+
+    self.delete([row[0] for row in expired])
+
+    excess = connection.execute('SELECT COUNT(*) FROM commands').fetchone()[0] - self.max_entries
+
+    if excess > 0:
+
+      self.delete([row[0] for row in connection.execute('SELECT key FROM commands ORDER BY used LIMIT ?', (excess,)).fetchall()])
+
+  def stats(self) -> Tuple[int, int, int, int]:
+
+    # Entries, and exact hits, near-duplicate hits and misses over every run
+
+    connection = self.connection()
+
+    entries = connection.execute('SELECT COUNT(*) FROM commands').fetchone()[0]
+
+    counts = dict(connection.execute('SELECT name, value FROM stats'))
+
+    return entries, counts.get('hits', 0), counts.get('similar hits', 0), counts.get('misses', 0)
@@ -0,0 +1,627 @@
+from array import array
+
+from enum import Enum, auto
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gehu import MAX_DIAGNOSTICS, Lexer, SemanticAnalyzer
+
+from gehu.parser import Ast, NodeKind, recursion_room
+
+from gehu.scopes import BUILTINS
+
+class Opcode(Enum):
+
+  # Each instruction is one item of an array: its opcode in the low 8 bits
+
+  # and its argument above them. Binary operators pop b, then a, and push
+
+  # a op b.
+
+  CONST = auto() # push constants[arg]
+
+  LOAD = auto() # push local slot arg
+
+  STORE = auto() # pop into local slot arg
+
+  LOAD_GLOBAL = auto() # push slot arg of the program's frame
+
+  STORE_GLOBAL = auto() # pop into slot arg of the program's frame
+
+  LOAD_BUILTIN = auto() # push builtin BUILTINS[arg]
+
+  ADD = auto()
+
+  SUBTRACT = auto()
+
+  MULTIPLY = auto()
+
+  DIVIDE = auto() # integer division, rounding down
+
+  EQUALS = auto() # 1 or 0
+
+  NOT_EQUALS = auto() # 1 or 0
+
+  NEGATE = auto()
+
+  JUMP = auto() # continue at instruction arg
+
+  JUMP_IF_FALSE = auto() # pop; continue at instruction arg if it is false
+
+  CALL = auto() # call the value below arg arguments with them, push the result
+
+  RETURN = auto() # pop the result and return it to the caller
+
+  POP = auto()
+
+  DUP = auto()
+
+# Opcode indexed by its value, to decode instructions
+
+_OPCODES = (None,) + tuple(Opcode)
+
+_CONST_OP = Opcode.CONST.value
+
+_LOAD = Opcode.LOAD.value
+
+_STORE = Opcode.STORE.value
+
+_LOAD_GLOBAL = Opcode.LOAD_GLOBAL.value
+
+_STORE_GLOBAL = Opcode.STORE_GLOBAL.value
+
+_LOAD_BUILTIN = Opcode.LOAD_BUILTIN.value
+
+_NEGATE_OP = Opcode.NEGATE.value
+
+_JUMP = Opcode.JUMP.value
+
+_JUMP_IF_FALSE = Opcode.JUMP_IF_FALSE.value
+
+_CALL_OP = Opcode.CALL.value
+
+_RETURN_OP = Opcode.RETURN.value
+
+_POP = Opcode.POP.value
+
+_DUP = Opcode.DUP.value
+
+_BINARY_OPCODES = {
+
+  '+': Opcode.ADD.value,
+
+  '-': Opcode.SUBTRACT.value,
+
+  '*': Opcode.MULTIPLY.value,
+
+  '/': Opcode.DIVIDE.value,
+
+  '==': Opcode.EQUALS.value,
+
+  '!=': Opcode.NOT_EQUALS.value
+
+}
+
+_PROGRAM = NodeKind.PROGRAM.value
+
+_BLOCK = NodeKind.BLOCK.value
+
+_VAR = NodeKind.VAR.value
+
+_CONST = NodeKind.CONST.value
+
+_FUNCTION = NodeKind.FUNCTION.value
+
+_IF = NodeKind.IF.value
+
+_WHILE = NodeKind.WHILE.value
+
+_FOR = NodeKind.FOR.value
+
+_RETURN = NodeKind.RETURN.value
+
+_EXPRESSION = NodeKind.EXPRESSION.value
+
+_EMPTY = NodeKind.EMPTY.value
+
+_ASSIGN = NodeKind.ASSIGN.value
+
+_BINARY = NodeKind.BINARY.value
+
+_NEGATE = NodeKind.NEGATE.value
+
+_CALL = NodeKind.CALL.value
+
+_NAME = NodeKind.NAME.value
+
+_NUMBER = NodeKind.NUMBER.value
+
+_STRING = NodeKind.STRING.value
+
+class Code:
+
+  # A function's instructions, the constants they refer to and the source
+
+  # line of each instruction, for runtime errors
+
+  def __init__(self, name: str):
+
+    self.name = name
+
+    self.instructions = array('q')
+
+    self.lines = array('I')
+
+    self.constants = []
+
+    self.constant_indexes = {}
+
+  def emit(self, opcode: int, argument: int, line: int) -> int:
+
+    # Appends an instruction and returns its index
+
+    self.instructions.append(argument << 8 | opcode)
+
+    self.lines.append(line)
+
+    return len(self.instructions) - 1
+
+  def patch(self, index: int, argument: int):
+
+    # Sets the argument of instruction index, a jump emitted before its target
+
+    self.instructions[index] = argument << 8 | self.instructions[index] & 255
+
+  def constant(self, value) -> int:
+
+    # The index of value in constants, added if new. The type is part of the
+
+    # key, as 1 and True are equal.
+
+    key = (type(value), value)
+
+    index = self.constant_indexes.get(key)
+
+    if index is None:
+
+      index = self.constant_indexes[key] = len(self.constants)
+
+      self.constants.append(value)
+
+    return index
+
+  def disassemble(self) -> Iterator[str]:
+
+    # One line per instruction: index, source line, opcode, argument
+
+    for index, word in enumerate(self.instructions):
+
+      opcode = _OPCODES[word & 255]
+
+      argument = word >> 8
+
+      if opcode == Opcode.CONST:
+
+        detail = f" {argument} ({self.constants[argument]!r})"
+
+      elif opcode in (Opcode.POP, Opcode.DUP, Opcode.RETURN, Opcode.NEGATE) or opcode.value in _BINARY_OPCODES.values():
+
+        detail = ''
+
+      else:
+
+        detail = f" {argument}"
+
+      yield f"{index:>6} line {self.lines[index]:<5} {opcode.name}{detail}"
+
+class Function:
+
+  # A compiled function: it takes arity arguments into its first local
+
+  # slots and uses size slots in all, counted as the compiler declares them
+
+  __slots__ = ('name', 'arity', 'size', 'code')
+
+  def __init__(self, name: str, arity: int):
+
+    self.name = name
+
+    self.arity = arity
+
+    self.size = 0
+
+    self.code = Code(name)
+
+  def __repr__(self):
+
+    return f"<function {self.name}>"
+
+class CompileError(Exception):
+
+  pass
+
+class Compiler:
+
+  # Compiles an Ast that analyzed without errors into one Function per
+
+  # function declaration, plus one for the program, in a single recursive
+
+  # walk. The program's declarations, in nested blocks too, take slots in
+
+  # the program's frame, which functions reach with LOAD_GLOBAL; every
+
+  # other declaration takes a slot of its function's frame. Slots are never
+
+  # shared, so shadowing needs no extra work. Functions are values, but a
+
+  # function name that is never assigned to compiles to a constant.
+
+  # Functions cannot use the locals of an enclosing function (there are no
+
+  # closures); that is a CompileError.
+
+  #
+
+  # declarations: Resolver.declarations for the Ast
+
+  def __init__(self, ast: Ast, declarations: array):
+
+    self.ast = ast
+
+    self.declarations = declarations
+
+    # For each declaring node, its slot and the FUNCTION node (or -1 for the
+
+    # program) whose frame holds it
+
+    self.slots: Dict[int, int] = {}
+
+    self.owners: Dict[int, int] = {}
+
+    self.functions: Dict[int, Function] = {}
+
+    self.assigned = set()
+
+    self.function = -1
+
+    self.target: Optional[Function] = None
+
+  def compile(self) -> Function:
+
+    ast = self.ast
+
+    kinds = ast.kinds
+
+    children = ast.children
+
+    first_children = ast.first_children
+
+    for node in range(len(ast)):
+
+      if kinds[node] == _ASSIGN:
+
+        self.assigned.add(self.declarations[children[first_children[node]]])
+
+    program = Function('<program>', 0)
+
+    # Each level of nesting costs at most two frames
+
+    with recursion_room(2 * len(ast) + 100):
+
+      self.body(program, -1, ast.child_nodes(ast.root), (), ast.root)
+
+    return program
+
+  def body(self, function: Function, node: int, statements: Iterable[int], parameters: Iterable[int], end: int):
+
+    # Compiles statements into function, node's Function, after declaring
+
+    # its parameters; falling off the end returns None
+
+    outer = self.target, self.function
+
+    self.target = function
+
+    self.function = node
+
+    for parameter in parameters:
+
+      self.declare(parameter)
+
+    self.statements(statements)
+
+    self.emit(_CONST_OP, function.code.constant(None), end)
+
+    self.emit(_RETURN_OP, 0, end)
+
+    self.target, self.function = outer
+
+  def emit(self, opcode: int, argument: int, node: int) -> int:
+
+    return self.target.code.emit(opcode, argument, self.ast.line(node))
+
+  def declare(self, node: int) -> int:
+
+    slot = self.slots[node] = self.target.size
+
+    self.owners[node] = self.function
+
+    self.target.size += 1
+
+    return slot
+
+  def statements(self, statements: Iterable[int]):
+
+    # A scope's statements; its functions exist before any of them runs
+
+    ast = self.ast
+
+    kinds = ast.kinds
+
+    for statement in statements:
+
+      if kinds[statement] == _FUNCTION:
+
+        function = self.functions[statement] = Function(ast.name(statement), ast.child_counts[statement] - 1)
+
+        if statement in self.assigned:
+
+          self.emit(_CONST_OP, self.target.code.constant(function), statement)
+
+          self.emit(_STORE, self.declare(statement), statement)
+
+    for statement in statements:
+
+      self.statement(statement)
+
+  def statement(self, node: int):
+
+    ast = self.ast
+
+    kind = ast.kinds[node]
+
+    children = ast.child_nodes(node)
+
+    if kind == _EXPRESSION:
+
+      self.effect(children[0])
+
+    elif kind == _VAR or kind == _CONST:
+
+      self.expression(children[0])
+
+      self.store(node, node)
+
+    elif kind == _BLOCK:
+
+      self.statements(children)
+
+    elif kind == _IF:
+
+      self.expression(children[0])
+
+      skip = self.emit(_JUMP_IF_FALSE, 0, node)
+
+      self.statement(children[1])
+
+      if len(children) == 3:
+
+        end = self.emit(_JUMP, 0, node)
+
+        self.target.code.patch(skip, len(self.target.code.instructions))
+
+        self.statement(children[2])
+
+        skip = end
+
+      self.target.code.patch(skip, len(self.target.code.instructions))
+
+    elif kind == _WHILE:
+
+      self.loop(node, children[0], children[1], None)
+
+    elif kind == _FOR:
+
+      initializer, condition, update, body = children
+
+      if ast.kinds[initializer] == _VAR or ast.kinds[initializer] == _CONST:
+
+        self.statement(initializer)
+
+      elif ast.kinds[initializer] != _EMPTY:
+
+        self.effect(initializer)
+
+      self.loop(node, condition, body, update)
+
+    elif kind == _RETURN:
+
+      if children:
+
+        self.expression(children[0])
+
+      else:
+
+        self.emit(_CONST_OP, self.target.code.constant(None), node)
+
+      self.emit(_RETURN_OP, 0, node)
+
+    elif kind == _FUNCTION:
+
+      # A function that is the body of an if or loop declares nothing
+
+      function = self.functions.get(node) or Function(ast.name(node), len(children) - 1)
+
+      self.body(function, node, ast.child_nodes(children[-1]), children[:-1], children[-1])
+
+  def loop(self, node: int, condition: int, body: int, update: Optional[int]):
+
+    # The condition at the top, jumping past the end when false; an EMPTY
+
+    # condition loops until a return
+
+    code = self.target.code
+
+    top = len(code.instructions)
+
+    exit = None
+
+    if self.ast.kinds[condition] != _EMPTY:
+
+      self.expression(condition)
+
+      exit = self.emit(_JUMP_IF_FALSE, 0, node)
+
+    self.statement(body)
+
+    if update is not None and self.ast.kinds[update] != _EMPTY:
+
+      self.effect(update)
+
+    self.emit(_JUMP, top, node)
+
+    if exit is not None:
+
+      code.patch(exit, len(code.instructions))
+
+  def effect(self, node: int):
+
+    # An expression evaluated for its side effects; an assignment stores
+
+    # its value without keeping a copy to pop
+
+    ast = self.ast
+
+    if ast.kinds[node] == _ASSIGN:
+
+      target, value = ast.child_nodes(node)
+
+      self.expression(value)
+
+      self.store(self.declarations[target], target)
+
+    else:
+
+      self.expression(node)
+
+      self.emit(_POP, 0, node)
+
+  def expression(self, node: int):
+
+    ast = self.ast
+
+    kind = ast.kinds[node]
+
+    if kind == _NAME:
+
+      self.load(self.declarations[node], node)
+
+    elif kind == _NUMBER or kind == _STRING:
+
+      self.emit(_CONST_OP, self.target.code.constant(ast.value(node)), node)
+
+    elif kind == _BINARY:
+
+      left, right = ast.child_nodes(node)
+
+      self.expression(left)
+
+      self.expression(right)
+
+      self.emit(_BINARY_OPCODES[ast.text(node)], 0, node)
+
+    elif kind == _CALL:
+
+      callee, *arguments = ast.child_nodes(node)
+
+      self.expression(callee)
+
+      for argument in arguments:
+
+        self.expression(argument)
+
+      self.emit(_CALL_OP, len(arguments), node)
+
+    elif kind == _ASSIGN:
+
+      target, value = ast.child_nodes(node)
+
+      self.expression(value)
+
+      self.emit(_DUP, 0, node)
+
+      self.store(self.declarations[target], target)
+
+    elif kind == _NEGATE:
+
+      self.expression(ast.child_nodes(node)[0])
+
+      self.emit(_NEGATE_OP, 0, node)
+
+  def load(self, declaration: int, node: int):
+
+    if declaration < 0:
+
+      self.emit(_LOAD_BUILTIN, BUILTINS.index(self.ast.name(node)), node)
+
+    elif self.ast.kinds[declaration] == _FUNCTION and declaration not in self.assigned:
+
+      self.emit(_CONST_OP, self.target.code.constant(self.functions[declaration]), node)
+
+    else:
+
+      self.emit(_LOAD if self.local(declaration, node) else _LOAD_GLOBAL, self.slots[declaration], node)
+
+  def store(self, declaration: int, node: int):
+
+    if declaration not in self.slots:
+
+      self.declare(declaration)
+
+    self.emit(_STORE if self.local(declaration, node) else _STORE_GLOBAL, self.slots[declaration], node)
+
+  def local(self, declaration: int, node: int) -> bool:
+
+    # Whether declaration is in the current frame, or else the program's
+
+    owner = self.owners[declaration]
+
+    if owner == self.function:
+
+      return True
+
+    if owner < 0:
+
+      return False
+
+    raise CompileError(f"'{self.ast.name(node)}' at line {self.ast.line(node)} is a local of the enclosing function '{self.ast.name(owner)}'; closures are not supported")
+
+def compile_source(source: str, max_errors: int = MAX_DIAGNOSTICS, optimize: bool = True) -> Tuple[Optional[Function], List[str]]:
+
+  # Lexes, analyzes and compiles source, from the tree gehu.optimizer made
+
+  # of it unless optimize is False. Returns the program's Function, or None
+
+  # and the errors that keep it from compiling.
+
+  lexer = Lexer(source, max_errors=max_errors)
+
+  tokens = lexer.tokenize_buffer()
+
+  analyzer = SemanticAnalyzer(max_errors, optimize)
+
+  errors = lexer.errors + analyzer.analyze(tokens)
+
+  if errors:
+
+    return None, errors
+
+  ast, declarations = analyzer.optimized if optimize else (analyzer.ast, analyzer.declarations)
+
+  try:
+
+    return Compiler(ast, declarations).compile(), []
+
+  except CompileError as e:
+
+    return None, [str(e)]
@@ -0,0 +1,131 @@
+import json
+
+import random
+
+import re
+
+import threading
+
+import time
+
+from typing import Iterator
+
+# A stand-in for the Gemini model, for trying out and timing gehu without an
+
+# API key or network. It answers every prompt with reply, where {task}
+
+# stands for the prompt's task, after first_delay seconds, in chunks of
+
+# chunk_size characters chunk_delay seconds apart. A quota_errors fraction of
+
+# calls, picked at random from seed, fail with QuotaExceeded instead, after
+
+# first_delay, as the API's 429 responses do. Set $GEHU_FAKE_MODEL to a JSON
+
+# object of these settings to make gehu use it, for example
+
+#   GEHU_FAKE_MODEL='{"reply": "echo one\necho two", "chunk_delay": 0.2}'
+
+DEFAULTS = {'reply': 'echo hello', 'first_delay': 0.5, 'chunk_size': 8, 'chunk_delay': 0.05, 'quota_errors': 0.0, 'seed': 0}
+
+_TASK = re.compile(r'^\s*Task: (.*)$', re.MULTILINE)
+
+class QuotaExceeded(Exception):
+
+  # Like google.api_core.exceptions.ResourceExhausted, which has the same
+
+  # code
+
+  code = 429
+
+class FakeResponse:
+
+  # What generate_content returns, or one chunk of it when streaming
+
+  def __init__(self, text: str):
+
+    self.text = text
+
+class FakeModel:
+
+  def __init__(self, reply: str = DEFAULTS['reply'], first_delay: float = DEFAULTS['first_delay'], chunk_size: int = DEFAULTS['chunk_size'], chunk_delay: float = DEFAULTS['chunk_delay'], quota_errors: float = DEFAULTS['quota_errors'], seed: int = DEFAULTS['seed']):
+
+    if chunk_size < 1:
+
+      raise ValueError("chunk_size must be at least 1")
+
+    if not 0 <= quota_errors <= 1:
+
+      raise ValueError("quota_errors must be from 0 to 1")
+
+    self.reply = reply
+
+    self.first_delay = first_delay
+
+    self.chunk_size = chunk_size
+
+    self.chunk_delay = chunk_delay
+
+    self.quota_errors = quota_errors
+
+    self.random = random.Random(seed)
+
+    # Calls come from gehu --batch's threads
+
+    self.lock = threading.Lock()
+
+    self.calls = 0
+
+  @classmethod
+
+  def from_spec(cls, spec: str) -> 'FakeModel':
+
+    # A FakeModel from $GEHU_FAKE_MODEL's JSON; an empty spec takes DEFAULTS
+
+    settings = json.loads(spec) if spec.strip() else {}
+
+    if not isinstance(settings, dict):
+
+      raise ValueError("GEHU_FAKE_MODEL must be a JSON object")
+
+    unknown = set(settings) - set(DEFAULTS)
+
+    if unknown:
+
+      raise ValueError(f"unknown GEHU_FAKE_MODEL settings: {', '.join(sorted(unknown))}")
+
+    return cls(**settings)
+
+  def chunks(self, reply: str) -> Iterator[FakeResponse]:
+
+    for start in range(0, len(reply), self.chunk_size):
+
+      if start:
+
+        time.sleep(self.chunk_delay)
+
+      yield FakeResponse(reply[start:start + self.chunk_size])
+
+  def generate_content(self, prompt: str, stream: bool = False):
+
+    with self.lock:
+
+      self.calls += 1
+
+      refused = self.random.random() < self.quota_errors
+
+    time.sleep(self.first_delay)
+
+    if refused:
+
+      raise QuotaExceeded("429 Resource has been exhausted (e.g. check quota).")
+
+    task = _TASK.search(prompt)
+
+    reply = self.reply.replace('{task}', task.group(1) if task else prompt)
+
+    if stream:
+
+      return self.chunks(reply)
+
+    return FakeResponse(''.join(chunk.text for chunk in self.chunks(reply)))
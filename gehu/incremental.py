@@ -0,0 +1,973 @@
+import sys
+
+from array import array
+
+from bisect import bisect_left, bisect_right
+
+from collections.abc import Mapping
+
+from itertools import accumulate, chain
+
+from typing import Dict, List, Optional, Iterator, Set, Tuple
+
+try:
+
+  import numpy as np
+
+except ImportError:
+
+  np = None
+
+from gehu import Lexer, SemanticAnalyzer, Token, TokenBuffer, TokenType, _DECLARATION_CODES, _TOKEN_TYPES
+
+# Characters per block of a BlockText
+
+BLOCK_SIZE = 1 << 12
+
+_STRING_CODE = TokenType.STRING.value
+
+_CONST_CODE = TokenType.CONST.value
+
+_IDENTIFIER_CODE = TokenType.IDENTIFIER.value
+
+_ASSIGN_CODE = TokenType.ASSIGN.value
+
+_ERROR_CODE = bytes((TokenType.ERROR.value,))
+
+# Tokens a gap move must cross before NumPy is used to copy them
+
+_NUMPY_RUN = 1024
+
+class BlockText:
+
+  # Text kept as a list of short strings, so an edit rebuilds one block
+
+  # instead of copying the whole document. It also serves as the line index
+
+  # of the document's tokens, from the newlines counted before each block.
+
+  #
+
+  # Places in the text can be anchored (see anchor()): an anchor is held as
+
+  # a block id and an offset into that block, so an edit only moves the
+
+  # anchors in the blocks it rebuilds, however many come after it.
+
+  def __init__(self, text: str):
+
+    self.blocks = [text[i:i + BLOCK_SIZE] for i in range(0, len(text), BLOCK_SIZE)] or ['']
+
+    self.starts = array('q', range(0, max(len(text), 1), BLOCK_SIZE))
+
+    self.newlines = self._count_newlines(self.blocks, 0)
+
+    self.size = len(text)
+
+    # Block ids, which stay with a block while others come and go; their
+
+    # indexes in blocks; and the anchors in each block
+
+    self.ids = list(range(len(self.blocks)))
+
+    self.indexes = {block_id: index for index, block_id in enumerate(self.ids)}
+
+    self.next_id = len(self.ids)
+
+    self.anchors: Dict[int, Set] = {}
+
+  def __len__(self):
+
+    return self.size
+
+  def __str__(self):
+
+    return ''.join(self.blocks)
+
+  def locate(self, offset: int) -> int:
+
+    # Index of the block holding offset (the last block for the end)
+
+    return max(bisect_right(self.starts, offset) - 1, 0)
+
+  def slice(self, start: int, end: int) -> str:
+
+    index = self.locate(start)
+
+    local = start - self.starts[index]
+
+    block = self.blocks[index]
+
+    if local + end - start <= len(block):
+
+      return block[local:local + end - start]
+
+    return ''.join(self.chunks(start, end))
+
+  def chunks(self, start: int, end: Optional[int] = None) -> Iterator[str]:
+
+    # The text from start to end (or to the end) in block-sized pieces
+
+    end = self.size if end is None else end
+
+    index = self.locate(start)
+
+    while start < end and index < len(self.blocks):
+
+      block_start = self.starts[index]
+
+      yield self.blocks[index][start - block_start:end - block_start]
+
+      start = block_start + len(self.blocks[index])
+
+      index += 1
+
+  def find(self, char: str, start: int) -> int:
+
+    for index in range(self.locate(start), len(self.blocks)):
+
+      block_start = self.starts[index]
+
+      found = self.blocks[index].find(char, max(start - block_start, 0))
+
+      if found >= 0:
+
+        return block_start + found
+
+    return -1
+
+  def rfind(self, char: str, start: int, end: int) -> int:
+
+    # Last char in [start, end), searching blocks backwards
+
+    for index in range(self.locate(max(end - 1, 0)), -1, -1):
+
+      block_start = self.starts[index]
+
+      if block_start + len(self.blocks[index]) <= start:
+
+        break
+
+      found = self.blocks[index].rfind(char, max(start - block_start, 0), end - block_start)
+
+      if found >= 0:
+
+        return block_start + found
+
+    return -1
+
+  @staticmethod
+
+  def _count_newlines(blocks: List[str], before: int) -> array:
+
+    # Newlines before each of blocks, given before ahead of the first
+
+    return array('q', accumulate((block.count('\n') for block in blocks[:-1]), initial=before))
+
+  def line(self, offset: int) -> int:
+
+    index = self.locate(offset)
+
+    return self.newlines[index] + self.blocks[index].count('\n', 0, offset - self.starts[index]) + 1
+
+  def column(self, offset: int) -> int:
+
+    return offset - self.rfind('\n', 0, offset)
+
+  def position(self, offset: int) -> Tuple[int, int]:
+
+    return self.line(offset), self.column(offset)
+
+  def anchor(self, anchor, offset: int):
+
+    # Ties anchor, any object with block and local attributes, to offset.
+
+    # Edits move it with the text after it, and offset() finds it again.
+
+    index = self.locate(offset)
+
+    anchor.block = self.ids[index]
+
+    anchor.local = offset - self.starts[index]
+
+    anchors = self.anchors.get(anchor.block)
+
+    if anchors is None:
+
+      anchors = self.anchors[anchor.block] = set()
+
+    anchors.add(anchor)
+
+  def release(self, anchor):
+
+    anchors = self.anchors[anchor.block]
+
+    anchors.discard(anchor)
+
+    if not anchors:
+
+      del self.anchors[anchor.block]
+
+  def offset(self, anchor) -> int:
+
+    return self.starts[self.indexes[anchor.block]] + anchor.local
+
+  def anchored(self, start: int, end: int) -> List:
+
+    # The anchors at offsets in [start, end)
+
+    found = []
+
+    index = self.locate(start)
+
+    while index < len(self.blocks) and self.starts[index] < end:
+
+      block_start = self.starts[index]
+
+      for anchor in self.anchors.get(self.ids[index], ()):
+
+        if start <= block_start + anchor.local < end:
+
+          found.append(anchor)
+
+      index += 1
+
+    return found
+
+  def replace(self, offset: int, deleted: int, inserted: str):
+
+    first = self.locate(offset)
+
+    last = self.locate(offset + deleted)
+
+    # Anchors in the blocks being rebuilt, at their offsets after the edit.
+
+    # Those in the deleted text are dropped.
+
+    delta = len(inserted) - deleted
+
+    moved = []
+
+    for index in range(first, last + 1):
+
+      block_start = self.starts[index]
+
+      for anchor in self.anchors.pop(self.ids[index], ()):
+
+        position = block_start + anchor.local
+
+        if position >= offset + deleted:
+
+          moved.append((anchor, position + delta))
+
+        elif position < offset:
+
+          moved.append((anchor, position))
+
+    merged = self.blocks[first][:offset - self.starts[first]] + inserted + self.blocks[last][offset + deleted - self.starts[last]:]
+
+    # A block grows up to twice the usual size before it is split again
+
+    if len(merged) > 2 * BLOCK_SIZE:
+
+      pieces = [merged[i:i + BLOCK_SIZE] for i in range(0, len(merged), BLOCK_SIZE)]
+
+    elif merged or len(self.blocks) == last - first + 1:
+
+      pieces = [merged]
+
+    else:
+
+      pieces = []
+
+    starts = array('q')
+
+    block_start = self.starts[first]
+
+    for piece in pieces:
+
+      starts.append(block_start)
+
+      block_start += len(piece)
+
+    # Newlines before the first later block, then how far that count moved
+
+    later = self.newlines[first] + sum(piece.count('\n') for piece in pieces)
+
+    line_delta = later - self.newlines[last + 1] if last + 1 < len(self.blocks) else 0
+
+    newlines = self._count_newlines(pieces + [''], self.newlines[first])[:len(pieces)]
+
+    self.blocks[first:last + 1] = pieces
+
+    self.starts[first:] = starts + array('q', map(delta.__add__, self.starts[last + 1:]))
+
+    self.newlines[first:] = newlines + (array('q', map(line_delta.__add__, self.newlines[last + 1:])) if line_delta else self.newlines[last + 1:])
+
+    self.size += delta
+
+    for block_id in self.ids[first:last + 1]:
+
+      del self.indexes[block_id]
+
+    self.ids[first:last + 1] = range(self.next_id, self.next_id + len(pieces))
+
+    self.next_id += len(pieces)
+
+    # Later blocks keep their indexes unless the number of blocks changed
+
+    end = first + len(pieces) if len(pieces) == last - first + 1 else len(self.ids)
+
+    for index in range(first, end):
+
+      self.indexes[self.ids[index]] = index
+
+    for anchor, position in moved:
+
+      self.anchor(anchor, position)
+
+class _Declaration:
+
+  # A var or const of a Document, anchored in its BlockText at the keyword.
+
+  # name is the name it declares, or None when it is malformed and problem
+
+  # holds the error message up to the line number.
+
+  __slots__ = ('block', 'local', 'constant', 'name', 'problem')
+
+class _Declared(Mapping):
+
+  # The var and const names declared anywhere in a Document, {name: {'type':
+
+  # 'var' or 'const', 'line': ...}} for the first declaration of each, read
+
+  # from the declarations when asked for
+
+  def __init__(self, document: 'Document'):
+
+    self.document = document
+
+  def __getitem__(self, name: str) -> Dict:
+
+    text = self.document.text
+
+    first = min(self.document.names[name], key=text.offset)
+
+    return {'type': 'const' if first.constant else 'var', 'line': text.line(text.offset(first))}
+
+  def __iter__(self) -> Iterator[str]:
+
+    return iter(self.document.names)
+
+  def __len__(self):
+
+    return len(self.document.names)
+
+  def __repr__(self):
+
+    return repr(dict(self))
+
+class Document:
+
+  # A source text with its tokens and declarations, kept current by edit()
+
+  # re-lexing only the damaged region and reusing the rest of the old stream.
+
+  #
+
+  # errors, warnings and symbol_table are those analyze_code reports, from
+
+  # check(): parsing and resolving names through scopes. That costs a full
+
+  # analysis, run when one of them is first read after an edit.
+
+  #
+
+  # What edits keep up to date is the flat declaration scan
+
+  # (SemanticAnalyzer.analyze_indexed) without its cap, which needs no
+
+  # parse: declared maps every var and const name declared anywhere, blocks
+
+  # and functions included, to its first declaration, and
+
+  # declaration_errors lists the malformed declarations. Whether a name is
+
+  # declared twice, or used undeclared, depends on scopes, so only errors
+
+  # says.
+
+  #
+
+  # Tokens live in a gap buffer of two TokenBuffers. head holds the tokens
+
+  # before the gap in order, with absolute starts. tail holds the tokens
+
+  # after the gap in reverse order, with starts stored relative to
+
+  # start_shift, so an edit moves every later token by updating that one
+
+  # number. Moving the gap copies the tokens it crosses, which keeps edits
+
+  # close to the previous one cheap. Lines and columns are never stored:
+
+  # tokens look them up in the BlockText.
+
+  #
+
+  # Declarations are anchored in the BlockText too, so an edit only changes
+
+  # the ones among the tokens it re-lexes, however many lines it adds or
+
+  # removes. Each name keeps all its declarations; line numbers are worked
+
+  # out from them when asked for.
+
+  #
+
+  # Invalid characters become ERROR tokens, reported by lexical_errors.
+
+  def __init__(self, source: str):
+
+    # Scans never stop at an error; their messages are not used, as
+
+    # lexical_errors finds them from the tokens
+
+    self.lexer = Lexer('', max_errors=sys.maxsize)
+
+    self.load(source)
+
+  def load(self, source: str):
+
+    self.text = BlockText(source)
+
+    self.lexer.line_index = self.text
+
+    self.head = Lexer(source, max_errors=sys.maxsize).tokenize_buffer()
+
+    self.head.source = None # Values are read from self.text
+
+    self.tail = TokenBuffer(None)
+
+    self.start_shift = 0
+
+    self.analyze()
+
+  @property
+
+  def source(self) -> str:
+
+    return str(self.text)
+
+  def __len__(self):
+
+    return len(self.head) + len(self.tail)
+
+  def __getitem__(self, index: int) -> Token:
+
+    if index < 0:
+
+      index += len(self)
+
+    return self._token(*self._entry(index))
+
+  def __iter__(self) -> Iterator[Token]:
+
+    for index in range(len(self)):
+
+      yield self[index]
+
+  def _entry(self, index: int) -> Tuple[int, int, int]:
+
+    # Type code, start and length of token index
+
+    head = self.head
+
+    if index < len(head):
+
+      return head.types[index], head.starts[index], head.lengths[index]
+
+    tail = self.tail
+
+    index = len(head) + len(tail) - 1 - index
+
+    return tail.types[index], tail.starts[index] + self.start_shift, tail.lengths[index]
+
+  def _token(self, code: int, start: int, length: int) -> Token:
+
+    # A string's token starts at its quote, one before its value
+
+    return Token(_TOKEN_TYPES[code], self.text.slice(start, start + length), start - (code == _STRING_CODE), self.text)
+
+  @property
+
+  def types(self) -> bytes:
+
+    # Type codes of all tokens in order, see SemanticAnalyzer.analyze_indexed
+
+    return self.head.types.tobytes() + self.tail.types.tobytes()[::-1]
+
+  def buffer(self) -> TokenBuffer:
+
+    # All tokens in one TokenBuffer over the current source
+
+    buffer = TokenBuffer(self.source)
+
+    head = self.head
+
+    tail = self.tail
+
+    buffer.types = head.types + tail.types[::-1]
+
+    buffer.starts = head.starts + array('q', map(self.start_shift.__add__, tail.starts[::-1]))
+
+    buffer.lengths = head.lengths + tail.lengths[::-1]
+
+    return buffer
+
+  def check(self) -> SemanticAnalyzer:
+
+    # The analysis analyze_code runs, parsing the tokens and resolving names
+
+    # through scopes, without the optimizer, run once per version of the
+
+    # document. It costs a full analysis, so it is for when the document is
+
+    # saved or idle rather than every edit.
+
+    if self._checked is None:
+
+      analyzer = SemanticAnalyzer(optimize=False)
+
+      analyzer.analyze(self.buffer())
+
+      self._checked = analyzer
+
+    return self._checked
+
+  @property
+
+  def errors(self) -> List[str]:
+
+    # Syntax and semantic errors, as analyze_code's semantic_errors
+
+    return self.check().errors
+
+  @property
+
+  def warnings(self) -> List[str]:
+
+    return self.check().warnings
+
+  @property
+
+  def symbol_table(self) -> Dict[str, Dict]:
+
+    # The program scope's declarations, functions included
+
+    return self.check().symbol_table
+
+  @property
+
+  def declaration_errors(self) -> List[str]:
+
+    # Malformed declarations, in document order
+
+    if self._declaration_errors is None:
+
+      text = self.text
+
+      found = sorted((text.offset(declaration), declaration.problem) for declaration in self.malformed)
+
+      self._declaration_errors = [problem + str(text.line(offset)) for offset, problem in found]
+
+    return self._declaration_errors
+
+  @property
+
+  def declared(self) -> _Declared:
+
+    return _Declared(self)
+
+  @property
+
+  def lexical_errors(self) -> List[str]:
+
+    # The messages a recovering Lexer gives for the invalid characters
+
+    if self._lexical_errors is None:
+
+      errors = []
+
+      types = self.types
+
+      index = types.find(_ERROR_CODE)
+
+      while index >= 0:
+
+        code, offset, length = self._entry(index)
+
+        char = self.text.slice(offset, offset + 1)
+
+        if char == '!':
+
+          # '!' reports the character after it, see Lexer.scan_chunks
+
+          offset += 1
+
+          char = self.text.slice(offset, offset + 1) or None
+
+        message = str(self.lexer.error(char, offset))
+
+        if not errors or errors[-1] != message:
+
+          errors.append(message)
+
+        index = types.find(_ERROR_CODE, index + 1)
+
+      self._lexical_errors = errors
+
+    return self._lexical_errors
+
+  def analyze(self):
+
+    # Finds every declaration afresh
+
+    self.text.anchors.clear()
+
+    # Well-formed declarations by name, and the malformed declarations
+
+    self.names: Dict[str, Set[_Declaration]] = {}
+
+    self.malformed: Set[_Declaration] = set()
+
+    self._declare(0)
+
+    self._declaration_errors = self._lexical_errors = self._checked = None
+
+  def _declare(self, first: int):
+
+    # Adds the declarations among the head tokens from first on; the tokens
+
+    # after them may be in tail
+
+    head = self.head
+
+    count = len(self)
+
+    for match in _DECLARATION_CODES.finditer(memoryview(head.types)[first:]):
+
+      index = first + match.start()
+
+      declaration = _Declaration()
+
+      declaration.constant = head.types[index] == _CONST_CODE
+
+      declaration.name = declaration.problem = None
+
+      if index + 2 >= count:
+
+        declaration.problem = "Invalid variable declaration at line "
+
+      else:
+
+        name_code, name_start, name_length = self._entry(index + 1)
+
+        if name_code != _IDENTIFIER_CODE:
+
+          declaration.problem = f"Expected identifier after {'const' if declaration.constant else 'var'} at line "
+
+        elif self._entry(index + 2)[0] != _ASSIGN_CODE:
+
+          declaration.problem = "Expected '=' after variable name at line "
+
+        else:
+
+          declaration.name = self.text.slice(name_start, name_start + name_length)
+
+      self.text.anchor(declaration, head.starts[index])
+
+      if declaration.name is None:
+
+        self.malformed.add(declaration)
+
+        continue
+
+      declarations = self.names.get(declaration.name)
+
+      if declarations is None:
+
+        self.names[declaration.name] = {declaration}
+
+      else:
+
+        declarations.add(declaration)
+
+  def _forget(self, declaration: _Declaration):
+
+    self.text.release(declaration)
+
+    name = declaration.name
+
+    if name is None:
+
+      self.malformed.discard(declaration)
+
+      return
+
+    declarations = self.names[name]
+
+    declarations.discard(declaration)
+
+    if not declarations:
+
+      del self.names[name]
+
+  def edit(self, offset: int, deleted: int, inserted: str) -> int:
+
+    # Replaces deleted characters at offset with inserted and brings tokens
+
+    # and declarations up to date. Returns the number of tokens re-lexed.
+
+    # The new text is lexed before anything is changed.
+
+    text = self.text
+
+    if offset < 0 or deleted < 0 or offset + deleted > len(text):
+
+      raise ValueError(f"Edit at {offset}+{deleted} is outside the document")
+
+    head = self.head
+
+    tail = self.tail
+
+    self._move_gap(offset)
+
+    # Two more tokens are re-lexed on each side of the damage, so every
+
+    # declaration whose var/const, name or '=' is touched is seen whole
+
+    self._push_tail(min(2, len(head)))
+
+    restart = self._end(head.types[-1], head.starts[-1], head.lengths[-1]) if len(head) else 0
+
+    damage_end = offset + deleted
+
+    edit_end = offset + len(inserted)
+
+    delta = len(inserted) - deleted
+
+    shift = self.start_shift
+
+    # The old tokens after the gap are tail[count - 1], tail[count - 2], ...
+
+    # and the new ones replace the first dropped of them, starting with
+
+    # those overlapping the edit
+
+    count = len(tail)
+
+    dropped = 0
+
+    while dropped < count and tail.starts[count - 1 - dropped] + shift < damage_end:
+
+      dropped += 1
+
+    added = []
+
+    after_damage = 0
+
+    self.lexer.errors = []
+
+    # The text as the edit leaves it; offsets from the scan are relative to
+
+    # restart
+
+    scan = self.lexer.scan_chunks(chain(text.chunks(restart, offset), (inserted,), text.chunks(damage_end)))
+
+    for token_type, value, start in scan:
+
+      start += restart
+
+      # Old tokens the new stream has moved past go as well
+
+      while dropped < count and tail.starts[count - 1 - dropped] + shift + delta < start:
+
+        dropped += 1
+
+      # Once past the damage, an old token at the same place with the same
+
+      # type and length means the rest of the old stream holds
+
+      if after_damage >= 2 and dropped < count:
+
+        index = count - 1 - dropped
+
+        if tail.types[index] == token_type.value and tail.starts[index] + shift + delta == start and tail.lengths[index] == len(value):
+
+          break
+
+      added.append((token_type, start, len(value)))
+
+      if start > edit_end:
+
+        after_damage += 1
+
+    else:
+
+      dropped = count
+
+    # The dropped tokens are all those from restart up to the first one
+
+    # kept, so their declarations are the ones anchored there
+
+    kept_start = tail.starts[count - 1 - dropped] + shift if dropped < count else len(text) + 1
+
+    for declaration in text.anchored(restart, kept_start):
+
+      self._forget(declaration)
+
+    text.replace(offset, deleted, inserted)
+
+    if dropped:
+
+      del tail.types[count - dropped:]
+
+      del tail.starts[count - dropped:]
+
+      del tail.lengths[count - dropped:]
+
+    first = len(head)
+
+    for token_type, start, length in added:
+
+      head.append(token_type, start, length)
+
+    self.start_shift += delta
+
+    self._declare(first)
+
+    self._declaration_errors = self._lexical_errors = self._checked = None
+
+    return len(added)
+
+  @staticmethod
+
+  def _end(code: int, start: int, length: int) -> int:
+
+    # Where the scanner resumes after a token: strings also own their closing quote
+
+    return start + length + (code == TokenType.STRING.value)
+
+  def _move_gap(self, offset: int):
+
+    # Leaves exactly the tokens that end before offset in head. Only the
+
+    # last token starting before offset can reach past it.
+
+    head = self.head
+
+    tail = self.tail
+
+    keep = bisect_left(head.starts, offset)
+
+    if keep and self._end(head.types[keep - 1], head.starts[keep - 1], head.lengths[keep - 1]) >= offset:
+
+      keep -= 1
+
+    if keep < len(head):
+
+      self._push_tail(len(head) - keep)
+
+      return
+
+    # tail runs backwards, so its starts descend: find how many at its end
+
+    # start before offset
+
+    target = offset - self.start_shift
+
+    low, high = 0, len(tail)
+
+    while low < high:
+
+      middle = (low + high) // 2
+
+      if tail.starts[len(tail) - 1 - middle] < target:
+
+        low = middle + 1
+
+      else:
+
+        high = middle
+
+    take = low
+
+    if take:
+
+      index = len(tail) - take
+
+      if self._end(tail.types[index], tail.starts[index] + self.start_shift, tail.lengths[index]) >= offset:
+
+        take -= 1
+
+    self._take_tail(take)
+
+  def _push_tail(self, count: int):
+
+    # Moves the last count tokens of head onto tail
+
+    if count:
+
+      self._transfer(self.head, self.tail, count, -self.start_shift)
+
+  def _take_tail(self, count: int):
+
+    # Moves the last count tokens of tail (the first after the gap) onto head
+
+    if count:
+
+      self._transfer(self.tail, self.head, count, self.start_shift)
+
+  @staticmethod
+
+  def _transfer(source: TokenBuffer, target: TokenBuffer, count: int, start_shift: int):
+
+    for name in ('types', 'starts', 'lengths'):
+
+      column = getattr(source, name)
+
+      if np is not None and count >= _NUMPY_RUN:
+
+        # Reversed and shifted in one pass, many times faster for long runs
+
+        moved = np.frombuffer(column, column.typecode)[-count:][::-1]
+
+        if name == 'starts':
+
+          moved = moved + start_shift
+
+        getattr(target, name).frombytes(moved.tobytes())
+
+        # Releases the view of column, which cannot shrink while it exists
+
+        del moved
+
+        del column[-count:]
+
+        continue
+
+      moved = column[-count:]
+
+      del column[-count:]
+
+      moved.reverse()
+
+      if name == 'starts':
+
+        target.starts.extend(map(start_shift.__add__, moved))
+
+      else:
+
+        getattr(target, name).extend(moved)
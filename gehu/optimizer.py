@@ -0,0 +1,777 @@
+from array import array
+
+from typing import Dict, List, Optional, Tuple
+
+from gehu.parser import Ast, NodeKind, recursion_room
+
+_PROGRAM = NodeKind.PROGRAM.value
+
+_BLOCK = NodeKind.BLOCK.value
+
+_VAR = NodeKind.VAR.value
+
+_CONST = NodeKind.CONST.value
+
+_FUNCTION = NodeKind.FUNCTION.value
+
+_IF = NodeKind.IF.value
+
+_WHILE = NodeKind.WHILE.value
+
+_FOR = NodeKind.FOR.value
+
+_RETURN = NodeKind.RETURN.value
+
+_EXPRESSION = NodeKind.EXPRESSION.value
+
+_EMPTY = NodeKind.EMPTY.value
+
+_ASSIGN = NodeKind.ASSIGN.value
+
+_BINARY = NodeKind.BINARY.value
+
+_NEGATE = NodeKind.NEGATE.value
+
+_CALL = NodeKind.CALL.value
+
+_NAME = NodeKind.NAME.value
+
+_NUMBER = NodeKind.NUMBER.value
+
+_STRING = NodeKind.STRING.value
+
+# Node kinds that only group other nodes, left out of the operation count
+
+_STRUCTURAL = (_PROGRAM, _BLOCK, _EXPRESSION, _EMPTY, _FUNCTION)
+
+# Rewrites stop when a round changes nothing, or after this many
+
+MAX_ROUNDS = 10
+
+# Longest string that concatenating two literals is folded into
+
+MAX_FOLDED_STRING = 256
+
+# What fold() returns for operands it leaves to run time
+
+_UNFOLDABLE = object()
+
+def fold(operator: str, left, right):
+
+  # left operator right as gehu.vm computes it, or _UNFOLDABLE where that
+
+  # would fail at run time or build a long string
+
+  if type(left) is int and type(right) is int:
+
+    if operator == '+':
+
+      return left + right
+
+    if operator == '-':
+
+      return left - right
+
+    if operator == '*':
+
+      return left * right
+
+    if operator == '/' and right != 0:
+
+      return left // right
+
+  elif type(left) is str and type(right) is str:
+
+    if operator == '+' and len(left) + len(right) <= MAX_FOLDED_STRING:
+
+      return left + right
+
+  if operator == '==':
+
+    return 1 if left == right else 0
+
+  if operator == '!=':
+
+    return 0 if left == right else 1
+
+  return _UNFOLDABLE
+
+def census(ast: Ast) -> Dict[str, int]:
+
+  # The size of a tree: its nodes, and the ones that do work at run time
+
+  nodes = len(ast)
+
+  return {
+
+    'nodes': nodes,
+
+    'operations': nodes - sum(ast.kinds.count(kind) for kind in _STRUCTURAL)
+
+  }
+
+class Optimizer:
+
+  # Shrinks an Ast that analyzed without errors, using the declarations
+
+  # gehu.scopes resolved for it:
+
+  #   - arithmetic and comparisons of literals are folded into a literal,
+
+  #   - a const whose initializer is a literal is replaced by it at each use,
+
+  #   - an if, while or for whose condition is a literal loses the test and
+
+  #     any branch it can never take,
+
+  #   - a var or const that is never read is dropped, together with the
+
+  #     assignments to it; initializers and assigned values that may have an
+
+  #     effect (a call, or arithmetic that may fail) stay as expressions.
+
+  # Each round rebuilds the tree into a new Ast over the same tokens, with
+
+  # folded values in Ast.literals. Pruning a branch can leave a var unread,
+
+  # so a round that prunes one is followed by another.
+
+  #
+
+  # stats: node and operation counts before and after, and the number of
+
+  # folds, propagated uses, removed branches and removed bindings
+
+  def __init__(self, ast: Ast, declarations: array):
+
+    self.ast = ast
+
+    self.declarations = declarations
+
+    self.stats = {
+
+      'before': census(ast),
+
+      'after': census(ast),
+
+      'folded': 0,
+
+      'propagated': 0,
+
+      'branches_removed': 0,
+
+      'bindings_removed': 0
+
+    }
+
+  def optimize(self) -> Tuple[Ast, array]:
+
+    # The optimized tree and the declarations resolved for it
+
+    stats = self.stats
+
+    for _ in range(MAX_ROUNDS):
+
+      pruned = stats['branches_removed']
+
+      self.ast, self.declarations = _Round(self.ast, self.declarations, stats).run()
+
+      if stats['branches_removed'] == pruned:
+
+        break
+
+    stats['after'] = census(self.ast)
+
+    return self.ast, self.declarations
+
+class _Round:
+
+  # One rebuild of old into a new Ast. Methods take old node numbers and
+
+  # return new ones; statement() and effect() return None for what they
+
+  # drop. Nodes built for something dropped are rolled back at once.
+
+  def __init__(self, old: Ast, declarations: array, stats: Dict):
+
+    self.old = old
+
+    self.declarations = declarations
+
+    self.stats = stats
+
+    self.new = Ast(old.tokens)
+
+    # For each old declaring node, its new node
+
+    self.mapping = array('i', (-1,)) * len(old)
+
+    # For each new node, the old declaration it refers to, or -1
+
+    self.references = array('i')
+
+    # Literal values of consts, by old declaring node
+
+    self.values = {}
+
+    self.reads = self.count_reads()
+
+  def count_reads(self) -> array:
+
+    # How often each declaration is read, not counting reads this round
+
+    # drops: those in expressions evaluated only for their effects that
+
+    # have none, including the initializers of vars that end up unread and
+
+    # the values assigned to them by assignments whose own value is not
+
+    # used. Such expressions are only recognized before folding, which may
+
+    # miss a few.
+
+    old = self.old
+
+    kinds = old.kinds
+
+    children = old.children
+
+    first_children = old.first_children
+
+    declarations = self.declarations
+
+    reads = array('i', (0,)) * len(old)
+
+    assignments = {}
+
+    for node in range(len(old)):
+
+      kind = kinds[node]
+
+      if kind == _NAME:
+
+        if declarations[node] >= 0:
+
+          reads[declarations[node]] += 1
+
+      elif kind == _ASSIGN:
+
+        # The target came first and is no read
+
+        declaration = declarations[children[first_children[node]]]
+
+        if declaration >= 0:
+
+          reads[declaration] -= 1
+
+          assignments.setdefault(declaration, []).append(node)
+
+    unread = []
+
+    for node in range(len(old)):
+
+      kind = kinds[node]
+
+      if kind == _EXPRESSION:
+
+        unread.append(children[first_children[node]])
+
+      elif kind == _FOR:
+
+        first = first_children[node]
+
+        if kinds[children[first]] != _VAR and kinds[children[first]] != _CONST:
+
+          unread.append(children[first])
+
+        unread.append(children[first + 2])
+
+    # An assignment used as a value, as in print(b = c), leaves its value
+
+    # behind when its target goes, so that value is still read
+
+    effects = set(unread)
+
+    dead = [node for node in range(len(old)) if (kinds[node] == _VAR or kinds[node] == _CONST) and not reads[node]]
+
+    while unread or dead:
+
+      if not unread:
+
+        declaration = dead.pop()
+
+        unread.append(children[first_children[declaration]])
+
+        unread.extend(children[first_children[assignment] + 1] for assignment in assignments.get(declaration, ()) if assignment in effects)
+
+        continue
+
+      for name in self.pure_names(unread.pop()):
+
+        declaration = declarations[name]
+
+        if declaration >= 0:
+
+          reads[declaration] -= 1
+
+          if not reads[declaration] and (kinds[declaration] == _VAR or kinds[declaration] == _CONST):
+
+            dead.append(declaration)
+
+    return reads
+
+  def pure_names(self, node: int) -> List[int]:
+
+    # The NAME nodes in old node if it calls nothing and cannot fail, else
+
+    # none
+
+    old = self.old
+
+    kinds = old.kinds
+
+    names = []
+
+    stack = [node]
+
+    while stack:
+
+      node = stack.pop()
+
+      kind = kinds[node]
+
+      if kind == _NAME:
+
+        names.append(node)
+
+      elif kind == _BINARY and old.text(node) in ('==', '!='):
+
+        stack.extend(old.child_nodes(node))
+
+      elif kind != _NUMBER and kind != _STRING:
+
+        return []
+
+    return names
+
+  def run(self) -> Tuple[Ast, array]:
+
+    old = self.old
+
+    new = self.new
+
+    # Each level of nesting costs at most two frames
+
+    with recursion_room(2 * len(old) + 100):
+
+      statements = self.statements(old.child_nodes(old.root))
+
+    self.add(_PROGRAM, old.token_indexes[old.root], statements)
+
+    mapping = self.mapping
+
+    return new, array('i', (mapping[declaration] if declaration >= 0 else -1 for declaration in self.references))
+
+  def add(self, kind: int, token: int, children=(), reference: int = -1) -> int:
+
+    self.references.append(reference)
+
+    return self.new.add(kind, token, children)
+
+  def copy(self, node: int, children=(), reference: int = -1) -> int:
+
+    # A new node like old node, over new children
+
+    new = self.add(self.old.kinds[node], self.old.token_indexes[node], children, reference)
+
+    if node in self.old.literals:
+
+      self.new.literals[new] = self.old.literals[node]
+
+    return new
+
+  def discard(self, mark: Tuple[int, int]):
+
+    # Drops the new nodes added since mark
+
+    self.new.rollback(mark)
+
+    del self.references[mark[0]:]
+
+  def literal(self, value, node: int) -> int:
+
+    # A new NUMBER or STRING node for value, at old node's token
+
+    new = self.add(_NUMBER if type(value) is int else _STRING, self.old.token_indexes[node])
+
+    self.new.literals[new] = value
+
+    return new
+
+  def empty(self, node: int) -> int:
+
+    return self.add(_EMPTY, self.old.token_indexes[node])
+
+  def is_literal(self, node: int) -> bool:
+
+    kind = self.new.kinds[node]
+
+    return kind == _NUMBER or kind == _STRING
+
+  def is_pure(self, node: int) -> bool:
+
+    # Whether new node can be skipped: it calls nothing and cannot fail
+
+    new = self.new
+
+    kind = new.kinds[node]
+
+    if kind == _NUMBER or kind == _STRING or kind == _NAME:
+
+      return True
+
+    if kind == _BINARY and new.text(node) in ('==', '!='):
+
+      return all(self.is_pure(child) for child in new.child_nodes(node))
+
+    return False
+
+  def dropped(self, declaration: int) -> bool:
+
+    # Whether declaration is a var or const this round drops
+
+    kind = self.old.kinds[declaration] if declaration >= 0 else 0
+
+    return (kind == _VAR or kind == _CONST) and not self.reads[declaration]
+
+  def statements(self, statements) -> List[int]:
+
+    rebuilt = []
+
+    for statement in statements:
+
+      node = self.statement(statement)
+
+      if node is not None:
+
+        rebuilt.append(node)
+
+    return rebuilt
+
+  def statement(self, node: int) -> Optional[int]:
+
+    old = self.old
+
+    new = self.new
+
+    kind = old.kinds[node]
+
+    children = old.child_nodes(node)
+
+    if kind == _EXPRESSION:
+
+      expression = self.effect(children[0])
+
+      return None if expression is None else self.copy(node, (expression,))
+
+    if kind == _VAR or kind == _CONST:
+
+      mark = new.mark()
+
+      initializer = self.expression(children[0])
+
+      if kind == _CONST and self.is_literal(initializer):
+
+        # Every use comes later in the source and gets the value instead
+
+        self.values[node] = new.value(initializer)
+
+        self.stats['bindings_removed'] += 1
+
+        self.discard(mark)
+
+        return None
+
+      if self.dropped(node):
+
+        self.stats['bindings_removed'] += 1
+
+        if self.is_pure(initializer):
+
+          self.discard(mark)
+
+          return None
+
+        return self.add(_EXPRESSION, new.token_indexes[initializer], (initializer,))
+
+      self.mapping[node] = self.copy(node, (initializer,))
+
+      return self.mapping[node]
+
+    if kind == _BLOCK:
+
+      return self.copy(node, self.statements(children))
+
+    if kind == _IF:
+
+      return self.if_statement(node, children)
+
+    if kind == _WHILE or kind == _FOR:
+
+      return self.loop(node, kind, children)
+
+    if kind == _RETURN:
+
+      return self.copy(node, [self.expression(child) for child in children])
+
+    if kind == _FUNCTION:
+
+      parameters = []
+
+      for parameter in children[:-1]:
+
+        self.mapping[parameter] = self.copy(parameter)
+
+        parameters.append(self.mapping[parameter])
+
+      self.mapping[node] = self.copy(node, parameters + [self.statement(children[-1])])
+
+      return self.mapping[node]
+
+    return None
+
+  def branch(self, node: int) -> int:
+
+    # A statement that has to stay, as EMPTY if it was dropped
+
+    statement = self.statement(node)
+
+    return self.empty(node) if statement is None else statement
+
+  def if_statement(self, node: int, children) -> Optional[int]:
+
+    mark = self.new.mark()
+
+    condition = self.expression(children[0])
+
+    otherwise = children[2] if len(children) == 3 else None
+
+    if self.is_literal(condition):
+
+      taken, dead = (children[1], otherwise) if self.new.value(condition) else (otherwise, children[1])
+
+      # A branch that is a bare declaration declares into the enclosing
+
+      # scope, where later statements may use it
+
+      if dead is None or self.old.kinds[dead] not in (_VAR, _CONST):
+
+        self.stats['branches_removed'] += 1
+
+        self.discard(mark)
+
+        return None if taken is None else self.statement(taken)
+
+    rebuilt = [condition, self.branch(children[1])]
+
+    if otherwise is not None:
+
+      statement = self.statement(otherwise)
+
+      if statement is not None:
+
+        rebuilt.append(statement)
+
+    return self.copy(node, rebuilt)
+
+  def loop(self, node: int, kind: int, children) -> Optional[int]:
+
+    # While and for loops: a false condition leaves only a for's
+
+    # initializer, a true one is dropped as if it was omitted
+
+    old = self.old
+
+    new = self.new
+
+    if kind == _FOR:
+
+      initializer = children[0]
+
+      if old.kinds[initializer] == _VAR or old.kinds[initializer] == _CONST:
+
+        initializer = self.statement(initializer)
+
+        if initializer is not None and new.kinds[initializer] == _EXPRESSION:
+
+          initializer = new.child_nodes(initializer)[0]
+
+      elif old.kinds[initializer] != _EMPTY:
+
+        initializer = self.effect(initializer)
+
+      else:
+
+        initializer = None
+
+      if initializer is None:
+
+        initializer = self.empty(children[0])
+
+      condition = children[1]
+
+    else:
+
+      condition = children[0]
+
+    if old.kinds[condition] == _EMPTY:
+
+      condition = self.empty(condition)
+
+    else:
+
+      mark = new.mark()
+
+      condition = self.expression(condition)
+
+      if self.is_literal(condition):
+
+        self.stats['branches_removed'] += 1
+
+        value = new.value(condition)
+
+        self.discard(mark)
+
+        if not value:
+
+          if kind == _WHILE or new.kinds[initializer] == _EMPTY:
+
+            return None
+
+          # Only the initializer runs
+
+          if new.kinds[initializer] == _VAR or new.kinds[initializer] == _CONST:
+
+            return initializer
+
+          return self.add(_EXPRESSION, new.token_indexes[initializer], (initializer,))
+
+        condition = self.empty(children[1 if kind == _FOR else 0])
+
+    if kind == _WHILE:
+
+      return self.copy(node, (condition, self.branch(children[1])))
+
+    update = None
+
+    if old.kinds[children[2]] != _EMPTY:
+
+      update = self.effect(children[2])
+
+    if update is None:
+
+      update = self.empty(children[2])
+
+    return self.copy(node, (initializer, condition, update, self.branch(children[3])))
+
+  def effect(self, node: int) -> Optional[int]:
+
+    # An expression evaluated for its effects, or None if it has none
+
+    old = self.old
+
+    mark = self.new.mark()
+
+    if old.kinds[node] == _ASSIGN and self.dropped(self.declarations[old.child_nodes(node)[0]]):
+
+      expression = self.expression(old.child_nodes(node)[1])
+
+    else:
+
+      expression = self.expression(node)
+
+    if self.is_pure(expression):
+
+      self.discard(mark)
+
+      return None
+
+    return expression
+
+  def expression(self, node: int) -> int:
+
+    old = self.old
+
+    new = self.new
+
+    kind = old.kinds[node]
+
+    if kind == _NAME:
+
+      declaration = self.declarations[node]
+
+      if declaration in self.values:
+
+        self.stats['propagated'] += 1
+
+        return self.literal(self.values[declaration], node)
+
+      return self.copy(node, (), declaration)
+
+    if kind == _BINARY:
+
+      mark = new.mark()
+
+      left, right = [self.expression(child) for child in old.child_nodes(node)]
+
+      if self.is_literal(left) and self.is_literal(right):
+
+        value = fold(old.text(node), new.value(left), new.value(right))
+
+        if value is not _UNFOLDABLE:
+
+          self.stats['folded'] += 1
+
+          self.discard(mark)
+
+          return self.literal(value, node)
+
+      return self.copy(node, (left, right))
+
+    if kind == _NEGATE:
+
+      mark = new.mark()
+
+      operand = self.expression(old.child_nodes(node)[0])
+
+      if new.kinds[operand] == _NUMBER:
+
+        value = -new.value(operand)
+
+        self.stats['folded'] += 1
+
+        self.discard(mark)
+
+        return self.literal(value, node)
+
+      return self.copy(node, (operand,))
+
+    if kind == _ASSIGN:
+
+      target, value = old.child_nodes(node)
+
+      declaration = self.declarations[target]
+
+      if self.dropped(declaration):
+
+        return self.expression(value)
+
+      name = self.copy(target, (), declaration)
+
+      return self.copy(node, (name, self.expression(value)))
+
+    if kind == _CALL:
+
+      return self.copy(node, [self.expression(child) for child in old.child_nodes(node)])
+
+    return self.copy(node)
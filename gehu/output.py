@@ -0,0 +1,275 @@
+import json
+
+import sys
+
+from itertools import islice
+
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+
+from gehu import TokenBuffer, TokenType, analysis_lines
+
+# Report formats of the analyze command
+
+FORMATS = ('text', 'json', 'ndjson')
+
+# Records joined into one write; big enough that writes cost little per
+
+# record, small enough that output keeps flowing
+
+BATCH_SIZE = 4096
+
+# TokenType names indexed by the codes in a TokenBuffer
+
+_NAMES = (None,) + tuple(token_type.name for token_type in TokenType)
+
+# The C string escaper behind json.dumps, called directly: going through
+
+# json.dumps for every token value costs more than the rest of the record
+
+_quote = json.encoder.encode_basestring_ascii
+
+# json.dumps without spaces, matching the records built by hand
+
+to_json = json.JSONEncoder(separators=(',', ':')).encode
+
+def token_records(tokens, prefix: str = '{') -> Iterator[str]:
+
+  # Each token as a JSON object, built by hand rather than by dumping a dict
+
+  # per token. prefix opens each object, to put fields in front.
+
+  names = _NAMES
+
+  if isinstance(tokens, TokenBuffer):
+
+    rows = tokens.rows()
+
+  else:
+
+    rows = ((token.type.value, token.text, token.line, token.column) for token in tokens)
+
+  for code, value, line, column in rows:
+
+    yield f'{prefix}"type":"{names[code]}","value":{_quote(value)},"line":{line},"column":{column}}}'
+
+def write_batched(out: TextIO, lines: Iterable[str], separator: str = '\n', terminated: bool = True):
+
+  # Writes lines BATCH_SIZE at a time, each followed by separator, or with
+
+  # terminated false only separated by it
+
+  lines = iter(lines)
+
+  first = True
+
+  while True:
+
+    batch = list(islice(lines, BATCH_SIZE))
+
+    if not batch:
+
+      return
+
+    text = separator.join(batch)
+
+    if terminated:
+
+      text += separator
+
+    elif not first:
+
+      text = separator + text
+
+    out.write(text)
+
+    first = False
+
+def cache_stats(cache) -> Optional[Dict]:
+
+  return None if cache is None else {'hits': cache.hits, 'misses': cache.misses}
+
+class TextReport:
+
+  # The report gehu has always printed
+
+  stream_tokens = None
+
+  def __init__(self, out: TextIO = sys.stdout, quiet_tokens: bool = False):
+
+    self.out = out
+
+    self.quiet_tokens = quiet_tokens
+
+  def write(self, result: Dict, cache=None, path: Optional[str] = None):
+
+    if path is not None:
+
+      self.out.write(f"\n##### {path} #####\n")
+
+    write_batched(self.out, analysis_lines(result, not self.quiet_tokens))
+
+    if cache is not None:
+
+      self.out.write(f"\n=== Cache ===\n Hits: {cache.hits}, misses: {cache.misses}\n")
+
+  def error(self, message: str, path: Optional[str] = None):
+
+    if path is not None:
+
+      self.out.write(f"\n##### {path} #####\n")
+
+    self.out.write(f"Error: {message}\n")
+
+class JsonReport(TextReport):
+
+  # One JSON object per report, on one line:
+
+  #   {"path", "success", "error", "tokens": [{"type", "value", "line",
+
+  #    "column"}], "lexical_errors", "semantic_errors", "warnings",
+
+  #    "symbol_table", "optimization", "cache"}
+
+  # path, error and cache appear only when they apply, tokens not with
+
+  # quiet_tokens
+
+  def write(self, result: Dict, cache=None, path: Optional[str] = None):
+
+    out = self.out
+
+    fields = {} if path is None else {'path': path}
+
+    fields['success'] = result['success']
+
+    if 'error' in result:
+
+      fields['error'] = result['error']
+
+    head = to_json(fields)
+
+    if self.quiet_tokens:
+
+      out.write(head[:-1])
+
+    else:
+
+      out.write(head[:-1] + ',"tokens":[')
+
+      write_batched(out, token_records(result['tokens']), ',', False)
+
+      out.write(']')
+
+    fields = {name: result[name] for name in ('lexical_errors', 'semantic_errors', 'warnings', 'symbol_table', 'optimization')}
+
+    if cache is not None:
+
+      fields['cache'] = cache_stats(cache)
+
+    out.write(',' + to_json(fields)[1:] + '\n')
+
+  def error(self, message: str, path: Optional[str] = None):
+
+    fields = {} if path is None else {'path': path}
+
+    fields.update(success=False, error=message)
+
+    self.out.write(to_json(fields) + '\n')
+
+class NdjsonReport(TextReport):
+
+  # One JSON record per line, each with a "record" field naming its kind:
+
+  #   file (path, first in recursive reports), token (type, value, line,
+
+  #   column), lexical_error, semantic_error, warning (message), symbol
+
+  #   (name, type, line), optimization (its statistics), error (message),
+
+  #   cache (hits, misses) and result (success), which ends each report.
+
+  # Tokens are written as soon as lexing ends, while the rest of the
+
+  # analysis runs, through stream_tokens.
+
+  def __init__(self, out: TextIO = sys.stdout, quiet_tokens: bool = False):
+
+    super().__init__(out, quiet_tokens)
+
+    self.streamed = False
+
+    self.stream_tokens = None if quiet_tokens else self._stream_tokens
+
+  def _stream_tokens(self, tokens):
+
+    self.streamed = True
+
+    write_batched(self.out, token_records(tokens, '{"record":"token",'))
+
+    self.out.flush()
+
+  def write(self, result: Dict, cache=None, path: Optional[str] = None):
+
+    out = self.out
+
+    if path is not None:
+
+      out.write(to_json({'record': 'file', 'path': path}) + '\n')
+
+    if not self.quiet_tokens and not self.streamed:
+
+      # Cached results were never lexed here
+
+      write_batched(out, token_records(result['tokens'], '{"record":"token",'))
+
+    self.streamed = False
+
+    write_batched(out, self._records(result, cache))
+
+  def _records(self, result: Dict, cache) -> Iterator[str]:
+
+    if 'error' in result:
+
+      yield to_json({'record': 'error', 'message': result['error']})
+
+    for kind in ('lexical_error', 'semantic_error', 'warning'):
+
+      for message in result[kind + 's']:
+
+        yield to_json({'record': kind, 'message': message})
+
+    for name, info in result['symbol_table'].items():
+
+      yield to_json({'record': 'symbol', 'name': name, 'type': info['type'], 'line': info['line']})
+
+    if result.get('optimization'):
+
+      yield to_json({'record': 'optimization', **result['optimization']})
+
+    if cache is not None:
+
+      yield to_json({'record': 'cache', **cache_stats(cache)})
+
+    yield to_json({'record': 'result', 'success': result['success']})
+
+  def error(self, message: str, path: Optional[str] = None):
+
+    if path is not None:
+
+      self.out.write(to_json({'record': 'file', 'path': path}) + '\n')
+
+    self.out.write(to_json({'record': 'error', 'message': message}) + '\n')
+
+    self.out.write(to_json({'record': 'result', 'success': False}) + '\n')
+
+_REPORTS = {'text': TextReport, 'json': JsonReport, 'ndjson': NdjsonReport}
+
+def report_writer(format: str = 'text', out: TextIO = sys.stdout, quiet_tokens: bool = False) -> TextReport:
+
+  # A writer of analysis reports in format, one of FORMATS. Pass its
+
+  # stream_tokens, when not None, as analyze_code's or analyze_file's
+
+  # on_tokens to stream tokens before analysis ends.
+
+  return _REPORTS[format](out, quiet_tokens)
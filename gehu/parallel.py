@@ -0,0 +1,217 @@
+import os
+
+from typing import List, Optional, Tuple
+
+from gehu import Lexer, TokenBuffer, TokenType
+
+# Below this many characters per range the pool costs more than it saves
+
+MIN_CHUNK = 1 << 22
+
+# Chunks handed out per worker, so one slow chunk does not idle the others
+
+CHUNKS_PER_WORKER = 4
+
+def split_points(source, parts: int) -> List[Tuple[int, int]]:
+
+  # Cuts source (a string or ASCII bytes) into about parts ranges, each
+
+  # after the first starting right after a newline, so that no comment runs
+
+  # across a cut
+
+  newline = '\n' if isinstance(source, str) else b'\n'
+
+  bounds = []
+
+  start = 0
+
+  for part in range(1, parts):
+
+    cut = source.find(newline, max(len(source) * part // parts, start))
+
+    if cut < 0 or cut + 1 >= len(source):
+
+      break
+
+    bounds.append((start, cut + 1))
+
+    start = cut + 1
+
+  bounds.append((start, len(source)))
+
+  return bounds
+
+def _lex_chunk(chunk):
+
+  # Runs in a worker: lexes one range as if it were a whole source.
+
+  # A lexical error is only reported back; it may be an artifact of a
+
+  # range that really starts inside a string.
+
+  try:
+
+    lexer = Lexer(chunk) if isinstance(chunk, str) else Lexer.from_bytes(chunk)
+
+    buffer = lexer.tokenize_buffer()
+
+  except Exception:
+
+    return None
+
+  types = buffer.types
+
+  # A string still open at the end of the range ran into the split
+
+  last = len(types) - 2
+
+  open_string = last >= 0 and types[last] == TokenType.STRING.value and buffer.starts[last] + buffer.lengths[last] == len(chunk)
+
+  return types, buffer.starts, buffer.lengths, open_string
+
+def tokenize_parallel(lexer: Lexer, workers: Optional[int] = None) -> TokenBuffer:
+
+  # Lexes the whole source of lexer (a string, or ASCII bytes or an mmap)
+
+  # in ranges split at newlines across a process pool and merges the results
+
+  # into one TokenBuffer, identical to lexer.tokenize_buffer(). Token starts
+
+  # are offsets, so a range's tokens only need its start added. Sources too
+
+  # small for two ranges of MIN_CHUNK are lexed serially.
+
+  #
+
+  # A split can only land inside a string literal: comments end at the
+
+  # newline itself. Each range is lexed assuming it starts outside a string.
+
+  # When the range before it ends in an open string that guess was wrong,
+
+  # and the merge re-lexes from that string's quote, serially, until a token
+
+  # starts in a later range, whose own result is valid again.
+
+  #
+
+  # Workers do not recover from invalid characters: a range with one is
+
+  # re-lexed serially by lexer, which raises or records the errors (and
+
+  # stops at max_errors of them) as it would on its own.
+
+  workers = workers or os.cpu_count() or 1
+
+  source = lexer.source if lexer.data is None else lexer.data
+
+  parts = min(workers * CHUNKS_PER_WORKER, len(source) // MIN_CHUNK)
+
+  if workers < 2 or parts < 2:
+
+    return lexer.tokenize_buffer()
+
+  # Imported here, as only large sources start a pool
+
+  from concurrent.futures import ProcessPoolExecutor
+
+  bounds = split_points(source, parts)
+
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+
+    results = list(executor.map(_lex_chunk, (source[start:end] for start, end in bounds)))
+
+  if lexer.data is None:
+
+    buffer = TokenBuffer(source, lexer._line_index)
+
+    scan = lexer.scan_chunks
+
+    whole = (source,)
+
+  else:
+
+    buffer = TokenBuffer(memoryview(source), lexer._line_index)
+
+    scan = lexer.scan_bytes
+
+    whole = source
+
+  last = len(bounds) - 1
+
+  resume = None # Offset to re-lex from, after a misplaced split
+
+  index = 0
+
+  while index <= last:
+
+    start, end = bounds[index]
+
+    result = results[index]
+
+    if resume is None and result is not None:
+
+      types, starts, lengths, open_string = result
+
+      keep = len(types) if index == last else len(types) - 1 # Drops the range's EOF
+
+      if open_string and index != last:
+
+        keep -= 1
+
+        resume = start + starts[keep] - 1 # The string's quote
+
+      buffer.types.extend(types[:keep])
+
+      buffer.starts.extend(map(start.__add__, starts[:keep]))
+
+      buffer.lengths.extend(lengths[:keep])
+
+      index += 1
+
+      continue
+
+    if resume is None:
+
+      # A lexical error: re-lexing from the range start raises or records it
+
+      # with its true position
+
+      resume = start
+
+    reach = resume # End of the last token re-lexed
+
+    for token_type, value, offset in scan(whole, resume):
+
+      if token_type is TokenType.EOF:
+
+        # The end, or the last error allowed ended the tokens early
+
+        buffer.append(token_type, offset, len(value))
+
+        return buffer
+
+      # A string's offset is one past its quote
+
+      first = offset - (token_type is TokenType.STRING)
+
+      if index < last and first >= bounds[index][1]:
+
+        while index < last and first >= bounds[index][1]:
+
+          index += 1
+
+        if reach <= bounds[index][0]:
+
+          # No token runs across this range's start, so its result holds
+
+          resume = None
+
+          break
+
+      buffer.append(token_type, offset, len(value))
+
+      reach = offset + len(value) + (token_type is TokenType.STRING)
+
+  return buffer
@@ -0,0 +1,929 @@
+import sys
+
+import threading
+
+from array import array
+
+from contextlib import contextmanager
+
+from enum import Enum, auto
+
+from itertools import compress
+
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from gehu import Lexer, Token, TokenBuffer, TokenType
+
+class NodeKind(Enum):
+
+  # Statements
+
+  PROGRAM = auto() # statements...
+
+  BLOCK = auto() # statements...
+
+  VAR = auto() # initializer (EMPTY if it did not parse); name follows the keyword
+
+  CONST = auto() # initializer (EMPTY if it did not parse); name follows the keyword
+
+  FUNCTION = auto() # NAME parameters..., BLOCK body; name follows the keyword
+
+  IF = auto() # condition, then [, else]
+
+  WHILE = auto() # condition, body
+
+  FOR = auto() # initializer, condition, update, body (each maybe EMPTY)
+
+  RETURN = auto() # [value]
+
+  EXPRESSION = auto() # expression; an expression statement
+
+  EMPTY = auto() # nothing; an omitted for clause or a broken initializer
+
+  # Expressions
+
+  ASSIGN = auto() # NAME target, value
+
+  BINARY = auto() # left, right; the operator is the node's token
+
+  NEGATE = auto() # operand
+
+  CALL = auto() # callee, arguments...
+
+  NAME = auto()
+
+  NUMBER = auto()
+
+  STRING = auto()
+
+# NodeKind indexed by its value, to decode the codes stored in an Ast
+
+_NODE_KINDS = (None,) + tuple(NodeKind)
+
+_PROGRAM = NodeKind.PROGRAM.value
+
+_BLOCK = NodeKind.BLOCK.value
+
+_VAR = NodeKind.VAR.value
+
+_CONST = NodeKind.CONST.value
+
+_FUNCTION = NodeKind.FUNCTION.value
+
+_IF = NodeKind.IF.value
+
+_WHILE = NodeKind.WHILE.value
+
+_FOR = NodeKind.FOR.value
+
+_RETURN = NodeKind.RETURN.value
+
+_EXPRESSION = NodeKind.EXPRESSION.value
+
+_EMPTY = NodeKind.EMPTY.value
+
+_ASSIGN = NodeKind.ASSIGN.value
+
+_BINARY = NodeKind.BINARY.value
+
+_NEGATE = NodeKind.NEGATE.value
+
+_CALL = NodeKind.CALL.value
+
+_NAME = NodeKind.NAME.value
+
+_NUMBER = NodeKind.NUMBER.value
+
+_STRING = NodeKind.STRING.value
+
+# TokenType codes as stored in TokenBuffer.types
+
+_T_IF = TokenType.IF.value
+
+_T_ELSE = TokenType.ELSE.value
+
+_T_WHILE = TokenType.WHILE.value
+
+_T_FOR = TokenType.FOR.value
+
+_T_FUNCTION = TokenType.FUNCTION.value
+
+_T_RETURN = TokenType.RETURN.value
+
+_T_VAR = TokenType.VAR.value
+
+_T_CONST = TokenType.CONST.value
+
+_T_IDENTIFIER = TokenType.IDENTIFIER.value
+
+_T_NUMBER = TokenType.NUMBER.value
+
+_T_STRING = TokenType.STRING.value
+
+_T_PLUS = TokenType.PLUS.value
+
+_T_MINUS = TokenType.MINUS.value
+
+_T_MULTIPLY = TokenType.MULTIPLY.value
+
+_T_DIVIDE = TokenType.DIVIDE.value
+
+_T_ASSIGN = TokenType.ASSIGN.value
+
+_T_EQUALS = TokenType.EQUALS.value
+
+_T_NOT_EQUALS = TokenType.NOT_EQUALS.value
+
+_T_LPAREN = TokenType.LPAREN.value
+
+_T_RPAREN = TokenType.RPAREN.value
+
+_T_LBRACE = TokenType.LBRACE.value
+
+_T_RBRACE = TokenType.RBRACE.value
+
+_T_SEMICOLON = TokenType.SEMICOLON.value
+
+_T_COMMA = TokenType.COMMA.value
+
+_T_EOF = TokenType.EOF.value
+
+_T_ERROR = TokenType.ERROR.value
+
+# Tokens that start a statement, where parsing resumes after an error
+
+_STATEMENT_STARTS = frozenset((_T_VAR, _T_CONST, _T_FUNCTION, _T_IF, _T_WHILE, _T_FOR, _T_RETURN, _T_LBRACE))
+
+# Binding strength of the binary operators; anything else binds nothing
+
+_PRECEDENCE = {
+
+  _T_EQUALS: 1,
+
+  _T_NOT_EQUALS: 1,
+
+  _T_PLUS: 2,
+
+  _T_MINUS: 2,
+
+  _T_MULTIPLY: 3,
+
+  _T_DIVIDE: 3
+
+}
+
+_LITERALS = {
+
+  _T_IDENTIFIER: _NAME,
+
+  _T_NUMBER: _NUMBER,
+
+  _T_STRING: _STRING
+
+}
+
+class TokenList(list):
+
+  # Tokens from a stream, with the type codes and text() lookups a
+
+  # TokenBuffer offers, so the parser can read either
+
+  def __init__(self, tokens: Iterable[Token]):
+
+    super().__init__(tokens)
+
+    self.types = array('B', [token.type.value for token in self])
+
+  def text(self, index: int) -> str:
+
+    return self[index].text
+
+  def line(self, index: int) -> int:
+
+    return self[index].line
+
+# The frames each recursion_room in use, in any thread, asked for, and the
+
+# limit from before the first of them
+
+_rooms = []
+
+_rooms_limit = None
+
+_rooms_lock = threading.Lock()
+
+@contextmanager
+
+def recursion_room(frames: int):
+
+  # Raises the recursion limit to at least frames for the duration. From
+
+  # Python 3.11 on Python calls do not use the C stack, so the limit can
+
+  # safely grow with the input instead of capping nesting.
+
+  # The limit is process-wide, so while rooms overlap (gehu --server parses
+
+  # on several threads) it stays at the largest any of them needs, and only
+
+  # the last to end restores it.
+
+  global _rooms_limit
+
+  if sys.version_info < (3, 11):
+
+    yield
+
+    return
+
+  with _rooms_lock:
+
+    if not _rooms:
+
+      _rooms_limit = sys.getrecursionlimit()
+
+    _rooms.append(frames)
+
+    sys.setrecursionlimit(max([_rooms_limit] + _rooms))
+
+  try:
+
+    yield
+
+  finally:
+
+    with _rooms_lock:
+
+      _rooms.remove(frames)
+
+      sys.setrecursionlimit(max([_rooms_limit] + _rooms))
+
+class ParseError(Exception):
+
+  pass
+
+class Ast:
+
+  # Syntax tree nodes in parallel arrays instead of one object per node.
+
+  # Node i has kind kinds[i], the token at token_indexes[i] in tokens (its
+
+  # keyword, operator or literal) and the children
+
+  # children[first_children[i]:first_children[i] + child_counts[i]].
+
+  # Children are added before their parents, so the root is the last node
+
+  # and walking the node numbers in order visits the tree in post-order.
+
+  # NUMBER and STRING nodes made by gehu.optimizer have their value in
+
+  # literals rather than in their token.
+
+  def __init__(self, tokens: Union[TokenBuffer, TokenList]):
+
+    self.tokens = tokens
+
+    self.kinds = array('B')
+
+    self.token_indexes = array('I')
+
+    self.first_children = array('I')
+
+    self.child_counts = array('I')
+
+    self.children = array('I')
+
+    self.literals = {}
+
+  def mark(self) -> Tuple[int, int]:
+
+    return len(self.kinds), len(self.children)
+
+  def rollback(self, mark: Tuple[int, int]):
+
+    # Drops every node added since mark() returned mark
+
+    nodes, children = mark
+
+    if self.literals:
+
+      for node in range(nodes, len(self.kinds)):
+
+        self.literals.pop(node, None)
+
+    for column in (self.kinds, self.token_indexes, self.first_children, self.child_counts):
+
+      del column[nodes:]
+
+    del self.children[children:]
+
+  def add(self, kind: int, token: int, children=()) -> int:
+
+    # Appends a node of NodeKind value kind and returns its number
+
+    self.kinds.append(kind)
+
+    self.token_indexes.append(token)
+
+    self.first_children.append(len(self.children))
+
+    self.child_counts.append(len(children))
+
+    self.children.extend(children)
+
+    return len(self.kinds) - 1
+
+  def __len__(self):
+
+    return len(self.kinds)
+
+  @property
+
+  def root(self) -> int:
+
+    return len(self.kinds) - 1
+
+  def kind(self, node: int) -> NodeKind:
+
+    return _NODE_KINDS[self.kinds[node]]
+
+  def token(self, node: int) -> Token:
+
+    return self.tokens[self.token_indexes[node]]
+
+  def text(self, node: int) -> str:
+
+    return self.tokens.text(self.token_indexes[node])
+
+  def line(self, node: int) -> int:
+
+    return self.tokens.line(self.token_indexes[node])
+
+  def value(self, node: int) -> Union[int, str]:
+
+    # The value of a NUMBER or STRING node
+
+    if node in self.literals:
+
+      return self.literals[node]
+
+    text = self.tokens.text(self.token_indexes[node])
+
+    return int(text) if self.kinds[node] == _NUMBER else text
+
+  def child_nodes(self, node: int) -> array:
+
+    first = self.first_children[node]
+
+    return self.children[first:first + self.child_counts[node]]
+
+  def name(self, node: int) -> str:
+
+    # The name a NAME node refers to, or a VAR, CONST or FUNCTION declares
+
+    index = self.token_indexes[node]
+
+    if self.kinds[node] != _NAME:
+
+      index += 1
+
+    return self.tokens.text(index)
+
+  def describe(self, node: Optional[int] = None, depth: int = 0) -> Iterator[str]:
+
+    # One indented line per node, from node (the root by default) down
+
+    if node is None:
+
+      node = self.root
+
+    stack = [(node, depth)]
+
+    while stack:
+
+      node, depth = stack.pop()
+
+      token = self.token(node)
+
+      text = self.literals[node] if node in self.literals else token.text
+
+      yield f"{'  ' * depth}{self.kind(node).name} '{text}' line {token.line}"
+
+      stack.extend((child, depth + 1) for child in reversed(self.child_nodes(node)))
+
+  def nbytes(self) -> int:
+
+    # Memory held by the arrays, excluding the tokens
+
+    return sum(column.itemsize * len(column) for column in (self.kinds, self.token_indexes, self.first_children, self.child_counts, self.children))
+
+class Parser:
+
+  # Recursive descent over a TokenBuffer's type codes, one token of
+
+  # lookahead, building an Ast in a single pass:
+
+  #
+
+  #   program    = statement* EOF
+
+  #   statement  = ('var' | 'const') IDENTIFIER '=' expression ';'
+
+  #              | 'function' IDENTIFIER '(' [IDENTIFIER (',' IDENTIFIER)*] ')' block
+
+  #              | 'if' '(' expression ')' statement ['else' statement]
+
+  #              | 'while' '(' expression ')' statement
+
+  #              | 'for' '(' (declaration | [expression] ';') [expression] ';' [expression] ')' statement
+
+  #              | 'return' [expression] ';'
+
+  #              | block
+
+  #              | expression ';'
+
+  #   block      = '{' statement* '}'
+
+  #   expression = IDENTIFIER '=' expression | binary
+
+  #   binary     = unary (('==' | '!=' | '+' | '-' | '*' | '/') unary)*  by precedence
+
+  #   unary      = '-' unary | primary ('(' [expression (',' expression)*] ')')*
+
+  #   primary    = IDENTIFIER | NUMBER | STRING | '(' expression ')'
+
+  #
+
+  # With max_errors 0 the first syntax error raises a ParseError. Otherwise
+
+  # the statement it is in is dropped and recorded in errors, and parsing
+
+  # resumes after the next ';', or at the next '}' or statement keyword,
+
+  # until max_errors of them end the parse. ERROR tokens from a recovering
+
+  # lexer are left out; the lexer has reported them.
+
+  def __init__(self, tokens: Union[TokenBuffer, TokenList], max_errors: int = 0):
+
+    if _T_ERROR in tokens.types:
+
+      tokens = _without_errors(tokens)
+
+    self.tokens = tokens
+
+    self.types = tokens.types
+
+    self.position = 0
+
+    self.ast = Ast(tokens)
+
+    self.max_errors = max_errors
+
+    self.errors: List[str] = []
+
+  def error(self, expected: str) -> Exception:
+
+    token = self.tokens[self.position]
+
+    found = 'end of input' if token.type == TokenType.EOF else f"'{token.text}'"
+
+    return ParseError(f"Expected {expected} but found {found} at line {token.line}, column {token.column}")
+
+  def expect(self, code: int, expected: str) -> int:
+
+    # Consumes a token of type code and returns its index
+
+    position = self.position
+
+    if self.types[position] != code:
+
+      raise self.error(expected)
+
+    self.position = position + 1
+
+    return position
+
+  def parse(self) -> Ast:
+
+    # Every level of nesting costs at most three frames and one token
+
+    with recursion_room(3 * len(self.types) + 100):
+
+      statements = self.statements(_T_EOF)
+
+      self.ast.add(_PROGRAM, self.position, statements)
+
+    return self.ast
+
+  def statements(self, closing: int) -> List[int]:
+
+    # Statements up to the token of type closing or the end of input
+
+    statements = []
+
+    types = self.types
+
+    ast = self.ast
+
+    while types[self.position] != closing and types[self.position] != _T_EOF:
+
+      start = self.position
+
+      mark = ast.mark()
+
+      try:
+
+        statements.append(self.statement())
+
+      except ParseError as error:
+
+        if not self.max_errors:
+
+          raise
+
+        ast.rollback(mark)
+
+        self.report(error)
+
+        self.synchronize(start)
+
+        # A broken declaration still declares its name, with an EMPTY
+
+        # initializer, so that its uses are not reported as undeclared
+
+        code = types[start]
+
+        if (code == _T_VAR or code == _T_CONST) and types[start + 1] == _T_IDENTIFIER:
+
+          initializer = ast.add(_EMPTY, start + 2)
+
+          statements.append(ast.add(_VAR if code == _T_VAR else _CONST, start, (initializer,)))
+
+    return statements
+
+  def report(self, error: ParseError):
+
+    # Records a syntax error; the last one allowed skips to the end of input
+
+    self.errors.append(str(error))
+
+    if len(self.errors) >= self.max_errors:
+
+      self.position = len(self.types) - 1
+
+  def synchronize(self, start: int):
+
+    # Panic mode after an error in the statement at start: skips past the
+
+    # next ';', or up to a '}' or a keyword that starts a statement, having
+
+    # moved past start at least
+
+    types = self.types
+
+    position = max(self.position, start)
+
+    while True:
+
+      code = types[position]
+
+      if code == _T_EOF:
+
+        break
+
+      if code == _T_SEMICOLON:
+
+        position += 1
+
+        break
+
+      if position > start and (code == _T_RBRACE or code in _STATEMENT_STARTS):
+
+        break
+
+      position += 1
+
+    self.position = position
+
+  def statement(self) -> int:
+
+    code = self.types[self.position]
+
+    if code == _T_VAR or code == _T_CONST:
+
+      return self.declaration()
+
+    if code == _T_IF:
+
+      return self.if_statement()
+
+    if code == _T_LBRACE:
+
+      return self.block()
+
+    if code == _T_FUNCTION:
+
+      return self.function()
+
+    if code == _T_WHILE:
+
+      keyword = self.position
+
+      self.position += 1
+
+      condition = self.condition()
+
+      return self.ast.add(_WHILE, keyword, (condition, self.statement()))
+
+    if code == _T_FOR:
+
+      return self.for_statement()
+
+    if code == _T_RETURN:
+
+      keyword = self.position
+
+      self.position += 1
+
+      if self.types[self.position] == _T_SEMICOLON:
+
+        self.position += 1
+
+        return self.ast.add(_RETURN, keyword)
+
+      value = self.expression()
+
+      self.expect(_T_SEMICOLON, "';'")
+
+      return self.ast.add(_RETURN, keyword, (value,))
+
+    start = self.position
+
+    value = self.expression()
+
+    self.expect(_T_SEMICOLON, "';'")
+
+    return self.ast.add(_EXPRESSION, start, (value,))
+
+  def declaration(self) -> int:
+
+    keyword = self.position
+
+    self.position += 1
+
+    self.expect(_T_IDENTIFIER, 'a variable name')
+
+    self.expect(_T_ASSIGN, "'='")
+
+    value = self.expression()
+
+    self.expect(_T_SEMICOLON, "';'")
+
+    return self.ast.add(_VAR if self.types[keyword] == _T_VAR else _CONST, keyword, (value,))
+
+  def block(self) -> int:
+
+    brace = self.expect(_T_LBRACE, "'{'")
+
+    statements = self.statements(_T_RBRACE)
+
+    if self.types[self.position] == _T_RBRACE:
+
+      self.position += 1
+
+    elif not self.max_errors:
+
+      raise self.error("'}'")
+
+    elif len(self.errors) < self.max_errors:
+
+      # Unclosed at the end of input: the block still holds its statements
+
+      self.report(self.error("'}'"))
+
+    return self.ast.add(_BLOCK, brace, statements)
+
+  def function(self) -> int:
+
+    keyword = self.position
+
+    self.position += 1
+
+    self.expect(_T_IDENTIFIER, 'a function name')
+
+    self.expect(_T_LPAREN, "'('")
+
+    children = []
+
+    if self.types[self.position] != _T_RPAREN:
+
+      children.append(self.ast.add(_NAME, self.expect(_T_IDENTIFIER, 'a parameter name')))
+
+      while self.types[self.position] == _T_COMMA:
+
+        self.position += 1
+
+        children.append(self.ast.add(_NAME, self.expect(_T_IDENTIFIER, 'a parameter name')))
+
+    self.expect(_T_RPAREN, "')'")
+
+    children.append(self.block())
+
+    return self.ast.add(_FUNCTION, keyword, children)
+
+  def condition(self) -> int:
+
+    # A parenthesized if or while condition
+
+    self.expect(_T_LPAREN, "'('")
+
+    condition = self.expression()
+
+    self.expect(_T_RPAREN, "')'")
+
+    return condition
+
+  def if_statement(self) -> int:
+
+    keyword = self.position
+
+    self.position += 1
+
+    condition = self.condition()
+
+    children = [condition, self.statement()]
+
+    if self.types[self.position] == _T_ELSE:
+
+      self.position += 1
+
+      children.append(self.statement())
+
+    return self.ast.add(_IF, keyword, children)
+
+  def for_statement(self) -> int:
+
+    keyword = self.position
+
+    self.position += 1
+
+    self.expect(_T_LPAREN, "'('")
+
+    code = self.types[self.position]
+
+    if code == _T_VAR or code == _T_CONST:
+
+      initializer = self.declaration()
+
+    else:
+
+      initializer = self.optional(_T_SEMICOLON, "';'")
+
+    condition = self.optional(_T_SEMICOLON, "';'")
+
+    update = self.optional(_T_RPAREN, "')'")
+
+    return self.ast.add(_FOR, keyword, (initializer, condition, update, self.statement()))
+
+  def optional(self, code: int, expected: str) -> int:
+
+    # An expression or EMPTY, then the closing token of type code
+
+    if self.types[self.position] == code:
+
+      node = self.ast.add(_EMPTY, self.position)
+
+    else:
+
+      node = self.expression()
+
+    self.expect(code, expected)
+
+    return node
+
+  def expression(self) -> int:
+
+    position = self.position
+
+    types = self.types
+
+    if types[position] == _T_IDENTIFIER and types[position + 1] == _T_ASSIGN:
+
+      self.position = position + 2
+
+      target = self.ast.add(_NAME, position)
+
+      return self.ast.add(_ASSIGN, position + 1, (target, self.expression()))
+
+    return self.binary(1)
+
+  def binary(self, precedence: int) -> int:
+
+    # Precedence climbing: one call per operand instead of one per level
+
+    left = self.unary()
+
+    types = self.types
+
+    while True:
+
+      operator = self.position
+
+      strength = _PRECEDENCE.get(types[operator], 0)
+
+      if strength < precedence:
+
+        return left
+
+      self.position = operator + 1
+
+      right = self.binary(strength + 1)
+
+      left = self.ast.add(_BINARY, operator, (left, right))
+
+  def unary(self) -> int:
+
+    position = self.position
+
+    code = self.types[position]
+
+    if code == _T_MINUS:
+
+      self.position = position + 1
+
+      return self.ast.add(_NEGATE, position, (self.unary(),))
+
+    kind = _LITERALS.get(code)
+
+    if kind is not None:
+
+      self.position = position + 1
+
+      node = self.ast.add(kind, position)
+
+    elif code == _T_LPAREN:
+
+      self.position = position + 1
+
+      node = self.expression()
+
+      self.expect(_T_RPAREN, "')'")
+
+    else:
+
+      raise self.error('an expression')
+
+    while self.types[self.position] == _T_LPAREN:
+
+      node = self.call(node)
+
+    return node
+
+  def call(self, callee: int) -> int:
+
+    paren = self.position
+
+    self.position += 1
+
+    children = [callee]
+
+    if self.types[self.position] != _T_RPAREN:
+
+      children.append(self.expression())
+
+      while self.types[self.position] == _T_COMMA:
+
+        self.position += 1
+
+        children.append(self.expression())
+
+    self.expect(_T_RPAREN, "')'")
+
+    return self.ast.add(_CALL, paren, children)
+
+def _without_errors(tokens: Union[TokenBuffer, TokenList]) -> Union[TokenBuffer, TokenList]:
+
+  # A copy of tokens without their ERROR tokens
+
+  keep = [code != _T_ERROR for code in tokens.types]
+
+  if isinstance(tokens, TokenList):
+
+    return TokenList(compress(tokens, keep))
+
+  kept = TokenBuffer(tokens.source, tokens._line_index)
+
+  for name in ('types', 'starts', 'lengths'):
+
+    getattr(kept, name).extend(compress(getattr(tokens, name), keep))
+
+  return kept
+
+def parse(source: str) -> Ast:
+
+  # Lexes and parses source; raises on the first lexical or syntax error
+
+  return Parser(Lexer(source).tokenize_buffer()).parse()
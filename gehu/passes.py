@@ -0,0 +1,253 @@
+import re
+
+import sys
+
+import time
+
+from array import array
+
+from typing import Dict, List, Optional, Type
+
+from gehu.parser import Ast, NodeKind
+
+from gehu.scopes import Resolver
+
+_NUMBER = NodeKind.NUMBER.value
+
+_RETURN = NodeKind.RETURN.value
+
+class Pass:
+
+  # One analysis over an Ast. A pass that only needs to see nodes of some
+
+  # kinds lists them in kinds and gets visit(node) for each, in post-order;
+
+  # all such passes share a single sweep over the nodes. A pass with its own
+
+  # traversal leaves kinds empty and overrides run(). Either way it reports
+
+  # into errors and warnings, and may add symbol_table entries. A pass that
+
+  # resolves names sets declarations, see gehu.scopes.Resolver.
+
+  name = ''
+
+  kinds = ()
+
+  def __init__(self, ast: Ast):
+
+    self.ast = ast
+
+    self.errors: List[str] = []
+
+    self.warnings: List[str] = []
+
+    self.symbol_table: Dict[str, Dict] = {}
+
+    self.declarations: Optional[array] = None
+
+  def visit(self, node: int):
+
+    pass
+
+  def run(self):
+
+    pass
+
+# Pass classes Pipeline runs by default, in order
+
+PASSES: List[Type[Pass]] = []
+
+def register(pass_class: Type[Pass]) -> Type[Pass]:
+
+  PASSES.append(pass_class)
+
+  return pass_class
+
+def measure(stats: Dict[str, Dict], name: str, seconds: float, blocks: Optional[int] = None):
+
+  # Adds to a pass's entry in stats: its wall time and the memory blocks it
+
+  # left allocated (sys.getallocatedblocks() after minus before)
+
+  entry = stats.setdefault(name, {'seconds': 0.0})
+
+  entry['seconds'] += seconds
+
+  if blocks is not None:
+
+    entry['allocated_blocks'] = entry.get('allocated_blocks', 0) + blocks
+
+class Pipeline:
+
+  # Runs passes over an Ast: each pass with its own traversal in turn, and
+
+  # every visitor pass together in one sweep over the nodes, at the place of
+
+  # the first of them. Diagnostics come out in pass order either way.
+
+  def __init__(self, passes: Optional[List[Type[Pass]]] = None):
+
+    self.passes = PASSES if passes is None else passes
+
+  def run(self, ast: Ast, stats: Dict[str, Dict]) -> Dict:
+
+    # Returns errors, warnings, symbol_table and the first pass's
+
+    # declarations, and records each pass in stats under its name
+
+    passes = [pass_class(ast) for pass_class in self.passes]
+
+    visitors = [analysis for analysis in passes if analysis.kinds]
+
+    swept = False
+
+    for analysis in passes:
+
+      if not analysis.kinds:
+
+        blocks = sys.getallocatedblocks()
+
+        start = time.perf_counter()
+
+        analysis.run()
+
+        measure(stats, analysis.name, time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+
+      elif not swept:
+
+        self.sweep(ast, visitors, stats)
+
+        swept = True
+
+    result = {'errors': [], 'warnings': [], 'symbol_table': {}, 'declarations': None}
+
+    for analysis in passes:
+
+      result['errors'] += analysis.errors
+
+      result['warnings'] += analysis.warnings
+
+      result['symbol_table'].update(analysis.symbol_table)
+
+      if result['declarations'] is None:
+
+        result['declarations'] = analysis.declarations
+
+    return result
+
+  def sweep(self, ast: Ast, visitors: List[Pass], stats: Dict[str, Dict]):
+
+    # Finds the nodes any visitor wants with one regex over the kind codes,
+
+    # like SemanticAnalyzer.analyze_indexed, so other nodes cost nothing.
+
+    # Visitors are timed one by one, but sys.getallocatedblocks() walks the
+
+    # whole heap, so memory is only counted for the sweep as a whole.
+
+    table = {}
+
+    for index, visitor in enumerate(visitors):
+
+      for kind in visitor.kinds:
+
+        table.setdefault(kind.value, []).append((index, visitor.visit))
+
+    wanted = re.compile(b'[' + re.escape(bytes(sorted(table))) + b']')
+
+    seconds = [0.0] * len(visitors)
+
+    clock = time.perf_counter
+
+    kinds = ast.kinds
+
+    blocks = sys.getallocatedblocks()
+
+    sweep_start = clock()
+
+    for match in wanted.finditer(kinds):
+
+      node = match.start()
+
+      for index, visit in table[kinds[node]]:
+
+        start = clock()
+
+        visit(node)
+
+        seconds[index] += clock() - start
+
+    # The sweep's own time apart from the visitors, and all of its memory
+
+    measure(stats, 'sweep', clock() - sweep_start - sum(seconds), sys.getallocatedblocks() - blocks)
+
+    for index, visitor in enumerate(visitors):
+
+      measure(stats, visitor.name, seconds[index])
+
+@register
+
+class ScopePass(Pass):
+
+  # Name resolution, see gehu.scopes; it walks scopes in source order
+
+  name = 'scopes'
+
+  def run(self):
+
+    resolver = Resolver(self.ast)
+
+    self.errors = resolver.resolve()
+
+    self.warnings = resolver.warnings
+
+    self.symbol_table = resolver.symbol_table
+
+    self.declarations = resolver.declarations
+
+@register
+
+class DivisionByZeroPass(Pass):
+
+  # Divisions by a literal zero
+
+  name = 'division-by-zero'
+
+  kinds = (NodeKind.BINARY,)
+
+  def visit(self, node: int):
+
+    ast = self.ast
+
+    divisor = ast.children[ast.first_children[node] + 1]
+
+    if ast.kinds[divisor] == _NUMBER and ast.text(node) == '/' and not ast.text(divisor).strip('0'):
+
+      self.warnings.append(f"Division by zero at line {ast.line(node)}")
+
+@register
+
+class UnreachablePass(Pass):
+
+  # Statements after a return in the same block
+
+  name = 'unreachable'
+
+  kinds = (NodeKind.PROGRAM, NodeKind.BLOCK)
+
+  def visit(self, node: int):
+
+    ast = self.ast
+
+    kinds = ast.kinds
+
+    statements = ast.child_nodes(node)
+
+    for index, statement in enumerate(statements[:-1]):
+
+      if kinds[statement] == _RETURN:
+
+        self.warnings.append(f"Unreachable code at line {ast.line(statements[index + 1])}")
+
+        break
@@ -0,0 +1,237 @@
+import cProfile
+
+import sys
+
+import time
+
+import tracemalloc
+
+from contextlib import contextmanager
+
+from typing import Dict, List, Optional, TextIO
+
+try:
+
+  import resource
+
+except ImportError:
+
+  # Not on Windows, where peak memory is only known under tracemalloc
+
+  resource = None
+
+# Frames kept per traced allocation, for the top-N report
+
+TRACE_FRAMES = 1
+
+# tracemalloc.reset_peak() is new in Python 3.9; without it, each phase's
+
+# traced peak is the highest one since tracing started
+
+_reset_peak = getattr(tracemalloc, 'reset_peak', lambda: None)
+
+def max_rss() -> Optional[int]:
+
+  # The process's peak resident set size so far, in bytes
+
+  if resource is None:
+
+    return None
+
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+  return peak if sys.platform == 'darwin' else peak * 1024
+
+class _Phase:
+
+  __slots__ = ('name', 'depth', 'wall', 'cpu', 'peak', 'child_peak')
+
+  def __init__(self, name: str, depth: int, wall: float = 0.0, cpu: Optional[float] = None, peak: Optional[int] = None):
+
+    self.name = name
+
+    self.depth = depth
+
+    self.wall = wall
+
+    self.cpu = cpu
+
+    self.peak = peak
+
+    # Highest traced peak of the phases closed inside this one
+
+    self.child_peak = 0
+
+class Profiler:
+
+  # What --profile installs as gehu.profiler: phase() times a block as a
+
+  # named phase, nested in the phases open around it, recording its wall
+
+  # time, CPU time and peak memory. The peak is the traced peak of the phase
+
+  # itself with memory_top set, which runs tracemalloc throughout; otherwise
+
+  # it is the process's peak RSS when the phase ends, which only grows.
+
+  # With prof_path set, cProfile runs between start() and stop() and its
+
+  # statistics are written there; with memory_top, report() ends with the
+
+  # memory_top lines that allocated the most memory still held at stop().
+
+  def __init__(self, prof_path: Optional[str] = None, memory_top: int = 0):
+
+    self.prof_path = prof_path
+
+    self.memory_top = memory_top
+
+    self.phases: List[_Phase] = []
+
+    self.open: List[_Phase] = []
+
+    self.cprofile = None
+
+    self.snapshot = None
+
+    self.started = time.perf_counter()
+
+    self.started_cpu = time.process_time()
+
+  def start(self):
+
+    if self.memory_top:
+
+      tracemalloc.start(TRACE_FRAMES)
+
+    if self.prof_path:
+
+      self.cprofile = cProfile.Profile()
+
+      self.cprofile.enable()
+
+  def stop(self):
+
+    if self.cprofile is not None:
+
+      self.cprofile.disable()
+
+    if self.memory_top and tracemalloc.is_tracing():
+
+      self.snapshot = tracemalloc.take_snapshot()
+
+      tracemalloc.stop()
+
+    if self.cprofile is not None:
+
+      self.cprofile.dump_stats(self.prof_path)
+
+  def record(self, name: str, wall: float, cpu: Optional[float] = None, peak: Optional[int] = None):
+
+    # A phase timed by someone else, such as gehu's import-time setup or an
+
+    # analysis pass, nested in the open phases
+
+    self.phases.append(_Phase(name, len(self.open), wall, cpu, peak))
+
+  def record_passes(self, passes: Dict):
+
+    # The per-pass timings of an analysis result (see gehu.analyze_code)
+
+    for name, stats in passes.items():
+
+      self.record(name, stats['seconds'])
+
+  @contextmanager
+
+  def phase(self, name: str):
+
+    tracing = tracemalloc.is_tracing()
+
+    if tracing:
+
+      if self.open:
+
+        # The peak so far belongs to the phase this one is nested in
+
+        parent = self.open[-1]
+
+        parent.child_peak = max(parent.child_peak, tracemalloc.get_traced_memory()[1])
+
+      _reset_peak()
+
+    entry = _Phase(name, len(self.open))
+
+    self.phases.append(entry)
+
+    self.open.append(entry)
+
+    wall = time.perf_counter()
+
+    cpu = time.process_time()
+
+    try:
+
+      yield entry
+
+    finally:
+
+      entry.wall = time.perf_counter() - wall
+
+      entry.cpu = time.process_time() - cpu
+
+      self.open.pop()
+
+      if tracing and tracemalloc.is_tracing():
+
+        entry.peak = max(entry.child_peak, tracemalloc.get_traced_memory()[1])
+
+        if self.open:
+
+          self.open[-1].child_peak = max(self.open[-1].child_peak, entry.peak)
+
+        _reset_peak()
+
+      else:
+
+        entry.peak = max_rss()
+
+  def report(self, out: TextIO = sys.stderr):
+
+    wall = time.perf_counter() - self.started
+
+    cpu = time.process_time() - self.started_cpu
+
+    peak = 'traced peak' if self.memory_top else 'peak RSS'
+
+    lines = ["", "=== Profile ===", f" {'Phase':<34} {'Wall':>9} {'CPU':>9} {peak:>12}"]
+
+    for entry in self.phases:
+
+      name = '  ' * entry.depth + entry.name
+
+      cpu_text = '-' if entry.cpu is None else f'{entry.cpu:.3f}s'
+
+      peak_text = '-' if entry.peak is None else f'{entry.peak / 1e6:.1f} MB'
+
+      lines.append(f" {name:<34} {entry.wall:>8.3f}s {cpu_text:>9} {peak_text:>12}")
+
+    lines.append(f" {'Total profiled':<34} {wall:>8.3f}s {cpu:>8.3f}s")
+
+    if self.cprofile is not None:
+
+      lines.append(f" cProfile statistics written to {self.prof_path}")
+
+    if self.snapshot is not None:
+
+      lines += ["", f"=== Top {self.memory_top} allocations still held ==="]
+
+      # Leaving out what the profilers themselves hold
+
+      ignored = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, sys.modules[__name__])]
+
+      statistics = self.snapshot.filter_traces(ignored).statistics('lineno')
+
+      lines.extend(f" {statistic}" for statistic in statistics[:self.memory_top])
+
+    out.write('\n'.join(lines) + '\n')
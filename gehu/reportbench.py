@@ -0,0 +1,157 @@
+import argparse
+
+import io
+
+import os
+
+import time
+
+from contextlib import redirect_stdout
+
+from typing import Dict, List
+
+from gehu import analyze_code
+
+from gehu.output import FORMATS, report_writer
+
+# A statement mix repeated to size the benchmark source
+
+SNIPPET = '''var count{i} = {i};
+
+const label{i} = "item {i}";
+
+function step{i}(a, b) {{
+
+  if (a != b) {{ return a * 2 - b / 3; }}
+
+  return count{i} + 1;
+
+}}
+
+# comment {i}
+
+'''
+
+def make_source(n: int) -> str:
+
+  return ''.join(SNIPPET.format(i=i) for i in range(n))
+
+def print_tokens(result: Dict):
+
+  # The token listing as gehu printed it before report writers, one print()
+
+  # per token; the reference the writers are compared with
+
+  print("\n=== Lexical Analysis Results ===")
+
+  print("Tokens found:")
+
+  for token in result['tokens']:
+
+    print(f" {token}")
+
+def bench(source: str, repeat: int) -> List[Dict]:
+
+  # Writes the report of source to os.devnull in every format, with and
+
+  # without tokens, and keeps each one's fastest run; the first result is
+
+  # the old print-per-token listing
+
+  result = analyze_code(source)
+
+  results = []
+
+  with open(os.devnull, 'w', encoding='utf-8') as devnull:
+
+    best = None
+
+    for _ in range(repeat):
+
+      start = time.perf_counter()
+
+      with redirect_stdout(devnull):
+
+        print_tokens(result)
+
+      devnull.flush()
+
+      seconds = time.perf_counter() - start
+
+      best = seconds if best is None else min(best, seconds)
+
+    out = io.StringIO()
+
+    with redirect_stdout(out):
+
+      print_tokens(result)
+
+    results.append({'format': 'print', 'quiet_tokens': False, 'tokens': len(result['tokens']), 'bytes': len(out.getvalue().encode('utf-8')), 'seconds': best})
+
+    for format in FORMATS:
+
+      for quiet_tokens in (False, True):
+
+        best = None
+
+        for _ in range(repeat):
+
+          start = time.perf_counter()
+
+          report_writer(format, devnull, quiet_tokens).write(result)
+
+          devnull.flush()
+
+          seconds = time.perf_counter() - start
+
+          best = seconds if best is None else min(best, seconds)
+
+        out = io.StringIO()
+
+        report_writer(format, out, quiet_tokens).write(result)
+
+        results.append({'format': format, 'quiet_tokens': quiet_tokens, 'tokens': len(result['tokens']), 'bytes': len(out.getvalue().encode('utf-8')), 'seconds': best})
+
+  return results
+
+def main():
+
+  parser = argparse.ArgumentParser(description="Benchmark writing analysis reports in each --format")
+
+  parser.add_argument('path', nargs='?', help='Source file to report on (default: a generated one)')
+
+  parser.add_argument('-n', type=int, default=20000, help='Snippets in the generated source (default: 20000)')
+
+  parser.add_argument('--repeat', type=int, default=3, help='Runs per format; the fastest counts (default: 3)')
+
+  args = parser.parse_args()
+
+  if args.path:
+
+    with open(args.path, 'r', encoding='utf-8') as f:
+
+      source = f.read()
+
+  else:
+
+    source = make_source(args.n)
+
+  results = bench(source, args.repeat)
+
+  reference = results[0]['seconds']
+
+  for result in results:
+
+    name = result['format'] + (' quiet' if result['quiet_tokens'] else '')
+
+    seconds = result['seconds']
+
+    # Quiet reports write no tokens, so only their time says anything
+
+    tokens = '' if result['quiet_tokens'] else f"{result['tokens'] / seconds / 1e6:8.2f}M tokens/s {reference / seconds:6.1f}x print"
+
+    print(f"{name:<14} {result['bytes'] / 1e6:9.2f} MB {seconds:8.3f}s {result['bytes'] / 1e6 / seconds:8.1f} MB/s {tokens}".rstrip())
+
+if __name__ == "__main__":
+
+  main()
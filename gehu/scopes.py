@@ -0,0 +1,365 @@
+from array import array
+
+from typing import Dict, Iterable, List, Optional
+
+from gehu.parser import Ast, NodeKind
+
+_PROGRAM = NodeKind.PROGRAM.value
+
+_BLOCK = NodeKind.BLOCK.value
+
+_VAR = NodeKind.VAR.value
+
+_CONST = NodeKind.CONST.value
+
+_FUNCTION = NodeKind.FUNCTION.value
+
+_FOR = NodeKind.FOR.value
+
+_ASSIGN = NodeKind.ASSIGN.value
+
+_NAME = NodeKind.NAME.value
+
+# What each declaring node kind declares, as shown in the symbol table
+
+_SYMBOL_TYPES = {
+
+  _VAR: 'var',
+
+  _CONST: 'const',
+
+  _FUNCTION: 'function',
+
+  _NAME: 'parameter'
+
+}
+
+_LABELS = {
+
+  _VAR: 'Variable',
+
+  _CONST: 'Variable',
+
+  _FUNCTION: 'Function',
+
+  _NAME: 'Parameter'
+
+}
+
+# Names every program can use without declaring them, in the order
+
+# gehu.vm numbers them
+
+BUILTINS = ('print',)
+
+class Symbol:
+
+  # One declaration: its node, the depth of its scope and the declaration of
+
+  # the same name it hides, if any
+
+  __slots__ = ('node', 'depth', 'outer')
+
+  def __init__(self, node: int, depth: int, outer: Optional['Symbol']):
+
+    self.node = node
+
+    self.depth = depth
+
+    self.outer = outer
+
+class Scopes:
+
+  # Nested scopes in one dict from each name to its innermost visible
+
+  # declaration, instead of one dict per scope searched outwards. A
+
+  # declaration keeps the one it hides, and each scope lists the names it
+
+  # declared so exit() can put those back. Lookups cost one dict access at
+
+  # any depth, and exit() costs one step per name the scope declared.
+
+  def __init__(self):
+
+    self.visible = {}
+
+    self.declared = []
+
+  @property
+
+  def depth(self) -> int:
+
+    # 0 for the outermost scope
+
+    return len(self.declared) - 1
+
+  def enter(self):
+
+    self.declared.append([])
+
+  def exit(self):
+
+    visible = self.visible
+
+    for name in self.declared.pop():
+
+      outer = visible[name].outer
+
+      if outer is None:
+
+        del visible[name]
+
+      else:
+
+        visible[name] = outer
+
+  def lookup(self, name: str) -> Optional[Symbol]:
+
+    return self.visible.get(name)
+
+  def declare(self, name: str, node: int) -> Optional[Symbol]:
+
+    # Declares name in the innermost scope and returns the declaration it
+
+    # hides, or None. A name declared twice in one scope keeps the first.
+
+    visible = self.visible
+
+    outer = visible.get(name)
+
+    depth = len(self.declared) - 1
+
+    if outer is not None and outer.depth == depth:
+
+      return outer
+
+    visible[name] = Symbol(node, depth, outer)
+
+    self.declared[-1].append(name)
+
+    return outer
+
+class Resolver:
+
+  # Walks an Ast once, in source order, and resolves every name to the
+
+  # declaration visible where it appears. Programs, blocks, function bodies
+
+  # with their parameters and for statements open scopes. Functions are
+
+  # declared when their scope opens, so they can be called before they
+
+  # appear; variables and constants only after their initializer.
+
+  #
+
+  # errors: undeclared names, assignments to constants and builtins and
+
+  # names declared twice in one scope. warnings: declarations hiding an
+
+  # outer one. declarations: for each NAME node, the node declaring it, or
+
+  # -1 (a builtin, unless it is reported as undeclared).
+
+  # symbol_table: the program scope's declarations.
+
+  def __init__(self, ast: Ast):
+
+    self.ast = ast
+
+    self.scopes = Scopes()
+
+    self.declarations = array('i', (-1,)) * len(ast)
+
+    self.errors: List[str] = []
+
+    self.warnings: List[str] = []
+
+    self.symbol_table: Dict[str, Dict] = {}
+
+    self.stack = []
+
+  def resolve(self) -> List[str]:
+
+    ast = self.ast
+
+    kinds = ast.kinds
+
+    first_children = ast.first_children
+
+    child_counts = ast.child_counts
+
+    children = ast.children
+
+    scopes = self.scopes
+
+    visible = scopes.visible
+
+    declarations = self.declarations
+
+    token_indexes = ast.token_indexes
+
+    text = ast.tokens.text
+
+    # Nodes still to visit, last first. ~node marks the end of node's
+
+    # scope, or for a declaration the point its name becomes visible.
+
+    stack = self.stack
+
+    stack.append(ast.root)
+
+    while stack:
+
+      node = stack.pop()
+
+      if node < 0:
+
+        node = ~node
+
+        if kinds[node] == _VAR or kinds[node] == _CONST:
+
+          self.declare(node)
+
+        else:
+
+          scopes.exit()
+
+        continue
+
+      kind = kinds[node]
+
+      first = first_children[node]
+
+      last = first + child_counts[node]
+
+      if kind == _NAME:
+
+        symbol = visible.get(text(token_indexes[node]))
+
+        if symbol is None:
+
+          if ast.name(node) not in BUILTINS:
+
+            self.errors.append(f"Undeclared name '{ast.name(node)}' at line {ast.line(node)}")
+
+        else:
+
+          declarations[node] = symbol.node
+
+      elif kind == _VAR or kind == _CONST:
+
+        stack.append(~node)
+
+        stack.append(children[first])
+
+      elif kind == _ASSIGN:
+
+        target = children[first]
+
+        symbol = visible.get(text(token_indexes[target]))
+
+        if symbol is None:
+
+          if ast.name(target) in BUILTINS:
+
+            self.errors.append(f"Cannot assign to builtin '{ast.name(target)}' at line {ast.line(target)}")
+
+          else:
+
+            self.errors.append(f"Undeclared name '{ast.name(target)}' at line {ast.line(target)}")
+
+        else:
+
+          declarations[target] = symbol.node
+
+          if kinds[symbol.node] == _CONST:
+
+            self.errors.append(f"Cannot assign to const '{ast.name(target)}' at line {ast.line(target)}")
+
+        stack.append(children[first + 1])
+
+      elif kind == _PROGRAM or kind == _BLOCK:
+
+        self.open(node, first, last)
+
+      elif kind == _FUNCTION:
+
+        # Parameters and the body's statements share one scope
+
+        body = children[last - 1]
+
+        self.open(node, first_children[body], first_children[body] + child_counts[body], children[first:last - 1])
+
+      elif kind == _FOR:
+
+        scopes.enter()
+
+        stack.append(~node)
+
+        stack.extend(reversed(children[first:last]))
+
+      else:
+
+        stack.extend(reversed(children[first:last]))
+
+    return self.errors
+
+  def open(self, node: int, first: int, last: int, parameters: Iterable[int] = ()):
+
+    # Enters node's scope over the statements children[first:last],
+
+    # declaring its parameters and functions up front
+
+    ast = self.ast
+
+    kinds = ast.kinds
+
+    statements = ast.children[first:last]
+
+    self.scopes.enter()
+
+    for parameter in parameters:
+
+      self.declare(parameter)
+
+    for statement in statements:
+
+      if kinds[statement] == _FUNCTION:
+
+        self.declare(statement)
+
+    self.stack.append(~node)
+
+    self.stack.extend(reversed(statements))
+
+  def declare(self, node: int):
+
+    ast = self.ast
+
+    name = ast.name(node)
+
+    scopes = self.scopes
+
+    hidden = scopes.declare(name, node)
+
+    if hidden is not None:
+
+      if hidden.depth == scopes.depth:
+
+        self.errors.append(f"{_LABELS[ast.kinds[node]]} '{name}' already declared at line {ast.line(node)}")
+
+        return
+
+      self.warnings.append(f"'{name}' at line {ast.line(node)} shadows the declaration at line {ast.line(hidden.node)}")
+
+    if scopes.depth == 0:
+
+      self.symbol_table[name] = {
+
+        'type': _SYMBOL_TYPES[ast.kinds[node]],
+
+        'line': ast.line(node)
+
+      }
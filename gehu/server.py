@@ -0,0 +1,205 @@
+import argparse
+
+import io
+
+import json
+
+import os
+
+import socket
+
+import socketserver
+
+import threading
+
+from typing import Dict, Optional, TextIO
+
+import gehu
+
+from gehu import handle_analyze, handle_analyze_code, handle_run
+
+from gehu.client import default_socket_path
+
+class _Handler(socketserver.StreamRequestHandler):
+
+  # One connection: a request as one line of JSON, then the reply, the
+
+  # text the same command prints in-process, until the server closes
+
+  wbufsize = 1 << 16
+
+  def handle(self):
+
+    out = io.TextIOWrapper(self.wfile, encoding='utf-8', errors='replace', line_buffering=True)
+
+    try:
+
+      try:
+
+        request = json.loads(self.rfile.readline())
+
+        self.server.dispatch(request, out)
+
+      except (ValueError, KeyError, TypeError) as e:
+
+        out.write(f"Error: bad request to gehu server: {e}\n")
+
+      except Exception as e:
+
+        out.write(f"Error: gehu server failed: {e}\n")
+
+        raise
+
+      out.flush()
+
+    except OSError:
+
+      # The client went away
+
+      pass
+
+    finally:
+
+      out.detach()
+
+class AnalysisServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+  # Keeps one process, with its modules imported and its analysis cache
+
+  # open, serving gehu analyze and run commands from clients (see
+
+  # gehu.client.forward).
+
+  # Each connection gets a thread. Analyses take turns under a lock, as
+
+  # they share the module's cache and diagnostics cap and would only
+
+  # contend for the GIL anyway; programs run without it, which is safe as
+
+  # the recursion limit parsing raises is shared (see recursion_room).
+
+  daemon_threads = True
+
+  def __init__(self, path: str, cache=None):
+
+    self.path = path
+
+    self.cache = cache
+
+    self.lock = threading.Lock()
+
+    self.requests = 0
+
+    super().__init__(path, _Handler)
+
+  def server_bind(self):
+
+    # Owner-only access: requests can read any file the server can
+
+    previous = os.umask(0o177)
+
+    try:
+
+      super().server_bind()
+
+    finally:
+
+      os.umask(previous)
+
+  def dispatch(self, request: Dict, out: TextIO):
+
+    self.requests += 1
+
+    command = request['command']
+
+    path = request.get('path')
+
+    if path is not None:
+
+      path = os.path.join(request['cwd'], path)
+
+    args = argparse.Namespace(command=command, path=path, recursive=False, jobs=None, max_errors=request['max_errors'], format=request.get('format', 'text'), quiet_tokens=request.get('quiet_tokens', False))
+
+    if command == 'run':
+
+      handle_run(args, out)
+
+      return
+
+    with self.lock:
+
+      cache = self.cache if request['cache'] else None
+
+      if cache is not None:
+
+        # Statistics per request rather than since the server started
+
+        cache.hits = cache.misses = 0
+
+      gehu.analysis_cache = cache
+
+      gehu.max_diagnostics = args.max_errors
+
+      if command == 'analyze':
+
+        handle_analyze(args, out)
+
+      else:
+
+        handle_analyze_code(request['code'], out, args.format, args.quiet_tokens)
+
+def serve(path: Optional[str] = None, cache=None):
+
+  # Runs an AnalysisServer at path until interrupted. A socket file left by
+
+  # a server that is gone is replaced; one that still answers is not.
+
+  path = path or default_socket_path()
+
+  if not hasattr(socket, 'AF_UNIX'):
+
+    print("Error: --server needs Unix domain sockets, which this platform lacks")
+
+    return
+
+  if os.path.exists(path):
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+
+      probe.connect(path)
+
+    except OSError:
+
+      os.unlink(path)
+
+    else:
+
+      print(f"Error: a gehu server is already listening on {path}")
+
+      return
+
+    finally:
+
+      probe.close()
+
+  server = AnalysisServer(path, cache)
+
+  print(f"gehu server listening on {path} (Ctrl+C to stop)")
+
+  try:
+
+    server.serve_forever()
+
+  except KeyboardInterrupt:
+
+    pass
+
+  finally:
+
+    server.server_close()
+
+    os.unlink(path)
+
+    print(f"\ngehu server stopped after {server.requests} requests")
@@ -0,0 +1,359 @@
+import math
+
+import re
+
+import sqlite3
+
+import zlib
+
+from array import array
+
+from collections import Counter
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Words, with names like test.py or report_old.txt kept whole
+
+_WORD = re.compile(r'\w+(?:[.\-/\\]\w+)*')
+
+# Words that name something (files, paths, numbers) rather than say what to
+
+# do with it; see features()
+
+_LITERAL = re.compile(r'[\d._\-/\\]')
+
+# Words that turn a task around or join its parts, which like names must be
+
+# the same in near duplicates: "delete all files" is very like "don't delete
+
+# all files" by its words
+
+OPERATORS = frozenset(('not', 'no', 'never', 'none', 'nothing', 'without', 'except', 'excluding', 'unless', 'but', 'only', 'and', 'or', 'nor'))
+
+# The n't of contractions, spelled out as not
+
+_NOT = re.compile(r"n['\u2019]t\b")
+
+# Length of the character n-grams words longer than it are split into
+
+NGRAM = 3
+
+# Most posting rows read for one lookup, which bounds its cost when a task
+
+# has only common words
+
+MAX_POSTINGS = 2000
+
+# Fewest candidates worth importing NumPy to score
+
+NUMPY_MIN_VECTORS = 256
+
+# SQLite's smallest limit on the parameters of one statement
+
+_BATCH = 900
+
+_SCHEMA = '''
+
+CREATE TABLE IF NOT EXISTS prompt_vectors (id INTEGER PRIMARY KEY, key BLOB UNIQUE, scope INTEGER, features BLOB, weights BLOB, literals BLOB);
+
+CREATE TABLE IF NOT EXISTS prompt_postings (scope INTEGER, feature INTEGER, prompt INTEGER, PRIMARY KEY (scope, feature, prompt)) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS prompt_frequencies (feature INTEGER PRIMARY KEY, count INTEGER);
+
+'''
+
+def features(task: str) -> Tuple[Counter, Tuple[int, ...]]:
+
+  # The term counts of task: each word, and the character n-grams of each
+
+  # word with its ends marked, so that "init" and "initialize" or "repo" and
+
+  # "repository" share some. Names are counted only whole, and are also
+
+  # returned apart with the OPERATORS: prompts that mention different names
+
+  # or operators are never near duplicates, however alike the rest.
+
+  # Features are CRC-32s, which are the same in every process.
+
+  counts = Counter()
+
+  literals = set()
+
+  for word in _WORD.findall(_NOT.sub(' not', task.casefold())):
+
+    feature = zlib.crc32(word.encode('utf-8', 'surrogatepass'))
+
+    counts[feature] += 1
+
+    if word in OPERATORS or _LITERAL.search(word):
+
+      literals.add(feature)
+
+    elif len(word) > NGRAM:
+
+      marked = f'<{word}>'
+
+      counts.update(zlib.crc32(marked[i:i + NGRAM].encode('utf-8', 'surrogatepass')) | 1 << 32 for i in range(len(marked) - NGRAM + 1))
+
+  return counts, tuple(sorted(literals))
+
+def _batches(items: List) -> Iterable[List]:
+
+  for start in range(0, len(items), _BATCH):
+
+    yield items[start:start + _BATCH]
+
+def _placeholders(batch: List) -> str:
+
+  return ','.join('?' * len(batch))
+
+def _similarities(query: Dict[int, float], vectors: List[Tuple[bytes, bytes]]) -> List[float]:
+
+  # The dot products of query with each stored (features, weights) vector:
+
+  # all at once with NumPy if there are many, else one by one
+
+  np = None
+
+  if len(vectors) >= NUMPY_MIN_VECTORS:
+
+    # Imported here, as most lookups have too few candidates to pay for it
+
+    try:
+
+      import numpy as np
+
+    except ImportError:
+
+      pass
+
+  if np is not None:
+
+    ordered = sorted(query)
+
+    query_features = np.array(ordered, dtype=np.int64)
+
+    query_weights = np.array([query[feature] for feature in ordered])
+
+    features = np.frombuffer(b''.join(data for data, _ in vectors), dtype=np.int64)
+
+    weights = np.frombuffer(b''.join(data for _, data in vectors), dtype=np.float32)
+
+    positions = np.minimum(np.searchsorted(query_features, features), len(ordered) - 1)
+
+    products = np.where(query_features[positions] == features, weights * query_weights[positions], 0.0)
+
+    # Every stored vector has a feature, or it could not be a candidate
+
+    starts = np.cumsum([0] + [len(data) // 8 for data, _ in vectors[:-1]])
+
+    return np.add.reduceat(products, starts).tolist()
+
+  similarities = []
+
+  for data, weight_data in vectors:
+
+    stored, weights = array('q'), array('f')
+
+    stored.frombytes(data)
+
+    weights.frombytes(weight_data)
+
+    similarities.append(sum(weight * query.get(feature, 0.0) for feature, weight in zip(stored, weights)))
+
+  return similarities
+
+class PromptIndex:
+
+  # TF-IDF vectors of the tasks in a CommandCache, in its database, for
+
+  # finding the earlier task most similar to a new one by cosine
+
+  # similarity. Each task belongs to a scope (a hash of its platform and
+
+  # directory) and only matches tasks of its own. A vector is weighted with
+
+  # the document frequencies as they were when it was added and stored
+
+  # normalized, so adding a task writes only its own rows; a lookup weights
+
+  # the query with the current ones.
+
+  #
+
+  # Postings from each feature to the tasks that have it find the
+
+  # candidates. As stored vectors have unit length, the query's features
+
+  # left out can add at most their own norm to any similarity, so only the
+
+  # postings of the heaviest (rarest) features are read, until what is left
+
+  # could not reach the threshold. This keeps lookups fast with a hundred
+
+  # thousand tasks.
+
+  def __init__(self, connection: sqlite3.Connection):
+
+    self.connection = connection
+
+    connection.executescript(_SCHEMA)
+
+  @staticmethod
+
+  def scope_id(scope: bytes) -> int:
+
+    return int.from_bytes(scope[:8], 'big', signed=True)
+
+  def document_frequencies(self, features: Iterable[int]) -> Dict[int, int]:
+
+    frequencies = {}
+
+    for batch in _batches(list(features)):
+
+      frequencies.update(self.connection.execute(f"SELECT feature, count FROM prompt_frequencies WHERE feature IN ({_placeholders(batch)})", batch))
+
+    return frequencies
+
+  def documents(self) -> int:
+
+    return self.connection.execute('SELECT COUNT(*) FROM prompt_vectors').fetchone()[0]
+
+  @staticmethod
+
+  def weights(counts: Counter, frequencies: Dict[int, int], documents: int) -> Dict[int, float]:
+
+    # Unit-length TF-IDF weights, with sublinear term frequencies and
+
+    # smoothed inverse document frequencies; features no task has yet get
+
+    # the highest weight, lowering the query's similarity to everything
+
+    weights = {feature: (1 + math.log(count)) * (math.log((1 + documents) / (1 + frequencies.get(feature, 0))) + 1) for feature, count in counts.items()}
+
+    norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+
+    return {feature: weight / norm for feature, weight in weights.items()}
+
+  def add(self, key: bytes, scope: bytes, task: str):
+
+    # Indexes task under key, replacing what was there; the caller holds a
+
+    # transaction
+
+    self.remove([key])
+
+    counts, literals = features(task)
+
+    connection = self.connection
+
+    connection.executemany('INSERT OR IGNORE INTO prompt_frequencies VALUES (?, 0)', ((feature,) for feature in counts))
+
+    connection.executemany('UPDATE prompt_frequencies SET count = count + 1 WHERE feature = ?', ((feature,) for feature in counts))
+
+    # Counting the task being added
+
+    weights = self.weights(counts, self.document_frequencies(counts), self.documents() + 1)
+
+    scope = self.scope_id(scope)
+
+    prompt = connection.execute('INSERT INTO prompt_vectors (key, scope, features, weights, literals) VALUES (?, ?, ?, ?, ?)', (key, scope, array('q', weights).tobytes(), array('f', weights.values()).tobytes(), array('q', literals).tobytes())).lastrowid
+
+    connection.executemany('INSERT INTO prompt_postings VALUES (?, ?, ?)', ((scope, feature, prompt) for feature in counts))
+
+  def remove(self, keys: List[bytes]):
+
+    # Drops the tasks indexed under keys, if any
+
+    connection = self.connection
+
+    for batch in _batches(keys):
+
+      rows = connection.execute(f"SELECT id, scope, features FROM prompt_vectors WHERE key IN ({_placeholders(batch)})", batch).fetchall()
+
+      for prompt, scope, data in rows:
+
+        stored = array('q')
+
+        stored.frombytes(data)
+
+        connection.executemany('UPDATE prompt_frequencies SET count = count - 1 WHERE feature = ?', ((feature,) for feature in stored))
+
+        connection.executemany('DELETE FROM prompt_frequencies WHERE feature = ? AND count <= 0', ((feature,) for feature in stored))
+
+        connection.executemany('DELETE FROM prompt_postings WHERE scope = ? AND feature = ? AND prompt = ?', ((scope, feature, prompt) for feature in stored))
+
+      connection.executemany('DELETE FROM prompt_vectors WHERE id = ?', ((row[0],) for row in rows))
+
+  def nearest(self, scope: bytes, task: str, threshold: float) -> Optional[Tuple[bytes, float]]:
+
+    # The key of the task in scope most similar to task, if it is at least
+
+    # threshold similar and mentions the same names and operators, and its
+
+    # similarity
+
+    counts, literals = features(task)
+
+    frequencies = self.document_frequencies(counts)
+
+    query = self.weights(counts, frequencies, self.documents())
+
+    scope = self.scope_id(scope)
+
+    # The squared norm of the query features whose postings are not read
+
+    rest = 1.0
+
+    candidates = set()
+
+    budget = MAX_POSTINGS
+
+    for feature in sorted(query, key=query.get, reverse=True):
+
+      if rest < threshold * threshold or budget <= 0:
+
+        break
+
+      rest -= query[feature] * query[feature]
+
+      if feature not in frequencies:
+
+        continue
+
+      rows = self.connection.execute('SELECT prompt FROM prompt_postings WHERE scope = ? AND feature = ? LIMIT ?', (scope, feature, budget)).fetchall()
+
+      candidates.update(row[0] for row in rows)
+
+      budget -= len(rows)
+
+    literals = array('q', literals).tobytes()
+
+    keys = []
+
+    vectors = []
+
+    for batch in _batches(list(candidates)):
+
+      for key, data, weight_data, other_literals in self.connection.execute(f"SELECT key, features, weights, literals FROM prompt_vectors WHERE id IN ({_placeholders(batch)})", batch):
+
+        if other_literals == literals:
+
+          keys.append(key)
+
+          vectors.append((data, weight_data))
+
+    if not vectors:
+
+      return None
+
+    similarities = _similarities(query, vectors)
+
+    best = max(range(len(keys)), key=similarities.__getitem__)
+
+    if similarities[best] < threshold:
+
+      return None
+
+    return keys[best], similarities[best]
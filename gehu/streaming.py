@@ -0,0 +1,275 @@
+import os
+
+import sys
+
+import time
+
+from typing import Callable, Iterable, Optional, TextIO, Tuple
+
+from gehu import execute_command, fill_copy_paths
+
+def chunk_texts(response: Iterable) -> Iterable[str]:
+
+  # The text of each chunk of a streamed response, skipping chunks that
+
+  # carry none, such as a last one with only the finish reason
+
+  for chunk in response:
+
+    try:
+
+      text = chunk.text
+
+    except ValueError:
+
+      continue
+
+    if text:
+
+      yield text
+
+def stream_response(response: Iterable, started: float, out: TextIO = sys.stdout, on_text: Optional[Callable[[str], None]] = None, strip: bool = True) -> Tuple[str, Optional[float], float]:
+
+  # Writes the text of a streamed response to out as it arrives, passing
+
+  # each piece on to on_text too. With strip, leading and trailing
+
+  # whitespace is left out, trailing whitespace being held back until more
+
+  # text follows it. Returns the whole text (stripped with strip) and the
+
+  # seconds from started, a perf_counter() reading taken before the request,
+
+  # until the first text and until the response ended.
+
+  text = ''
+
+  shown = 0
+
+  first = None
+
+  for piece in chunk_texts(response):
+
+    if first is None:
+
+      first = time.perf_counter() - started
+
+    text += piece
+
+    if on_text is not None:
+
+      on_text(piece)
+
+    if strip:
+
+      start = len(text) - len(text.lstrip())
+
+      end = len(text.rstrip())
+
+      if end > max(shown, start):
+
+        out.write(text[max(shown, start):end])
+
+        shown = end
+
+    else:
+
+      out.write(piece)
+
+    out.flush()
+
+  return (text.strip() if strip else text), first, time.perf_counter() - started
+
+class ShellFeed:
+
+  # Runs a generated command while it is still arriving: a shell reads it
+
+  # from a pipe, so its first line starts as soon as that line is complete.
+
+  # It is one shell reading the lines in turn, as with execute_command's
+
+  # shell=True, so later lines see the directory and variables earlier ones
+
+  # left, and the exit status is the last line's. The script has a pipe of
+
+  # its own, so commands that read standard input read gehu's, not the
+
+  # lines after them. Only where there is a POSIX shell to read the pipe.
+
+  SHELL = '/bin/sh'
+
+  @classmethod
+
+  def available(cls) -> bool:
+
+    return os.name == 'posix' and os.path.exists(cls.SHELL)
+
+  def __init__(self):
+
+    self.pending = ''
+
+    self.received = ''
+
+    self.process = None
+
+    # The pipe the shell reads, until it is closed
+
+    self.script = None
+
+    self.error = None
+
+    # Whether lines get execute_command's copy placeholders filled in,
+
+    # settled by how the command starts
+
+    self.copy = None
+
+  def feed(self, text: str):
+
+    self.pending += text
+
+    if '\n' in self.pending:
+
+      lines, self.pending = self.pending.rsplit('\n', 1)
+
+      self.write(lines + '\n')
+
+  def start(self):
+
+    # Imported here, as only --run starts commands
+
+    import subprocess
+
+    read, write = os.pipe()
+
+    try:
+
+      self.process = subprocess.Popen([self.SHELL, f'/dev/fd/{read}'], pass_fds=(read,), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    except BaseException:
+
+      os.close(write)
+
+      raise
+
+    finally:
+
+      os.close(read)
+
+    self.script = os.fdopen(write, 'w')
+
+  def write(self, lines: str):
+
+    self.received += lines
+
+    if self.error is not None:
+
+      return
+
+    if self.process is None:
+
+      lines = self.received.lstrip()
+
+      if not lines:
+
+        return
+
+      self.copy = lines.startswith('xcopy') or lines.startswith('copy')
+
+      try:
+
+        self.start()
+
+      except OSError as e:
+
+        self.error = e
+
+        return
+
+    if self.script is None:
+
+      return
+
+    if self.copy:
+
+      lines = fill_copy_paths(lines)
+
+    try:
+
+      self.script.write(lines)
+
+      self.script.flush()
+
+    except BrokenPipeError:
+
+      # The shell stopped reading, as after an exit line
+
+      self.close_script()
+
+  def close_script(self):
+
+    try:
+
+      self.script.close()
+
+    except BrokenPipeError:
+
+      pass
+
+    self.script = None
+
+  def cancel(self):
+
+    # Stops the shell, as when the response breaks off: the lines it has not
+
+    # run yet never run
+
+    if self.process is not None:
+
+      self.process.kill()
+
+      self.process.communicate()
+
+    if self.script is not None:
+
+      self.close_script()
+
+  def finish(self) -> bool:
+
+    # Sends the last line, waits for the shell and prints its output as
+
+    # execute_command does; returns whether the command succeeded
+
+    self.write(self.pending.rstrip())
+
+    self.pending = ''
+
+    if self.error is not None:
+
+      print(f"Error executing command: {str(self.error)}")
+
+      return False
+
+    if self.process is None:
+
+      # Nothing but whitespace arrived
+
+      return execute_command(self.received.strip())
+
+    if self.script is not None:
+
+      self.close_script()
+
+    stdout, stderr = self.process.communicate()
+
+    if self.process.returncode == 0:
+
+      print(stdout)
+
+      return True
+
+    else:
+
+      print(f"Error: {stderr}")
+
+      return False
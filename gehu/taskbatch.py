@@ -0,0 +1,295 @@
+import os
+
+import random
+
+import sys
+
+import threading
+
+import time
+
+from collections import deque
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from typing import Dict, Iterator, TextIO
+
+from gehu import command_prompt
+
+from gehu.commandcache import normalize_task
+
+from gehu.output import to_json
+
+DEFAULT_CONCURRENCY = 4
+
+# Calls per second, on average; bursts are as big as the concurrency
+
+DEFAULT_RATE = 5.0
+
+# Attempts after a quota error, and the first and longest waits before them
+
+DEFAULT_RETRIES = 6
+
+BACKOFF_SECONDS = 1.0
+
+MAX_BACKOFF_SECONDS = 60.0
+
+# Tasks submitted ahead of the one being written, per worker, which bounds
+
+# memory for long task lists
+
+WINDOW_PER_WORKER = 4
+
+class TokenBucket:
+
+  # Lets calls through at rate per second on average, with bursts of up to
+
+  # capacity; acquire() blocks until a token is free. Threads share one.
+
+  def __init__(self, rate: float, capacity: float):
+
+    self.rate = rate
+
+    self.capacity = capacity
+
+    self.tokens = capacity
+
+    self.updated = time.monotonic()
+
+    self.lock = threading.Lock()
+
+  def acquire(self):
+
+    while True:
+
+      with self.lock:
+
+        now = time.monotonic()
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+        self.updated = now
+
+        if self.tokens >= 1:
+
+          self.tokens -= 1
+
+          return
+
+        wait = (1 - self.tokens) / self.rate
+
+      time.sleep(wait)
+
+def is_quota_error(error: Exception) -> bool:
+
+  # The API's 429, google.api_core.exceptions.ResourceExhausted, or the fake
+
+  # model's QuotaExceeded; both carry the HTTP status as code
+
+  return getattr(error, 'code', None) == 429 or type(error).__name__ == 'ResourceExhausted'
+
+def read_tasks(path: str) -> Iterator[str]:
+
+  # One task per line, '-' being standard input; blank lines and lines
+
+  # starting with '#' are skipped
+
+  f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+
+  try:
+
+    for line in f:
+
+      task = line.strip()
+
+      if task and not task.startswith('#'):
+
+        yield task
+
+  finally:
+
+    if f is not sys.stdin:
+
+      f.close()
+
+class BatchGenerator:
+
+  # Generates commands for many tasks on a pool of threads, at most
+
+  # concurrency calls in flight and no faster than the bucket allows. A
+
+  # call refused for quota is retried after an exponentially growing wait,
+
+  # with full jitter so that the threads refused together do not come back
+
+  # together, up to retries times.
+
+  def __init__(self, model, cwd: str, concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE, retries: int = DEFAULT_RETRIES, backoff: float = BACKOFF_SECONDS, max_backoff: float = MAX_BACKOFF_SECONDS):
+
+    self.model = model
+
+    self.cwd = cwd
+
+    self.concurrency = concurrency
+
+    self.bucket = TokenBucket(rate, max(1.0, float(concurrency)))
+
+    self.retries = retries
+
+    self.backoff = backoff
+
+    self.max_backoff = max_backoff
+
+    self.random = random.Random()
+
+  def generate(self, task: str) -> Dict:
+
+    # The record of one task: its command, or the error that stopped it
+
+    started = time.perf_counter()
+
+    prompt = command_prompt(task, self.cwd)
+
+    attempt = 0
+
+    while True:
+
+      attempt += 1
+
+      self.bucket.acquire()
+
+      try:
+
+        command = self.model.generate_content(prompt).text.strip()
+
+      except Exception as e:
+
+        if is_quota_error(e) and attempt <= self.retries:
+
+          time.sleep(self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))))
+
+          continue
+
+        return {'error': f"{type(e).__name__}: {e}", 'attempts': attempt, 'seconds': time.perf_counter() - started}
+
+      return {'command': command, 'attempts': attempt, 'seconds': time.perf_counter() - started}
+
+  def run(self, tasks: Iterator[str], out: TextIO = sys.stdout, cache=None) -> Dict:
+
+    # Writes one NDJSON record per task, in the order of tasks, as soon as it
+
+    # and every task before it are done, then a summary record. With cache
+
+    # (a CommandCache), tasks it has are answered from it and new commands
+
+    # are stored in it; it is only used from this thread. A task given again
+
+    # is not generated again but gets the record of its first occurrence.
+
+    started = time.perf_counter()
+
+    summary = {'tasks': 0, 'failed': 0, 'cached': 0, 'duplicates': 0, 'retries': 0}
+
+    pending = deque()
+
+    # The index and result of the first occurrence of each task, by
+
+    # normalized task; with a cache, only until it is written to the cache,
+
+    # which answers repeats from then on
+
+    first = {}
+
+    with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+
+      for index, task in enumerate(tasks):
+
+        key = normalize_task(task)
+
+        if key in first:
+
+          pending.append((index, task, first[key]))
+
+          continue
+
+        cached = cache.load(task, self.cwd) if cache is not None else None
+
+        if cached is not None:
+
+          result = Future()
+
+          command, similar_task, similarity = cached
+
+          record = {'command': command, 'attempts': 0, 'seconds': 0.0, 'cached': True}
+
+          if similarity < 1:
+
+            record['similar_to'] = similar_task
+
+          result.set_result(record)
+
+        else:
+
+          result = executor.submit(self.generate, task)
+
+          first[key] = (index, result)
+
+        pending.append((index, task, (index, result)))
+
+        while len(pending) >= self.concurrency * WINDOW_PER_WORKER:
+
+          self.write(pending.popleft(), out, summary, cache, first)
+
+      while pending:
+
+        self.write(pending.popleft(), out, summary, cache, first)
+
+    summary['seconds'] = time.perf_counter() - started
+
+    out.write(to_json({'record': 'summary', **summary}) + '\n')
+
+    out.flush()
+
+    return summary
+
+  def write(self, entry, out: TextIO, summary: Dict, cache, first: Dict):
+
+    index, task, (first_index, result) = entry
+
+    record = dict(result.result())
+
+    summary['tasks'] += 1
+
+    summary['failed'] += 'error' in record
+
+    if first_index != index:
+
+      summary['duplicates'] += 1
+
+      record.update(attempts=0, seconds=0.0, duplicate_of=first_index)
+
+    else:
+
+      summary['retries'] += max(0, record['attempts'] - 1)
+
+      if record.get('cached'):
+
+        summary['cached'] += 1
+
+      elif cache is not None:
+
+        if record.get('command'):
+
+          cache.store(task, self.cwd, record['command'])
+
+        first.pop(normalize_task(task), None)
+
+    out.write(to_json({'record': 'command', 'index': index, 'task': task, 'cached': bool(record.pop('cached', False)), **record}) + '\n')
+
+    out.flush()
+
+def generate_batch(path: str, model, concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE, retries: int = DEFAULT_RETRIES, out: TextIO = sys.stdout, cache=None) -> Dict:
+
+  # gehu --batch: commands for the tasks in path, for the working directory
+
+  return BatchGenerator(model, os.getcwd(), concurrency, rate, retries).run(read_tasks(path), out, cache)
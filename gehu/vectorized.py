@@ -0,0 +1,405 @@
+import re
+
+from typing import Iterator, Optional, Tuple
+
+try:
+
+  import numpy as np
+
+except ImportError:
+
+  np = None
+
+from gehu import TokenBuffer, TokenType, _BYTES_OPERATORS
+
+# Character classes of ASCII bytes. COVERED replaces the bytes of strings
+
+# and comments once those are found.
+
+SPACE, DIGIT, ALPHA, OPERATOR, EQUALS, BANG, QUOTE, HASH, OTHER, COVERED = range(10)
+
+# Strings and comments, in the order the lexer meets them. A quote or '#'
+
+# can only start one of these or sit inside one, so a plain search from the
+
+# start finds exactly the lexer's.
+
+_STRING_OR_COMMENT = re.compile(rb'"[^"]*"?|#[^\n]*')
+
+_DELIMITERS = b'(){};,'
+
+def _tables():
+
+  classes = np.full(256, OTHER, dtype=np.uint8)
+
+  for byte in b' \t\n\r\f\v\x1c\x1d\x1e\x1f':
+
+    classes[byte] = SPACE
+
+  classes[ord('0'):ord('9') + 1] = DIGIT
+
+  for byte in b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_':
+
+    classes[byte] = ALPHA
+
+  for byte in b'+-*/(){};,':
+
+    classes[byte] = OPERATOR
+
+  classes[ord('=')] = EQUALS
+
+  classes[ord('!')] = BANG
+
+  classes[ord('"')] = QUOTE
+
+  classes[ord('#')] = HASH
+
+  # TokenType code of a token by its first byte; '=' and '!' are settled by
+
+  # length later
+
+  types = np.zeros(256, dtype=np.uint8)
+
+  types[ord('0'):ord('9') + 1] = TokenType.NUMBER.value
+
+  types[classes == ALPHA] = TokenType.IDENTIFIER.value
+
+  for operator, token_type in _BYTES_OPERATORS.items():
+
+    if len(operator) == 1:
+
+      types[operator[0]] = token_type.value
+
+  types[ord('"')] = TokenType.STRING.value
+
+  types[ord('!')] = TokenType.NOT_EQUALS.value
+
+  delimiters = np.zeros(256, dtype=bool)
+
+  delimiters[list(_DELIMITERS)] = True
+
+  return classes, types, delimiters
+
+_CLASSES = _TYPES = _IS_DELIMITER = None
+
+# Bytes classified per pass; bounds the size of the temporary arrays
+
+BLOCK_SIZE = 1 << 20
+
+def tokenize_vectorized(lexer) -> Optional[Tuple[TokenBuffer, Optional[Exception]]]:
+
+  # Lexes the lexer's whole ASCII source with array passes instead of one
+
+  # regex match per token. Returns the tokens and the lexical error that
+
+  # ends them, if any, or None when NumPy is missing or the input is not
+
+  # ASCII, for the caller to fall back to the regex engine.
+
+  global _CLASSES, _TYPES, _IS_DELIMITER
+
+  if np is None:
+
+    return None
+
+  if lexer.data is not None:
+
+    data = lexer.data
+
+    source = memoryview(data)
+
+  else:
+
+    if not lexer.source.isascii():
+
+      return None
+
+    data = source = lexer.source
+
+  # from_bytes() has already checked its data is ASCII
+
+  raw = np.frombuffer(data.encode('ascii') if isinstance(data, str) else data, dtype=np.uint8)
+
+  if _CLASSES is None:
+
+    _CLASSES, _TYPES, _IS_DELIMITER = _tables()
+
+  regions = _strings_and_comments(raw)
+
+  parts = []
+
+  error = None
+
+  for start, end in _blocks(raw, regions[2], regions[3]):
+
+    offsets, lengths, types, error = _lex_block(raw, start, end, regions, lexer.keywords)
+
+    parts.append((offsets, lengths, types))
+
+    if error is not None:
+
+      break
+
+  buffer = TokenBuffer(source, lexer._line_index)
+
+  for offsets, lengths, types in parts:
+
+    buffer.types.frombytes(types.astype(np.uint8).tobytes())
+
+    buffer.starts.frombytes(offsets.astype(np.int64).tobytes())
+
+    buffer.lengths.frombytes(lengths.astype(np.uint32).tobytes())
+
+  if error is not None:
+
+    char = chr(raw[error]) if error < len(raw) else None
+
+    return buffer, lexer.error(char, error)
+
+  buffer.append(TokenType.EOF, len(raw), 0)
+
+  return buffer, None
+
+def _lex_block(raw, block_start: int, block_end: int, regions, keywords):
+
+  # Tokens starting in raw[block_start:block_end] as (value offsets,
+
+  # lengths, type codes) arrays, cut short at the first lexical error, whose
+
+  # offset comes last (or None). No string or comment crosses either end.
+
+  block = raw[block_start:block_end]
+
+  size = len(block)
+
+  classes = _CLASSES[block]
+
+  # Strings and comments inside the block are covered up
+
+  region_starts, region_ends, string_starts, string_ends = (
+
+    bounds[np.searchsorted(firsts, block_start):np.searchsorted(firsts, block_end)] - block_start
+
+    for bounds, firsts in zip(regions, (regions[0], regions[0], regions[2], regions[2])))
+
+  if len(region_starts):
+
+    depth = np.zeros(size + 1, dtype=np.int8)
+
+    depth[region_starts] += 1
+
+    depth[region_ends] -= 1
+
+    classes[np.cumsum(depth[:-1], dtype=np.int8) > 0] = COVERED
+
+  following = _shift(classes, -1, SPACE)
+
+  previous = _shift(classes, 1, SPACE)
+
+  # Words start after anything but a word character. A word that starts
+
+  # with a digit is a number up to its first letter, where an identifier
+
+  # starts.
+
+  word = (classes == DIGIT) | (classes == ALPHA)
+
+  previous_word = (previous == DIGIT) | (previous == ALPHA)
+
+  starts = word & ~previous_word
+
+  for split in np.flatnonzero((classes == ALPHA) & (previous == DIGIT)).tolist():
+
+    run = split - 1
+
+    while run > 0 and classes[run - 1] == DIGIT:
+
+      run -= 1
+
+    if not previous_word[run]:
+
+      starts[split] = True
+
+  starts |= classes == OPERATOR
+
+  # '=' pairs up into '==' from the start of a run, and '!=' starts a new run
+
+  bang_equals = (classes == BANG) & (following == EQUALS)
+
+  chained = (classes == EQUALS) | bang_equals
+
+  chain_starts = np.flatnonzero(bang_equals | ((classes == EQUALS) & ~_shift(chained, 1, False)))
+
+  members = np.flatnonzero(chained)
+
+  if members.size:
+
+    owner = chain_starts[np.searchsorted(chain_starts, members, 'right') - 1]
+
+    starts[members[(members - owner) % 2 == 0]] = True
+
+  # The first lexical error: a stray byte, or a '!' followed by neither '='
+
+  # nor a delimiter, which reports the byte after it
+
+  error = size + 1
+
+  stray = np.flatnonzero(classes == OTHER)
+
+  if stray.size:
+
+    error = int(stray[0])
+
+  bad_bangs = np.flatnonzero((classes == BANG) & (following != EQUALS) & ~_IS_DELIMITER[_shift(block, -1, 0)])
+
+  if bad_bangs.size and bad_bangs[0] + 1 < error:
+
+    error = int(bad_bangs[0]) + 1
+
+  # Token bytes end a token where they stop or where the next one starts
+
+  in_token = word | (classes == OPERATOR) | chained
+
+  offsets = np.flatnonzero(starts)
+
+  stops = np.flatnonzero(~in_token | starts)
+
+  lengths = np.append(stops, size)[np.searchsorted(stops, offsets, 'right')] - offsets
+
+  # Strings join in at their quotes; their values skip the quotes
+
+  is_string = 0
+
+  if len(string_starts):
+
+    order = np.argsort(np.concatenate((offsets, string_starts)), kind='stable')
+
+    # A closed string's end is past its closing quote
+
+    closed = (string_ends - string_starts > 1) & (block[string_ends - 1] == ord('"'))
+
+    is_string = np.concatenate((np.zeros(len(offsets), dtype=np.int64), np.ones(len(string_starts), dtype=np.int64)))[order]
+
+    offsets = np.concatenate((offsets, string_starts + 1))[order]
+
+    lengths = np.concatenate((lengths, string_ends - string_starts - 1 - closed))[order]
+
+  first = block[offsets - is_string]
+
+  types = _TYPES[first]
+
+  equals = first == ord('=')
+
+  types[equals] = np.where(lengths[equals] == 2, TokenType.EQUALS.value, TokenType.ASSIGN.value)
+
+  identifiers = np.flatnonzero(types == TokenType.IDENTIFIER.value)
+
+  for word_text, token_type in keywords.items():
+
+    candidates = identifiers[lengths[identifiers] == len(word_text)]
+
+    matched = np.ones(len(candidates), dtype=bool)
+
+    for index, byte in enumerate(word_text.encode('ascii')):
+
+      matched &= block[offsets[candidates] + index] == byte
+
+    types[candidates[matched]] = token_type.value
+
+  if error > size:
+
+    return offsets + block_start, lengths, types, None
+
+  keep = np.searchsorted(offsets - is_string, error)
+
+  return offsets[:keep] + block_start, lengths[:keep], types[:keep], error + block_start
+
+def _blocks(raw, string_starts, string_ends) -> Iterator[Tuple[int, int]]:
+
+  # About BLOCK_SIZE bytes at a time, each block ending after a newline that
+
+  # is not inside a string. Comments end at a newline, so none crosses.
+
+  size = len(raw)
+
+  start = 0
+
+  while start < size:
+
+    cut = start + BLOCK_SIZE
+
+    while cut < size:
+
+      newlines = np.flatnonzero(raw[cut:cut + 4096] == 10)
+
+      if not newlines.size:
+
+        cut += 4096
+
+        continue
+
+      cut += int(newlines[0])
+
+      inside = np.searchsorted(string_starts, cut, 'right') - 1
+
+      if inside < 0 or string_ends[inside] <= cut:
+
+        cut += 1
+
+        break
+
+      cut = int(string_ends[inside])
+
+    end = min(cut, size)
+
+    yield start, end
+
+    start = end
+
+  if not size:
+
+    yield 0, 0
+
+def _shift(values, by: int, fill):
+
+  # values moved by places (forward for a positive by), fill at the edge
+
+  shifted = np.empty_like(values)
+
+  if by > 0:
+
+    shifted[by:] = values[:-by]
+
+    shifted[:by] = fill
+
+  else:
+
+    shifted[:by] = values[-by:]
+
+    shifted[by:] = fill
+
+  return shifted
+
+def _strings_and_comments(raw) -> Tuple['np.ndarray', ...]:
+
+  # Starts and ends of all strings and comments, then of the strings alone.
+
+  # A string starts at its quote and ends past its closing quote, if any.
+
+  marks = np.flatnonzero((raw == ord('"')) | (raw == ord('#')))
+
+  if not raw[marks].__eq__(ord('#')).any():
+
+    # Only quotes: they pair up in order, the last one maybe left open
+
+    string_starts = marks[0::2]
+
+    string_ends = np.append(marks[1::2] + 1, len(raw))[:len(string_starts)]
+
+    return string_starts, string_ends, string_starts, string_ends
+
+  regions = np.array([match.span() for match in _STRING_OR_COMMENT.finditer(raw.data)], dtype=np.int64)
+
+  is_string = raw[regions[:, 0]] == ord('"')
+
+  return regions[:, 0], regions[:, 1], regions[is_string, 0], regions[is_string, 1]
@@ -0,0 +1,341 @@
+import sys
+
+from typing import Callable, Optional, TextIO
+
+from gehu.compiler import Function, Opcode
+
+from gehu.scopes import BUILTINS
+
+# Calls nested deeper than this raise VMError
+
+MAX_FRAMES = 100000
+
+# The operator each opcode that can fail on its operands stands for
+
+_SYMBOLS = {
+
+  Opcode.ADD.value: '+',
+
+  Opcode.SUBTRACT.value: '-',
+
+  Opcode.MULTIPLY.value: '*',
+
+  Opcode.DIVIDE.value: '/',
+
+  Opcode.NEGATE.value: '-'
+
+}
+
+class VMError(Exception):
+
+  pass
+
+class Builtin:
+
+  __slots__ = ('name', 'function')
+
+  def __init__(self, name: str, function: Callable):
+
+    self.name = name
+
+    self.function = function
+
+  def __repr__(self):
+
+    return f"<builtin {self.name}>"
+
+def format_value(value) -> str:
+
+  return 'nil' if value is None else str(value)
+
+def _type_name(value) -> str:
+
+  if value is None:
+
+    return 'nil'
+
+  if isinstance(value, int):
+
+    return 'number'
+
+  if isinstance(value, str):
+
+    return 'string'
+
+  return 'function'
+
+class VM:
+
+  # Runs compiled programs (see gehu.compiler) in one loop over their
+
+  # instruction arrays. A call pushes the caller's code, slots and position
+
+  # onto a list instead of recursing in Python, so deep recursion costs no C
+
+  # stack. All frames share one operand stack; each call gets a new list of
+
+  # slots, starting with its arguments.
+
+  #
+
+  # executed counts the instructions run. It is totalled at jumps, calls and
+
+  # returns from the distance covered since the last one, rather than
+
+  # counted instruction by instruction.
+
+  def __init__(self, output: Optional[TextIO] = None):
+
+    self.output = sys.stdout if output is None else output
+
+    functions = {'print': self.print}
+
+    self.builtins = [Builtin(name, functions[name]) for name in BUILTINS]
+
+    self.globals = []
+
+    self.executed = 0
+
+  def print(self, *values):
+
+    self.output.write(' '.join(map(format_value, values)) + '\n')
+
+  def run(self, program: Function):
+
+    # Runs program and returns what it returns, or None
+
+    LOAD = Opcode.LOAD.value
+
+    CONST = Opcode.CONST.value
+
+    STORE = Opcode.STORE.value
+
+    LOAD_GLOBAL = Opcode.LOAD_GLOBAL.value
+
+    STORE_GLOBAL = Opcode.STORE_GLOBAL.value
+
+    LOAD_BUILTIN = Opcode.LOAD_BUILTIN.value
+
+    ADD = Opcode.ADD.value
+
+    SUBTRACT = Opcode.SUBTRACT.value
+
+    MULTIPLY = Opcode.MULTIPLY.value
+
+    DIVIDE = Opcode.DIVIDE.value
+
+    EQUALS = Opcode.EQUALS.value
+
+    NOT_EQUALS = Opcode.NOT_EQUALS.value
+
+    NEGATE = Opcode.NEGATE.value
+
+    JUMP = Opcode.JUMP.value
+
+    JUMP_IF_FALSE = Opcode.JUMP_IF_FALSE.value
+
+    CALL = Opcode.CALL.value
+
+    RETURN = Opcode.RETURN.value
+
+    POP = Opcode.POP.value
+
+    DUP = Opcode.DUP.value
+
+    builtins = self.builtins
+
+    code = program.code
+
+    instructions = code.instructions
+
+    constants = code.constants
+
+    # The program's slots are the globals
+
+    slots = globals_ = self.globals = [None] * program.size
+
+    stack = []
+
+    push = stack.append
+
+    pop = stack.pop
+
+    frames = []
+
+    pc = mark = executed = 0
+
+    try:
+
+      # Most frequent opcodes first
+
+      while True:
+
+        word = instructions[pc]
+
+        pc += 1
+
+        op = word & 255
+
+        if op == LOAD:
+
+          push(slots[word >> 8])
+
+        elif op == CONST:
+
+          push(constants[word >> 8])
+
+        elif op == STORE:
+
+          slots[word >> 8] = pop()
+
+        elif op == JUMP_IF_FALSE:
+
+          if not pop():
+
+            executed += pc - mark
+
+            pc = mark = word >> 8
+
+        elif op == JUMP:
+
+          executed += pc - mark
+
+          pc = mark = word >> 8
+
+        elif op == ADD:
+
+          value = pop()
+
+          stack[-1] += value
+
+        elif op == SUBTRACT:
+
+          value = pop()
+
+          stack[-1] -= value
+
+        elif op == LOAD_GLOBAL:
+
+          push(globals_[word >> 8])
+
+        elif op == EQUALS:
+
+          value = pop()
+
+          stack[-1] = 1 if stack[-1] == value else 0
+
+        elif op == NOT_EQUALS:
+
+          value = pop()
+
+          stack[-1] = 0 if stack[-1] == value else 1
+
+        elif op == CALL:
+
+          count = word >> 8
+
+          base = len(stack) - count
+
+          callee = stack[base - 1]
+
+          if type(callee) is Function:
+
+            if count != callee.arity:
+
+              raise VMError(f"{callee.name}() takes {callee.arity} arguments but was given {count} at line {code.lines[pc - 1]}")
+
+            if len(frames) == MAX_FRAMES:
+
+              raise VMError(f"Stack overflow: more than {MAX_FRAMES} nested calls at line {code.lines[pc - 1]}")
+
+            executed += pc - mark
+
+            frames.append((code, slots, pc))
+
+            slots = stack[base:]
+
+            if callee.size > count:
+
+              slots += [None] * (callee.size - count)
+
+            del stack[base - 1:]
+
+            code = callee.code
+
+            instructions = code.instructions
+
+            constants = code.constants
+
+            pc = mark = 0
+
+          elif type(callee) is Builtin:
+
+            arguments = stack[base:]
+
+            del stack[base - 1:]
+
+            push(callee.function(*arguments))
+
+          else:
+
+            raise VMError(f"Cannot call a {_type_name(callee)} at line {code.lines[pc - 1]}")
+
+        elif op == RETURN:
+
+          if not frames:
+
+            return pop()
+
+          executed += pc - mark
+
+          code, slots, pc = frames.pop()
+
+          instructions = code.instructions
+
+          constants = code.constants
+
+          mark = pc
+
+        elif op == MULTIPLY:
+
+          value = pop()
+
+          stack[-1] *= value
+
+        elif op == STORE_GLOBAL:
+
+          globals_[word >> 8] = pop()
+
+        elif op == POP:
+
+          pop()
+
+        elif op == DUP:
+
+          push(stack[-1])
+
+        elif op == NEGATE:
+
+          stack[-1] = -stack[-1]
+
+        elif op == DIVIDE:
+
+          value = pop()
+
+          stack[-1] //= value
+
+        elif op == LOAD_BUILTIN:
+
+          push(builtins[word >> 8])
+
+    except ZeroDivisionError:
+
+      raise VMError(f"Division by zero at line {code.lines[pc - 1]}") from None
+
+    except TypeError:
+
+      raise VMError(f"Invalid operands for '{_SYMBOLS[instructions[pc - 1] & 255]}' at line {code.lines[pc - 1]}") from None
+
+    finally:
+
+      self.executed += executed + pc - mark
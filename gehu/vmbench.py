@@ -0,0 +1,155 @@
+import argparse
+
+import io
+
+import time
+
+from typing import Dict, List
+
+from gehu.compiler import compile_source
+
+from gehu.vm import VM
+
+# Loop- and call-heavy programs, each sized by n
+
+PROGRAMS = {
+
+  'while': '''
+
+var n = {n};
+
+var i = 0;
+
+var total = 0;
+
+while (i != n) {{
+
+  total = total + i * 2 - 1;
+
+  i = i + 1;
+
+}}
+
+print(total);
+
+''',
+
+  'nested-for': '''
+
+var n = {n};
+
+var count = 0;
+
+for (var i = 0; i != n / 100; i = i + 1) {{
+
+  for (var j = 0; j != 100; j = j + 1) {{
+
+    if (j == i) {{ count = count + 1; }} else {{ count = count - 1; }}
+
+  }}
+
+}}
+
+print(count);
+
+''',
+
+  'fib': '''
+
+function fib(k) {{
+
+  if (k == 0) {{ return 0; }}
+
+  if (k == 1) {{ return 1; }}
+
+  return fib(k - 1) + fib(k - 2);
+
+}}
+
+var result = 0;
+
+for (var i = 0; i != {n} / 2000; i = i + 1) {{
+
+  result = fib(12);
+
+}}
+
+print(result);
+
+''',
+
+  'calls': '''
+
+function add(a, b) {{ return a + b; }}
+
+function twice(f, x) {{ return f(x, x); }}
+
+var total = 0;
+
+for (var i = 0; i != {n} / 10; i = i + 1) {{
+
+  total = add(total, twice(add, i));
+
+}}
+
+print(total);
+
+'''
+
+}
+
+def bench(n: int, repeat: int, optimize: bool = True) -> List[Dict]:
+
+  # Runs every program repeat times and keeps its fastest run
+
+  results = []
+
+  for name, template in PROGRAMS.items():
+
+    program, errors = compile_source(template.format(n=n), optimize=optimize)
+
+    if program is None:
+
+      raise SystemExit(f"{name}: {errors[0]}")
+
+    best = None
+
+    for _ in range(repeat):
+
+      vm = VM(io.StringIO())
+
+      start = time.perf_counter()
+
+      vm.run(program)
+
+      seconds = time.perf_counter() - start
+
+      if best is None or seconds < best['seconds']:
+
+        best = {'program': name, 'instructions': vm.executed, 'seconds': seconds}
+
+    best['instructions_per_second'] = best['instructions'] / best['seconds']
+
+    results.append(best)
+
+  return results
+
+def main():
+
+  parser = argparse.ArgumentParser(description="Benchmark the gehu VM on loop- and call-heavy programs")
+
+  parser.add_argument('-n', type=int, default=1000000, help='Loop iterations per program (default: 1000000)')
+
+  parser.add_argument('--repeat', type=int, default=3, help='Runs per program; the fastest counts (default: 3)')
+
+  parser.add_argument('--no-optimize', action='store_true', help='Compile the programs without gehu.optimizer')
+
+  args = parser.parse_args()
+
+  for result in bench(args.n, args.repeat, not args.no_optimize):
+
+    print(f"{result['program']:<12} {result['instructions']:>12,} instructions {result['seconds']:8.3f}s {result['instructions_per_second'] / 1e6:8.2f}M instructions/s")
+
+if __name__ == "__main__":
+
+  main()
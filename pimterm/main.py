@@ -1,32 +1,46 @@
-import argparse
-import subprocess
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
-import shutil
+import sys
 
-# Load environment variables from .env file
-load_dotenv(encoding='utf-8')
+# The SDK and .env are only needed once a model is asked something, so
+# --help and argument errors stay fast; see get_model
+_model = None
 
-# Configure Gemini API
-api_key = os.getenv('GOOGLE_API_KEY')
-if not api_key:
-    try:
-        with open('.env', 'r') as f:
-            content = f.read().strip()
-            if 'GOOGLE_API_KEY=' in content:
-                api_key = content.split('GOOGLE_API_KEY=')[1].strip()
-    except Exception:
-        pass
+def load_api_key():
+    from dotenv import load_dotenv
+    # Load environment variables from .env file
+    load_dotenv(encoding='utf-8')
+    api_key = os.getenv('GOOGLE_API_KEY')
+    if not api_key:
+        try:
+            with open('.env', 'r') as f:
+                content = f.read().strip()
+                if 'GOOGLE_API_KEY=' in content:
+                    api_key = content.split('GOOGLE_API_KEY=')[1].strip()
+        except Exception:
+            pass
+    return api_key
 
-if not api_key:
-    print("Error: GOOGLE_API_KEY not found. Please set it in your .env file or environment variables.")
-    exit(1)
+def get_model():
+    # Configure Gemini API on first use
+    global _model
+    if _model is None:
+        import google.generativeai as genai
+        api_key = load_api_key()
+        if not api_key:
+            print("Error: GOOGLE_API_KEY not found. Please set it in your .env file or environment variables.")
+            sys.exit(1)
+        genai.configure(api_key=api_key)
+        _model = genai.GenerativeModel('gemini-1.5-flash')
+    return _model
 
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-1.5-flash')
+def __getattr__(name):
+    # pimterm.main.model, configured when first read
+    if name == 'model':
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def execute_command(command):
+    import subprocess
     try:
         # For git commands, we need to handle them specially
         if command.startswith('git'):
@@ -77,7 +91,7 @@ def handle_command(args):
     Task: {args.command}
     Please provide a Windows command that will work in the current directory."""
     
-    response = model.generate_content(
+    response = get_model().generate_content(
         f"""You are a bot that gives back specific Windows commands required to complete the task mentioned. 
         Please provide only the command itself, without any additional explanation. 
         If the solution requires multiple commands, provide them all in sequence.
@@ -96,7 +110,7 @@ def handle_command(args):
             print("\nCommand execution failed!")
 
 def handle_question(args):
-    response = model.generate_content(
+    response = get_model().generate_content(
         f"""You will be asked questions that will be displayed in a cmd terminal.
         Make your answers short and in plain text. Don't add ethical warnings or redundant information.
         Answer in the language the question is asked.
@@ -105,6 +119,7 @@ def handle_question(args):
     print(response.text)
 
 def main():
+    import argparse
     parser = argparse.ArgumentParser(description="gehu Command Line Interface")
     parser.add_argument('command', type=str, help='Command or question to process')
     parser.add_argument('--run', '-r', action='store_true', help='Execute the generated command')
@@ -8,6 +8,7 @@ setup(
     name="gehu",
     version="1.3.1",  # Increment this if you're making changes and want to re-upload
     packages=find_packages(),
+    package_data={'gehu.bench': ['baseline.json']},
     entry_points={
         'console_scripts': [
             'gehu=gehu:main',
@@ -28,5 +29,5 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
 )
@@ -0,0 +1,103 @@
+import sys
+
+import pytest
+
+import gehu
+
+@pytest.fixture
+
+def handled(monkeypatch, tmp_path):
+
+  # The arguments each handler was called with, instead of running it
+
+  calls = []
+
+  monkeypatch.setenv('GEHU_CACHE_DIR', str(tmp_path))
+
+  monkeypatch.setenv('GEHU_SOCKET', str(tmp_path / 'no-server.sock'))
+
+  # main sets these from the arguments; restored after each test
+
+  for name in ('max_diagnostics', 'lex_workers', 'profiler', 'analysis_cache', 'command_cache'):
+
+    monkeypatch.setattr(gehu, name, getattr(gehu, name))
+
+  for name in ('handle_analyze', 'handle_run', 'handle_command'):
+
+    monkeypatch.setattr(gehu, name, lambda args, name=name: calls.append((name, args)))
+
+  def main(*arguments):
+
+    monkeypatch.setattr(sys, 'argv', ['gehu', *arguments])
+
+    gehu.main()
+
+    return calls
+
+  return main
+
+@pytest.mark.parametrize('arguments', [
+
+  ('analyze', '--recursive', 'src/', '--jobs', '4'),
+
+  ('analyze', 'src/', '--recursive', '--jobs', '4'),
+
+  ('--recursive', '--jobs', '4', 'analyze', 'src/'),
+
+  ('analyze', '--jobs', '4', '-R', 'src/'),
+
+])
+
+def test_options_before_the_path(handled, arguments):
+
+  [(name, args)] = handled(*arguments)
+
+  assert name == 'handle_analyze'
+
+  assert (args.command, args.path, args.recursive, args.jobs) == ('analyze', 'src/', True, 4)
+
+def test_flags_between_command_and_path(handled):
+
+  [(name, args)] = handled('analyze', '--quiet-tokens', '--no-server', 'file.g', '--format', 'json')
+
+  assert name == 'handle_analyze'
+
+  assert (args.path, args.quiet_tokens, args.format) == ('file.g', True, 'json')
+
+  [(name, args)] = handled('run', '--no-server', 'program.g')[1:]
+
+  assert (name, args.path) == ('handle_run', 'program.g')
+
+def test_a_task_with_options_around_it(handled):
+
+  [(name, args)] = handled('--run', 'list files', '--no-cache')
+
+  assert (name, args.command, args.run) == ('handle_command', 'list files', True)
+
+@pytest.mark.parametrize('arguments, workers', [
+
+  (('analyze', '--no-server', 'file.g', '--jobs', '3'), 3),
+
+  (('analyze', '--recursive', 'src/', '--jobs', '3'), 1),
+
+])
+
+def test_jobs_sets_the_lexing_workers(handled, arguments, workers):
+
+  handled(*arguments)
+
+  assert gehu.lex_workers == workers
+
+def test_a_server_lexes_in_one_process(handled, monkeypatch):
+
+  # Its handler threads must not fork a process pool
+
+  from gehu import server
+
+  served = []
+
+  monkeypatch.setattr(server, 'serve', lambda path, cache: served.append(gehu.lex_workers))
+
+  handled('--server', '--jobs', '4', '--no-cache')
+
+  assert served == [1]
@@ -0,0 +1,123 @@
+import argparse
+
+import pytest
+
+import gehu
+
+from gehu.commandcache import CommandCache
+
+from gehu.fakemodel import FakeModel
+
+@pytest.fixture
+
+def cache(tmp_path):
+
+  return CommandCache(str(tmp_path / 'cache'))
+
+def test_the_same_task_is_an_exact_hit(cache):
+
+  cache.store('list  files ', '/work', 'ls')
+
+  assert cache.load('list files', '/work') == ('ls', 'list files', 1.0)
+
+  assert cache.load('list files', '/elsewhere') is None
+
+def test_a_task_worded_differently_matches_in_a_fresh_cache(cache):
+
+  # The README's example
+
+  cache.store('count lines in all python files', '/work', 'wc -l *.py')
+
+  command, task, similarity = cache.load('count the lines in all python files', '/work')
+
+  assert (command, task) == ('wc -l *.py', 'count lines in all python files')
+
+  assert cache.similarity <= similarity < 1
+
+@pytest.mark.parametrize('stored, asked', [
+
+  ('delete all files', "don't delete all files"),
+
+  ('delete all files', 'do not delete all files'),
+
+  ("don't delete all files", 'delete all files'),
+
+  ('copy the logs and the reports', 'copy the logs or the reports'),
+
+  ('list files except backups', 'list files with backups'),
+
+  ('create a.py', 'create b.py'),
+
+  ('show the 10 biggest files here', 'show the ten biggest files here'),
+
+])
+
+def test_different_operators_or_names_never_match(cache, stored, asked):
+
+  cache.store(stored, '/work', 'true')
+
+  assert cache.load(asked, '/work') is None
+
+@pytest.fixture
+
+def similar(cache, tmp_path, monkeypatch):
+
+  # A cached command for a task like the one asked, and a model that would
+
+  # generate a different one
+
+  monkeypatch.chdir(tmp_path)
+
+  monkeypatch.setattr(gehu, 'command_cache', cache)
+
+  cache.store('create a file called done.txt', str(tmp_path), 'touch cached.txt')
+
+  model = FakeModel(reply='touch generated.txt', first_delay=0, chunk_delay=0)
+
+  monkeypatch.setattr(gehu, '_model', model)
+
+  return argparse.Namespace(command='create the file called done.txt', run=True, format='text', quiet_tokens=False), model
+
+def test_similar_hits_are_not_run_without_a_terminal(similar, tmp_path, monkeypatch, capsys):
+
+  args, model = similar
+
+  monkeypatch.setattr('sys.stdin.isatty', lambda: False)
+
+  gehu.handle_command(args)
+
+  assert 'Reusing the command for a similar task' in capsys.readouterr().out
+
+  assert model.calls == 1
+
+  assert not (tmp_path / 'cached.txt').exists()
+
+  assert (tmp_path / 'generated.txt').exists()
+
+@pytest.mark.parametrize('answer, ran', [('y', 'cached.txt'), ('', 'generated.txt'), ('no', 'generated.txt')])
+
+def test_similar_hits_run_only_when_confirmed(similar, tmp_path, monkeypatch, answer, ran):
+
+  args, model = similar
+
+  monkeypatch.setattr('sys.stdin.isatty', lambda: True)
+
+  monkeypatch.setattr('builtins.input', lambda prompt: answer)
+
+  gehu.handle_command(args)
+
+  assert [path.name for path in tmp_path.glob('*.txt')] == [ran]
+
+  assert model.calls == (ran == 'generated.txt')
+
+def test_similar_hits_are_shown_without_run(similar, monkeypatch, capsys):
+
+  args, model = similar
+
+  args.run = False
+
+  gehu.handle_command(args)
+
+  assert 'Generated command: touch cached.txt' in capsys.readouterr().out
+
+  assert model.calls == 0
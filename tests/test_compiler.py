@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from gehu.compiler import compile_source
+
+from gehu.vm import VM, VMError
+
+def run(source, optimize=True):
+
+  program, errors = compile_source(source, optimize=optimize)
+
+  assert errors == []
+
+  out = io.StringIO()
+
+  VM(out).run(program)
+
+  return out.getvalue()
+
+@pytest.mark.parametrize('optimize', [True, False])
+
+@pytest.mark.parametrize('source, printed', [
+
+  ('print(1 + 2 * 3, "a" + "b");', '7 ab\n'),
+
+  ('var x = 7; print(x / 2, x == 7, x != 7);', '3 1 0\n'),
+
+  ('function f(n) { if (n == 0) { return 1; } return n * f(n - 1); } for (var i = 0; i != 4; i = i + 1) { print(f(i)); }', '1\n1\n2\n6\n'),
+
+  ('var n = 0; while (n != 3) { n = n + 1; } print(n);', '3\n'),
+
+  ('var a = 1; { var a = 2; print(a); } print(a);', '2\n1\n'),
+
+  # The assigned value is the expression's value, even when the optimizer
+
+  # drops the variable assigned to
+
+  ('var b = 2; var c = 3; print(b = c);', '3\n'),
+
+  ('var b = 2; var c = 3; print((b = c) + 1, c);', '4 3\n'),
+
+])
+
+def test_programs_print(source, printed, optimize):
+
+  assert run(source, optimize) == printed
+
+def test_runtime_errors_give_their_line():
+
+  with pytest.raises(VMError, match='Division by zero at line 2'):
+
+    run('var x = 1;\nprint(x / 0);')
+
+def test_programs_with_errors_do_not_compile():
+
+  program, errors = compile_source('print(y);')
+
+  assert program is None
+
+  assert errors == ["Undeclared name 'y' at line 1"]
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from gehu.bench.importtime import DEFAULT_BUDGET_MS, DEFERRED, import_times, measure, scenarios
+
+_MAIN = "import sys; import gehu; sys.argv = ['gehu'] + sys.argv[1:]; gehu.main()"
+
+# Twice gehu.bench.importtime's budget, so a loaded machine does not fail
+
+# it; GEHU_IMPORT_BUDGET_MS sets another
+
+BUDGET_MS = float(os.environ.get('GEHU_IMPORT_BUDGET_MS', 2 * DEFAULT_BUDGET_MS))
+
+# Stand-ins for the SDK and python-dotenv, so that importing them shows up
+
+# under -X importtime whether or not the real ones are installed
+
+_STUBS = {
+
+  'google/__init__.py': '',
+
+  'google/generativeai/__init__.py': 'def configure(**settings):\n  pass\nclass GenerativeModel:\n  def __init__(self, name):\n    self.name = name\n',
+
+  'dotenv.py': 'def load_dotenv(*args, **kwargs):\n  return False\n',
+
+}
+
+@pytest.fixture
+
+def environment(tmp_path, monkeypatch):
+
+  stubs = tmp_path / 'stubs'
+
+  for name, text in _STUBS.items():
+
+    path = stubs / name
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    path.write_text(text)
+
+  repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+  monkeypatch.setenv('PYTHONPATH', os.pathsep.join([str(stubs), repository]))
+
+  monkeypatch.setenv('GOOGLE_API_KEY', 'test')
+
+  monkeypatch.setenv('GEHU_CACHE_DIR', str(tmp_path / 'cache'))
+
+  monkeypatch.delenv('GEHU_FAKE_MODEL', raising=False)
+
+  monkeypatch.chdir(tmp_path)
+
+  program = tmp_path / 'program.g'
+
+  program.write_text('var x = 1 + 2; print(x);\n')
+
+  return program
+
+def deferred(modules) -> list:
+
+  return sorted(module for module in modules if any(module == d or module.startswith(d + '.') for d in DEFERRED))
+
+@pytest.mark.parametrize('arguments', [
+
+  ['--help'],
+
+  ['analyze: var x = 1; print(x);', '--no-server'],
+
+  ['analyze', 'program.g', '--no-server'],
+
+  ['--cache-stats'],
+
+], ids=['help', 'analyze-code', 'analyze-file', 'cache-stats'])
+
+def test_commands_without_the_model_do_not_import_it(environment, arguments):
+
+  modules = import_times(['-c', _MAIN] + arguments)
+
+  assert 'gehu' in modules
+
+  assert deferred(modules) == []
+
+def test_the_model_imports_the_sdk(environment):
+
+  # The stubs are seen, so the test above can fail
+
+  modules = import_times(['-c', 'import gehu; gehu.get_model()'])
+
+  assert deferred(modules) == ['dotenv', 'google.generativeai']
+
+@pytest.mark.parametrize('scenario', ['import gehu', '--help', 'analyze'])
+
+def test_imports_stay_within_the_budget(environment, scenario):
+
+  baseline = set(import_times(['-c', 'pass']))
+
+  total, modules = measure(scenarios(str(environment))[scenario], baseline, 3)
+
+  slowest = sorted(modules, key=lambda module: modules[module][0], reverse=True)[:5]
+
+  assert total <= BUDGET_MS, f"{scenario} imports took {total:.1f} ms; slowest: {', '.join(slowest)}"
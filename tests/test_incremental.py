@@ -0,0 +1,143 @@
+import pytest
+
+from gehu import Lexer, SemanticAnalyzer, analyze_code
+
+from gehu.incremental import Document
+
+SOURCES = [
+
+  'var x = 1;\nconst y = x + 2;\nprint(y);\n',
+
+  '{ var y = 2; }\n{ var y = 3; }\n',
+
+  'function f(a) {\n  var b = a * 2;\n  return b;\n}\nprint(f(3));\n',
+
+  'var a = 1;\n{ var a = 2; print(a); }\nfor (var i = 0; i != 3; i = i + 1) { print(i); }\n',
+
+  'print(z);\nconst c = 1;\nc = 2;\n',
+
+]
+
+@pytest.mark.parametrize('source', SOURCES)
+
+def test_check_matches_analyze_code(source):
+
+  result = analyze_code(source)
+
+  checked = Document(source).check()
+
+  assert checked.errors == result['semantic_errors']
+
+  assert checked.warnings == result['warnings']
+
+  assert checked.symbol_table == result['symbol_table']
+
+def test_check_follows_edits():
+
+  document = Document(SOURCES[0])
+
+  document.edit(0, 0, '{ var q = 0; }\n')
+
+  document.edit(len(document.source), 0, 'print(q);\n')
+
+  result = analyze_code(document.source)
+
+  assert result['semantic_errors'] == ["Undeclared name 'q' at line 5"]
+
+  assert document.check().errors == result['semantic_errors']
+
+def test_errors_follow_scopes_through_edits():
+
+  # A name declared in two sibling blocks is declared once in each
+
+  source = '{ var y = 2; }\n{ var y = 3; }\nfunction f() { return 1; }\n'
+
+  document = Document(source)
+
+  assert (document.errors, document.warnings) == ([], [])
+
+  assert document.symbol_table == {'f': {'type': 'function', 'line': 3}}
+
+  assert document.declared == {'y': {'type': 'var', 'line': 1}}
+
+  assert document.declaration_errors == []
+
+  # Both in one block now
+
+  document.edit(source.index('}'), 4, '')
+
+  assert document.source == '{ var y = 2; var y = 3; }\nfunction f() { return 1; }\n'
+
+  assert document.errors == ["Variable 'y' already declared at line 1"]
+
+  document.edit(0, 0, 'var y = 1;\n')
+
+  result = analyze_code(document.source)
+
+  assert (document.errors, document.warnings, document.symbol_table) == (result['semantic_errors'], result['warnings'], result['symbol_table'])
+
+  assert document.warnings == ["'y' at line 2 shadows the declaration at line 1"]
+
+def flat_scan(source):
+
+  # What edits keep up to date, from a fresh lex and declaration scan
+
+  # without caps; a redeclaration is not a malformed declaration
+
+  lexer = Lexer(source, max_errors=1000)
+
+  tokens = lexer.tokenize_buffer()
+
+  analyzer = SemanticAnalyzer(0)
+
+  errors = analyzer.analyze_indexed(tokens.types, tokens)
+
+  malformed = [error for error in errors if 'already declared' not in error]
+
+  return malformed, analyzer.symbol_table, lexer.errors
+
+def reported(document):
+
+  return document.declaration_errors, dict(document.declared), document.lexical_errors
+
+def test_invalid_characters_are_recovered_from():
+
+  document = Document('var x = 1;\n')
+
+  document.edit(0, 0, '@')
+
+  assert document.source == '@var x = 1;\n'
+
+  assert document.lexical_errors == ["Invalid character '@' at line 1, column 1"]
+
+  document.edit(5, 0, '!$')
+
+  assert document.lexical_errors == ["Invalid character '@' at line 1, column 1", "Invalid character '$' at line 1, column 7"]
+
+  document.edit(0, 1, '')
+
+  document.edit(4, 2, '')
+
+  assert document.source == 'var x = 1;\n'
+
+  assert [token.type for token in document] == [token.type for token in Lexer(document.source).tokenize()]
+
+  assert reported(document) == ([], {'x': {'type': 'var', 'line': 1}}, [])
+
+def test_edits_that_add_and_remove_lines_keep_declarations(monkeypatch):
+
+  source = ''.join(f'var v{i % 7} = {i};\nconst c{i} = "{i}";\n' for i in range(40)) + 'var;\nconst 3 = 1;\n'
+
+  document = Document(source)
+
+  # Declarations are kept up to date without scanning them all again
+
+  monkeypatch.setattr(Document, 'analyze', None)
+
+  edits = [(0, 0, '\n\n'), (30, 0, '\nvar v1 = 0;\n'), (200, 12, ''), (len(source) // 2, 0, 'var z\n= 5;'), (5, 1, '\n')]
+
+  for offset, deleted, inserted in edits:
+
+    document.edit(offset, deleted, inserted)
+
+    assert reported(document) == flat_scan(document.source)
@@ -0,0 +1,73 @@
+import gc
+
+import weakref
+
+import pytest
+
+import gehu
+
+from gehu import Lexer
+
+# Lines of many lengths, with strings and comments that span chunks and an
+
+# invalid character now and then
+
+SOURCE = ''.join(f'var s{i} = "{"x" * (i % 13)}\n";\n' if i % 7 == 3 else f'print(n{i} + {i}); # {"y" * (i % 29)}\n' + ('$\n' if i % 50 == 49 else '') for i in range(3000))
+
+def chunked(size):
+
+  return [SOURCE[start:start + size] for start in range(0, len(SOURCE), size)]
+
+@pytest.fixture
+
+def small_windows(monkeypatch):
+
+  monkeypatch.setattr(gehu, 'STREAM_INDEX_LINES', 64)
+
+@pytest.mark.parametrize('size', [1, 17, 500, 1 << 16])
+
+def test_streamed_positions_match_the_whole_source(small_windows, size):
+
+  expected = Lexer(SOURCE, max_errors=1000)
+
+  tokens = [(token.type, token.offset, token.line, token.column) for token in expected.iter_tokens()]
+
+  streamed = Lexer.from_chunks(chunked(size), max_errors=1000)
+
+  # Positions are looked up once all tokens are out, so every window is still
+
+  # in use
+
+  assert [(token.type, token.offset, token.line, token.column) for token in list(streamed.iter_tokens())] == tokens
+
+  assert streamed.errors == expected.errors
+
+def test_streamed_line_index_is_freed_behind_the_tokens(small_windows):
+
+  lexer = Lexer.from_chunks(chunked(100), max_errors=1000)
+
+  windows = set()
+
+  largest = 0
+
+  for token in lexer.iter_tokens():
+
+    windows.add(weakref.ref(token.line_index))
+
+    largest = max(largest, len(token.line_index.starts))
+
+    # A window made after the first covers at most its own lines and one
+
+    # chunk's
+
+    assert token.line == SOURCE.count('\n', 0, token.offset) + 1
+
+  gc.collect()
+
+  assert len(windows) > 10
+
+  assert largest <= 64 + 100 + 1
+
+  # Only the window the lexer still adds to is left
+
+  assert sum(window() is not None for window in windows) <= 1
@@ -0,0 +1,135 @@
+import io
+
+import random
+
+import pytest
+
+from gehu import analyze_code
+
+from gehu.compiler import compile_source
+
+from gehu.vm import VM
+
+def optimization(source):
+
+  result = analyze_code(source)
+
+  assert result['semantic_errors'] == []
+
+  return result['optimization']
+
+def output(source, optimize=True):
+
+  program, errors = compile_source(source, optimize=optimize)
+
+  assert errors == []
+
+  out = io.StringIO()
+
+  VM(out).run(program)
+
+  return out.getvalue()
+
+def test_an_assignment_used_as_a_value_keeps_that_value():
+
+  source = 'var b = 2; var c = 3; print(b = c);'
+
+  # Only b goes: print still reads c
+
+  assert optimization(source)['bindings_removed'] == 1
+
+  assert output(source) == '3\n'
+
+@pytest.mark.parametrize('source', [
+
+  'var b = 2; var c = 3; b = c;',
+
+  'var c = 3; for (var b = 0; 0; b = c) { }',
+
+])
+
+def test_values_assigned_only_for_effect_go_with_their_target(source):
+
+  assert optimization(source)['bindings_removed'] == 2
+
+  assert output(source) == ''
+
+def test_constants_are_folded_and_propagated():
+
+  stats = optimization('const k = 2; print(k * 3, "x");')
+
+  assert (stats['propagated'], stats['folded'], stats['bindings_removed']) == (1, 1, 1)
+
+  assert output('const k = 2; print(k * 3, "x");') == '6 x\n'
+
+def test_dead_branches_are_removed():
+
+  source = 'var x = 1; if (0) { print(x); } else { print(2); } while (0) { x = 3; }'
+
+  stats = optimization(source)
+
+  assert stats['branches_removed'] == 2
+
+  assert stats['bindings_removed'] == 1
+
+  assert output(source) == '2\n'
+
+def random_program(generator):
+
+  # Declarations, assignments (also inside expressions), prints and
+
+  # branches over a few vars, which the optimizer must not change the
+
+  # meaning of
+
+  names = []
+
+  statements = []
+
+  def expression(depth=0):
+
+    choice = generator.random()
+
+    if depth > 2 or choice < 0.35:
+
+      return generator.choice(names) if names and generator.random() < 0.6 else str(generator.randint(0, 9))
+
+    if choice < 0.55 and names:
+
+      return f'({generator.choice(names)} = {expression(depth + 1)})'
+
+    return f'({expression(depth + 1)} {generator.choice("+-*")} {expression(depth + 1)})'
+
+  for index in range(generator.randint(2, 8)):
+
+    choice = generator.random()
+
+    if choice < 0.4 or not names:
+
+      statements.append(f'var v{index} = {expression()};')
+
+      names.append(f'v{index}')
+
+    elif choice < 0.6:
+
+      statements.append(f'{generator.choice(names)} = {expression()};')
+
+    elif choice < 0.8:
+
+      statements.append(f'print({expression()});')
+
+    else:
+
+      statements.append(f'if ({generator.choice("01")}) {{ {expression()}; }}')
+
+  return ' '.join(statements)
+
+def test_optimized_programs_print_the_same():
+
+  generator = random.Random(16)
+
+  for _ in range(500):
+
+    source = random_program(generator)
+
+    assert output(source) == output(source, optimize=False), source
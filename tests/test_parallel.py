@@ -0,0 +1,91 @@
+import pytest
+
+import gehu
+
+from gehu import Lexer, analyze_code, analyze_file
+
+from gehu import parallel
+
+# Strings that run across lines, and so across splits, comments and
+
+# invalid characters
+
+SOURCE = ''.join(f'var s{i} = "line {i}\n# not a comment\n";  # note {i}\nprint(s{i} ! 2);\n' if i % 5 == 3 else f'var n{i} = {i} + 1; # "\nprint(n{i});\n' for i in range(60))
+
+@pytest.fixture(autouse=True)
+
+def small_ranges(monkeypatch):
+
+  # Splits every test source into many ranges
+
+  monkeypatch.setattr(parallel, 'MIN_CHUNK', 64)
+
+def columns(buffer):
+
+  return list(buffer.types), list(buffer.starts), list(buffer.lengths)
+
+@pytest.mark.parametrize('max_errors', [1, 3, 1000])
+
+@pytest.mark.parametrize('as_bytes', [False, True])
+
+def test_matches_the_serial_lexer(as_bytes, max_errors):
+
+  def lexer():
+
+    return Lexer.from_bytes(SOURCE.encode('ascii'), max_errors=max_errors) if as_bytes else Lexer(SOURCE, max_errors=max_errors)
+
+  serial = lexer()
+
+  expected = serial.tokenize_buffer()
+
+  split = lexer()
+
+  assert columns(split.tokenize_buffer(4)) == columns(expected)
+
+  assert split.errors == serial.errors
+
+def test_raises_like_the_serial_lexer():
+
+  with pytest.raises(Exception) as serial:
+
+    Lexer(SOURCE).tokenize_buffer()
+
+  with pytest.raises(Exception) as split:
+
+    Lexer(SOURCE).tokenize_buffer(4)
+
+  assert str(split.value) == str(serial.value)
+
+def test_analysis_lexes_in_parallel(monkeypatch, tmp_path):
+
+  path = tmp_path / 'program.g'
+
+  path.write_text(SOURCE)
+
+  expected = analyze_file(str(path))
+
+  calls = []
+
+  def counted(lexer, workers=None):
+
+    calls.append(workers)
+
+    return tokenize_parallel(lexer, workers)
+
+  tokenize_parallel = parallel.tokenize_parallel
+
+  monkeypatch.setattr(parallel, 'tokenize_parallel', counted)
+
+  monkeypatch.setattr(gehu, 'lex_workers', 2)
+
+  result = analyze_file(str(path))
+
+  assert calls == [2]
+
+  for key in ('lexical_errors', 'semantic_errors', 'symbol_table'):
+
+    assert result[key] == expected[key]
+
+  assert columns(result['tokens']) == columns(expected['tokens'])
+
+  assert analyze_code(SOURCE)['lexical_errors'] == expected['lexical_errors']
@@ -0,0 +1,219 @@
+import argparse
+
+import io
+
+import os
+
+import time
+
+import pytest
+
+import gehu
+
+from gehu.fakemodel import FakeModel, FakeResponse
+
+from gehu.streaming import ShellFeed, stream_response
+
+shell = pytest.mark.skipif(not ShellFeed.available(), reason='needs a POSIX shell')
+
+class Unfinished:
+
+  # A last chunk with no text, as a response ending with only its finish
+
+  # reason has
+
+  @property
+
+  def text(self):
+
+    raise ValueError('no text')
+
+def stream(model: FakeModel, on_text=None, strip: bool = True):
+
+  out = io.StringIO()
+
+  started = time.perf_counter()
+
+  text, first, total = stream_response(model.generate_content('Task: list files', stream=True), started, out, on_text, strip)
+
+  return text, out.getvalue(), first, total
+
+def test_chunks_are_written_as_they_arrive():
+
+  pieces = []
+
+  model = FakeModel(reply='echo {task}', first_delay=0.05, chunk_size=4, chunk_delay=0.05)
+
+  text, written, first, total = stream(model, pieces.append)
+
+  assert text == written == 'echo list files'
+
+  assert pieces == ['echo', ' lis', 't fi', 'les']
+
+  assert 0.05 <= first < total
+
+  # Three gaps between the four chunks
+
+  assert total - first >= 0.15
+
+def test_surrounding_whitespace_is_left_out():
+
+  model = FakeModel(reply='\n  echo a  \n  echo b \n\n', first_delay=0, chunk_size=3, chunk_delay=0)
+
+  pieces = []
+
+  text, written, _, _ = stream(model, pieces.append)
+
+  assert text == written == 'echo a  \n  echo b'
+
+  # Every piece still reaches on_text
+
+  assert ''.join(pieces) == model.reply
+
+  assert stream(model, strip=False)[1] == model.reply
+
+def test_chunks_without_text_are_skipped():
+
+  out = io.StringIO()
+
+  text, first, _ = stream_response([FakeResponse('echo hi'), Unfinished()], time.perf_counter(), out)
+
+  assert text == out.getvalue() == 'echo hi'
+
+  assert stream_response([Unfinished()], time.perf_counter(), out)[:2] == ('', None)
+
+@shell
+
+def test_first_line_runs_before_the_rest_arrives(tmp_path, capsys):
+
+  marker = tmp_path / 'started'
+
+  model = FakeModel(reply=f'touch {marker}\necho done', first_delay=0, chunk_size=len(f'touch {marker}\n'), chunk_delay=0)
+
+  feed = ShellFeed()
+
+  seen = []
+
+  def chunks():
+
+    for chunk in model.generate_content('Task: touch', stream=True):
+
+      if chunk.text.startswith('echo'):
+
+        # Wait for the first line to have run before sending the second
+
+        deadline = time.monotonic() + 5
+
+        while not marker.exists() and time.monotonic() < deadline:
+
+          time.sleep(0.01)
+
+        seen.append(marker.exists())
+
+      yield chunk
+
+  stream_response(chunks(), time.perf_counter(), io.StringIO(), feed.feed)
+
+  assert seen == [True]
+
+  assert feed.finish()
+
+  assert capsys.readouterr().out.strip() == 'done'
+
+@shell
+
+def test_a_last_line_without_newline_runs_at_finish(capsys):
+
+  feed = ShellFeed()
+
+  for piece in ['echo on', 'e\necho', ' two']:
+
+    feed.feed(piece)
+
+  assert feed.pending == 'echo two'
+
+  assert feed.finish()
+
+  assert capsys.readouterr().out.split() == ['one', 'two']
+
+@shell
+
+def test_the_exit_status_is_the_last_lines(capsys):
+
+  feed = ShellFeed()
+
+  feed.feed('echo one\nfalse\n')
+
+  assert not feed.finish()
+
+  assert capsys.readouterr().out.startswith('Error:')
+
+@shell
+
+def test_cancel_stops_lines_not_yet_run(tmp_path):
+
+  marker = tmp_path / 'never'
+
+  feed = ShellFeed()
+
+  feed.feed(f'sleep 5\ntouch {marker}\n')
+
+  started = time.monotonic()
+
+  feed.cancel()
+
+  assert time.monotonic() - started < 4
+
+  assert not marker.exists()
+
+class Broken(FakeModel):
+
+  # Stops with an error before the last line of its reply
+
+  def chunks(self, reply: str):
+
+    yield FakeResponse(reply.rsplit('\n', 1)[0] + '\n')
+
+    raise ConnectionError('stream reset')
+
+@pytest.fixture
+
+def command_args(tmp_path, monkeypatch):
+
+  monkeypatch.chdir(tmp_path)
+
+  monkeypatch.setattr(gehu, 'command_cache', None)
+
+  return argparse.Namespace(command='make files', run=True, format='text', quiet_tokens=False)
+
+@shell
+
+def test_handle_command_streams_and_runs(command_args, monkeypatch, capsys):
+
+  monkeypatch.setattr(gehu, '_model', FakeModel(reply='touch a\ntouch b\nls', first_delay=0, chunk_size=5, chunk_delay=0.01))
+
+  gehu.handle_command(command_args)
+
+  out, err = capsys.readouterr()
+
+  assert out.startswith('Generated command: touch a\ntouch b\nls\n')
+
+  assert 'a\nb\n' in out and 'Command executed successfully!' in out
+
+  assert 'first token' in err
+
+@shell
+
+def test_handle_command_does_not_finish_a_broken_command(command_args, monkeypatch, capsys):
+
+  monkeypatch.setattr(gehu, '_model', Broken(reply='sleep 0.5\ntouch late\necho end', first_delay=0, chunk_delay=0))
+
+  with pytest.raises(ConnectionError):
+
+    gehu.handle_command(command_args)
+
+  # Lines already received are not run either once the response breaks off
+
+  time.sleep(1)
+
+  assert not os.path.exists('late')
@@ -0,0 +1,189 @@
+import io
+
+import json
+
+import threading
+
+import time
+
+from gehu.commandcache import CommandCache
+
+from gehu.fakemodel import FakeModel
+
+from gehu.taskbatch import BatchGenerator, TokenBucket
+
+class StaggeredModel(FakeModel):
+
+  # Answers later tasks sooner, so results finish out of order
+
+  def generate_content(self, prompt: str, stream: bool = False):
+
+    number = int(prompt.rsplit('Task: task ', 1)[1].split()[0])
+
+    time.sleep(0.01 * (5 - number % 5))
+
+    return super().generate_content(prompt, stream)
+
+class Jitter:
+
+  # Records the range of each backoff wait and waits none of it
+
+  def __init__(self):
+
+    self.ranges = []
+
+  def uniform(self, low: float, high: float) -> float:
+
+    self.ranges.append((low, high))
+
+    return 0.0
+
+def run(generator: BatchGenerator, tasks, cache=None):
+
+  out = io.StringIO()
+
+  summary = generator.run(iter(tasks), out, cache)
+
+  records = [json.loads(line) for line in out.getvalue().splitlines()]
+
+  assert records[-1]['record'] == 'summary'
+
+  return records[:-1], summary
+
+def fake(**settings) -> FakeModel:
+
+  return FakeModel(**{'reply': 'echo {task}', 'first_delay': 0, 'chunk_delay': 0, **settings})
+
+def test_records_are_written_in_task_order():
+
+  tasks = [f'task {i}' for i in range(20)]
+
+  records, summary = run(BatchGenerator(StaggeredModel(reply='echo {task}', first_delay=0, chunk_delay=0), '/', concurrency=4, rate=1000), tasks)
+
+  assert [record['index'] for record in records] == list(range(20))
+
+  assert [record['command'] for record in records] == [f'echo {task}' for task in tasks]
+
+  assert summary['tasks'] == 20 and summary['failed'] == 0
+
+def test_repeated_tasks_are_generated_once():
+
+  model = fake()
+
+  records, summary = run(BatchGenerator(model, '/', concurrency=4, rate=1000), ['list files', 'show date', 'list  files', 'list files'])
+
+  assert model.calls == 2
+
+  assert [record.get('duplicate_of') for record in records] == [None, None, 0, 0]
+
+  assert records[3]['command'] == 'echo list files' and records[3]['attempts'] == 0
+
+  assert summary['duplicates'] == 2
+
+def test_cache_answers_tasks_it_has(tmp_path):
+
+  cache = CommandCache(str(tmp_path), similarity=1.0)
+
+  model = fake()
+
+  run(BatchGenerator(model, '/', rate=1000), ['list files', 'show date'], cache)
+
+  records, summary = run(BatchGenerator(model, '/', rate=1000), ['show date', 'list files', 'show date'], cache)
+
+  assert model.calls == 2
+
+  assert [record['cached'] for record in records] == [True, True, True]
+
+  assert summary['cached'] == 3
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+
+  bucket = TokenBucket(rate=50, capacity=5)
+
+  started = time.monotonic()
+
+  for _ in range(5):
+
+    bucket.acquire()
+
+  assert time.monotonic() - started < 0.05
+
+  for _ in range(10):
+
+    bucket.acquire()
+
+  # Ten more tokens at 50 per second
+
+  assert time.monotonic() - started >= 0.18
+
+def test_token_bucket_is_shared_by_threads():
+
+  bucket = TokenBucket(rate=100, capacity=1)
+
+  started = time.monotonic()
+
+  threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(4)]
+
+  for thread in threads:
+
+    thread.start()
+
+  for thread in threads:
+
+    thread.join()
+
+  # The first token was there already; 19 more at 100 per second
+
+  assert time.monotonic() - started >= 0.18
+
+def test_quota_errors_back_off_with_full_jitter():
+
+  generator = BatchGenerator(fake(quota_errors=1.0), '/', rate=1000, retries=4, backoff=1.0, max_backoff=5.0)
+
+  generator.random = jitter = Jitter()
+
+  record = generator.generate('list files')
+
+  assert record['attempts'] == 5
+
+  assert record['error'].startswith('QuotaExceeded')
+
+  # Waits of anything up to the doubling backoff, capped at max_backoff
+
+  assert jitter.ranges == [(0, 1.0), (0, 2.0), (0, 4.0), (0, 5.0)]
+
+def test_quota_errors_are_retried_until_they_pass():
+
+  model = fake(quota_errors=0.5, seed=3)
+
+  generator = BatchGenerator(model, '/', rate=1000, retries=50)
+
+  generator.random = Jitter()
+
+  records, summary = run(generator, [f'task {i}' for i in range(10)])
+
+  assert summary['failed'] == 0
+
+  assert summary['retries'] == model.calls - 10 > 0
+
+  assert sum(record['attempts'] for record in records) == model.calls
+
+def test_other_errors_are_not_retried():
+
+  class Broken:
+
+    calls = 0
+
+    def generate_content(self, prompt: str):
+
+      self.calls += 1
+
+      raise ValueError('bad request')
+
+  model = Broken()
+
+  record = BatchGenerator(model, '/', rate=1000).generate('list files')
+
+  assert model.calls == 1 and record['attempts'] == 1
+
+  assert record['error'] == 'ValueError: bad request'